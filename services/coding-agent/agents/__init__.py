@@ -1,7 +1,13 @@
-from .base import BaseAgent
+from .base import BaseAgent, format_context
+from .code_extractor import CodeExtractor, extract_code
 from .quick_executor import QuickExecutor
+from .summarizer import HistorySummarizer
 
 __all__ = [
     "BaseAgent",
+    "format_context",
+    "CodeExtractor",
+    "extract_code",
     "QuickExecutor",
+    "HistorySummarizer",
 ]
@@ -2,16 +2,49 @@
 Base agent class with common functionality
 """
 
-from anthropic import Anthropic
-from typing import Optional, AsyncIterator, Dict, Any
+from collections import deque
+from typing import Optional, AsyncIterator, Deque, Dict, Any, List, Tuple
+import asyncio
 import logging
+import time
 
 from schemas.responses import AgentMessage, MessageType, UsageStats
-from schemas.internal import NotebookContext
+from schemas.internal import NotebookContext, QueryRoute
 from core.config import get_settings
+from core.clients import get_client
+from core.tokens import estimate_tokens
+from core.output_budget import output_budget, record_output
+from core.rate_limit import Lease, RateLimitExceeded, get_rate_limiter
+from core import deadline
+from core.deadline import DeadlineExceeded
+from core.resilience import (
+    backoff_delay, count, first_token_tracker, hedge_delay, is_overloaded
+)
+from core.session_manager import VariableDiff
+from core.compression import compress_names, compress_traceback, compress_variables
 
 logger = logging.getLogger(__name__)
 
+# USD per million input and output tokens, by model name prefix; cache
+# writes cost 1.25x the input rate and cache reads 0.1x
+MODEL_PRICING: Dict[str, Tuple[float, float]] = {
+    "claude-3-5-haiku": (0.80, 4.0),
+    "claude-3-haiku": (0.25, 1.25),
+    "claude-opus-4": (15.0, 75.0),
+    "claude-sonnet-4": (3.0, 15.0),
+    "claude-3-7-sonnet": (3.0, 15.0),
+    "claude-3-5-sonnet": (3.0, 15.0),
+}
+DEFAULT_PRICING = MODEL_PRICING["claude-sonnet-4"]
+
+
+def model_pricing(model: str) -> Tuple[float, float]:
+    """Input and output rates for a model (Sonnet rates if unknown)"""
+    for prefix, rates in MODEL_PRICING.items():
+        if model.startswith(prefix):
+            return rates
+    return DEFAULT_PRICING
+
 
 class BaseAgent:
     """Base class for all agents"""
@@ -23,68 +56,154 @@ class BaseAgent:
         model: Optional[str] = None
     ):
         settings = get_settings()
-        self.client = Anthropic(api_key=api_key or settings.anthropic_api_key)
+        self.api_key = api_key or settings.anthropic_api_key
+        self.client = get_client(api_key)
         self.model = model or settings.default_model
         self.system_prompt = system_prompt
         self.max_tokens = settings.max_tokens_per_request
+        self.prompt_caching = settings.enable_prompt_caching
+        self.max_retries = settings.llm_max_retries
+        self.max_continuations = settings.max_continuations
+
+    def _system_blocks(self, system_context: Optional[str] = None) -> list:
+        """
+        System prompt as content blocks.
+
+        The system prompts are long constants, so with prompt caching enabled
+        the block is marked as a cache breakpoint and later calls read it from
+        the provider's prompt cache instead of reprocessing it. Prompts below
+        the model's minimum cacheable length are simply not cached.
+
+        Per-request `system_context` goes in a second block after the
+        breakpoint so it never invalidates the cached prefix.
+        """
+        block = {"type": "text", "text": self.system_prompt}
+        if self.prompt_caching:
+            block["cache_control"] = {"type": "ephemeral"}
+        blocks = [block]
+        if system_context:
+            blocks.append({"type": "text", "text": system_context})
+        return blocks
+
+    def _build_messages(
+        self,
+        history: Optional[List[Dict]],
+        user_message: str
+    ) -> List[Dict]:
+        """
+        Append the new user message to prior conversation turns.
+
+        With prompt caching, the last prior assistant turn becomes a second
+        cache breakpoint, so earlier turns (including the context snapshot
+        that later variable diffs refer to) are read from cache.
+        """
+        messages = [dict(message) for message in history or []]
+        if self.prompt_caching and messages and messages[-1]["role"] == "assistant":
+            messages[-1]["content"] = [{
+                "type": "text",
+                "text": messages[-1]["content"],
+                "cache_control": {"type": "ephemeral"}
+            }]
+        if messages and messages[-1]["role"] == "user":
+            messages[-1]["content"] += "\n\n" + user_message
+        else:
+            messages.append({"role": "user", "content": user_message})
+        return messages
 
     async def stream_response(
         self,
         messages: list,
+        system_context: Optional[str] = None,
+        model: Optional[str] = None,
+        route: Optional[QueryRoute] = None,
+        record: bool = True,
         **kwargs
     ) -> AsyncIterator[AgentMessage]:
         """
         Stream responses from Claude with proper message formatting.
 
+        Text is yielded as TEXT_DELTA messages as soon as it arrives, followed
+        by a single aggregated THINKING message and the USAGE stats.
+
+        With a `route`, max_tokens is the route's adaptive output budget. A
+        response cut off at max_tokens is continued (up to `max_continuations`
+        follow-up calls with the text so far as an assistant prefill), so the
+        deltas, THINKING and USAGE cover the whole answer.
+
         Args:
             messages: List of message dicts
+            system_context: Optional uncached text appended to the system prompt
+            model: Model to use instead of the agent's default
+            route: Route of the query, for its output budget
+            record: Whether to count the response's length towards the
+                route's budget (callers that may discard it record it
+                themselves, see `record_output`)
             **kwargs: Additional arguments for API call
 
         Yields:
             AgentMessage objects
         """
+        model = model or self.model
+        max_tokens = output_budget(route) if route is not None else self.max_tokens
+        limiter = get_rate_limiter(self.api_key, model)
+        text, stop_reason, usages = "", None, []
+        request = messages
         try:
-            # Use non-streaming for now (simpler and works)
-            # TODO: Implement proper streaming in future
-            response = self.client.messages.create(
-                model=self.model,
-                max_tokens=self.max_tokens,
-                system=self.system_prompt,
-                messages=messages,
-                **kwargs
-            )
+            for continuations in range(self.max_continuations + 1):
+                # Queue behind the per-key budget instead of bursting into 429s
+                lease = await limiter.acquire(
+                    self._estimate_input_tokens(request, system_context)
+                )
+                try:
+                    async for message in self._stream(
+                        request, system_context, lease,
+                        model=model, max_tokens=max_tokens, **kwargs
+                    ):
+                        if message.type == MessageType.THINKING:
+                            text += message.content
+                            stop_reason = message.metadata.get("stop_reason")
+                        elif message.type == MessageType.USAGE:
+                            usages.append(message.content)
+                        else:
+                            yield message
+                finally:
+                    limiter.release(lease)
 
-            # Extract text content
-            text_content = ""
-            for block in response.content:
-                if hasattr(block, 'text'):
-                    text_content += block.text
+                if stop_reason != "max_tokens" or continuations == self.max_continuations:
+                    break
+                logger.info(f"Response hit max_tokens={max_tokens}, continuing")
+                # The API rejects an assistant prefill ending in whitespace
+                request = messages + [{"role": "assistant", "content": text.rstrip()}]
 
-            # Yield the response as a single message
             yield AgentMessage(
                 type=MessageType.THINKING,
-                content=text_content,
-                metadata={"streaming": False}
+                content=text,
+                metadata={
+                    "streaming": True,
+                    "stop_reason": stop_reason,
+                    "continuations": continuations
+                }
             )
-
-            # Add usage stats if available
-            if response.usage:
-                usage = UsageStats(
-                    input_tokens=response.usage.input_tokens,
-                    output_tokens=response.usage.output_tokens,
-                    total_tokens=(
-                        response.usage.input_tokens +
-                        response.usage.output_tokens
-                    ),
-                    estimated_cost_usd=self._calculate_cost(response.usage)
-                )
-
+            if usages:
+                usage = _sum_usage(usages)
+                if route is not None and record:
+                    record_output(
+                        route,
+                        usage.output_tokens,
+                        continuations,
+                        stop_reason == "max_tokens"
+                    )
                 yield AgentMessage(
                     type=MessageType.USAGE,
                     content=usage.model_dump(),
                     metadata={}
                 )
-
+        except RateLimitExceeded as e:
+            yield AgentMessage(
+                type=MessageType.ERROR,
+                content={"error": str(e), "retry_after": e.retry_after},
+                metadata={}
+            )
         except Exception as e:
             logger.error(f"Error in response: {e}", exc_info=True)
             yield AgentMessage(
@@ -93,34 +212,358 @@ class BaseAgent:
                 metadata={}
             )
 
-    def _calculate_cost(self, usage) -> float:
+    async def _stream(
+        self,
+        messages: list,
+        system_context: Optional[str],
+        lease: Lease,
+        model: str,
+        max_tokens: int,
+        **kwargs
+    ) -> AsyncIterator[AgentMessage]:
+        """Run one admitted streaming call"""
+        params = dict(
+            model=model,
+            max_tokens=max_tokens,
+            system=self._system_blocks(system_context),
+            messages=messages,
+            **kwargs
+        )
+        attempt, (kind, value) = await self._start_stream(params, lease)
+        try:
+            while kind == "text":
+                yield AgentMessage(
+                    type=MessageType.TEXT_DELTA,
+                    content=value,
+                    metadata={"streaming": True}
+                )
+                kind, value = await attempt.next_event()
+            if kind == "error":
+                raise value
+            response = value
+        finally:
+            attempt.cancel()
+
+        # Extract text content
+        text_content = ""
+        for block in response.content:
+            if hasattr(block, 'text'):
+                text_content += block.text
+
+        # Yield the aggregated response once the stream is done
+        yield AgentMessage(
+            type=MessageType.THINKING,
+            content=text_content,
+            metadata={"streaming": True, "stop_reason": response.stop_reason}
+        )
+
+        # Add usage stats if available
+        if response.usage:
+            usage = self._usage_stats(response.usage, model)
+            lease.settle(usage.total_tokens - usage.cache_read_input_tokens)
+
+            yield AgentMessage(
+                type=MessageType.USAGE,
+                content=usage.model_dump(),
+                metadata={}
+            )
+
+    async def _start_stream(self, params: Dict, lease: Lease) -> Tuple["_Attempt", Tuple]:
+        """
+        Open a stream and wait for its first event.
+
+        If no token arrives within the hedge delay (a percentile of recent
+        first-token latencies), a duplicate request is sent when the rate
+        limiter has spare capacity, and whichever produces a token first is
+        kept. Overload errors before the first token are retried with
+        jittered backoff. Both respect the request deadline.
+
+        Returns:
+            The winning attempt and its first event
+        """
+        retries = 0
+        while True:
+            deadline.check()
+            attempts = [_Attempt(self.client, params)]
+            delay = hedge_delay(params["model"])
+            hedge_lease = None
+            try:
+                while True:
+                    wait = deadline.cap(delay if hedge_lease is None else None)
+                    attempt, event = await _first_event(attempts, wait)
+                    if attempt is None:
+                        deadline.check()
+                        hedge_lease = await lease.limiter.try_acquire(lease.reserved)
+                        if hedge_lease is not None:
+                            count("hedged")
+                            logger.info(f"No first token after {delay:.2f}s, hedging request")
+                            attempts.append(_Attempt(self.client, params))
+                        delay = None
+                        continue
+                    if event[0] == "error" and len(attempts) > 1:
+                        # The other attempt may still succeed
+                        attempts.remove(attempt)
+                        continue
+                    break
+
+                for other in attempts:
+                    if other is not attempt:
+                        other.cancel()
+                if event[0] == "error":
+                    raise event[1]
+                first_token_tracker(params["model"]).record(attempt.elapsed())
+                if attempt is not attempts[0]:
+                    count("hedge_wins")
+                return attempt, event
+
+            except DeadlineExceeded:
+                count("deadline_exceeded")
+                await _cancel_attempts(attempts)
+                raise
+            except Exception as e:
+                await _cancel_attempts(attempts)
+                wait = backoff_delay(retries, e)
+                left = deadline.remaining()
+                if (
+                    not is_overloaded(e)
+                    or retries >= self.max_retries
+                    or (left is not None and wait >= left)
+                ):
+                    raise
+                retries += 1
+                count("retries")
+                logger.warning(f"Provider overloaded ({e}), retry {retries} in {wait:.2f}s")
+                await asyncio.sleep(wait)
+            except BaseException:
+                # The caller went away (cancelled): stop the upstream requests
+                # rather than letting them generate to the end
+                await _cancel_attempts(attempts)
+                raise
+            finally:
+                if hedge_lease is not None:
+                    lease.limiter.release(hedge_lease)
+
+    def _estimate_input_tokens(
+        self,
+        messages: list,
+        system_context: Optional[str] = None
+    ) -> int:
+        """Rough prompt size, reserved against the token budget before a call"""
+        text = self.system_prompt + (system_context or "")
+        for message in messages:
+            text += str(message["content"])
+        return estimate_tokens(text)
+
+    def _usage_stats(self, usage, model: Optional[str] = None) -> UsageStats:
+        """Build UsageStats from an API usage object"""
+        # Cache fields are absent when prompt caching is off
+        cache_write = getattr(usage, "cache_creation_input_tokens", None) or 0
+        cache_read = getattr(usage, "cache_read_input_tokens", None) or 0
+        return UsageStats(
+            input_tokens=usage.input_tokens,
+            output_tokens=usage.output_tokens,
+            cache_creation_input_tokens=cache_write,
+            cache_read_input_tokens=cache_read,
+            total_tokens=(
+                usage.input_tokens +
+                cache_write +
+                cache_read +
+                usage.output_tokens
+            ),
+            estimated_cost_usd=self._calculate_cost(usage, model)
+        )
+
+    def _calculate_cost(self, usage, model: Optional[str] = None) -> float:
         """
         Calculate estimated cost based on token usage.
 
-        Rates for Claude Sonnet 4 (as of Oct 2024):
-        - Input: $3 per million tokens
-        - Output: $15 per million tokens
+        Args:
+            usage: API usage object
+            model: Model that produced it (default: the agent's model);
+                rates come from `MODEL_PRICING`
         """
-        input_cost = (usage.input_tokens / 1_000_000) * 3.0
-        output_cost = (usage.output_tokens / 1_000_000) * 15.0
-        return round(input_cost + output_cost, 6)
+        input_rate, output_rate = model_pricing(model or self.model)
+        cache_write = getattr(usage, "cache_creation_input_tokens", None) or 0
+        cache_read = getattr(usage, "cache_read_input_tokens", None) or 0
+        input_cost = (usage.input_tokens / 1_000_000) * input_rate
+        cache_cost = (
+            (cache_write / 1_000_000) * input_rate * 1.25 +
+            (cache_read / 1_000_000) * input_rate * 0.1
+        )
+        output_cost = (usage.output_tokens / 1_000_000) * output_rate
+        return round(input_cost + cache_cost + output_cost, 6)
 
-    def _format_context(self, context: NotebookContext) -> str:
+    def _format_context(
+        self,
+        context: NotebookContext,
+        diff: Optional[VariableDiff] = None,
+        query: Optional[str] = None,
+        token_budget: Optional[int] = None
+    ) -> str:
         """Format notebook context for inclusion in prompts"""
-        parts = []
+        return format_context(context, diff, query=query, token_budget=token_budget)
+
+
+def _sum_usage(usages: List[Dict]) -> UsageStats:
+    """Combine the usage of a response and its continuations"""
+    total = {field: 0 for field in UsageStats.model_fields}
+    for usage in usages:
+        for field, value in usage.items():
+            total[field] += value
+    total["estimated_cost_usd"] = round(total["estimated_cost_usd"], 6)
+    return UsageStats(**total)
+
+
+class _Attempt:
+    """One streaming request, pumped into a queue by a background task"""
+
+    def __init__(self, client, params: Dict):
+        self.queue: asyncio.Queue = asyncio.Queue()
+        # Events taken off the queue but not consumed, read before the queue
+        self.unread: Deque[Tuple] = deque()
+        self.started = time.monotonic()
+        self.task = asyncio.create_task(self._run(client, params))
+
+    async def _run(self, client, params: Dict):
+        timeout = deadline.remaining()
+        if timeout is not None:
+            params = {**params, "timeout": max(timeout, 0.0)}
+        try:
+            async with client.messages.stream(**params) as stream:
+                async for text in stream.text_stream:
+                    self.queue.put_nowait(("text", text))
+                self.queue.put_nowait(("final", await stream.get_final_message()))
+        except Exception as e:
+            self.queue.put_nowait(("error", e))
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    async def next_event(self) -> Tuple:
+        """Next ("text", str), ("final", Message) or ("error", exception)"""
+        if self.unread:
+            return self.unread.popleft()
+        try:
+            return await asyncio.wait_for(self.queue.get(), deadline.cap(None))
+        except asyncio.TimeoutError:
+            count("deadline_exceeded")
+            raise DeadlineExceeded("Request deadline exceeded while streaming")
+
+    def cancel(self):
+        self.task.cancel()
+
+
+async def _cancel_attempts(attempts: List[_Attempt]):
+    """Cancel attempts and wait until their requests are closed"""
+    for attempt in attempts:
+        attempt.cancel()
+    await asyncio.gather(*(a.task for a in attempts), return_exceptions=True)
+
+
+async def _first_event(attempts: List[_Attempt], timeout: Optional[float]) -> Tuple:
+    """
+    Wait for the first event from any attempt.
+
+    Returns:
+        (attempt, event), or (None, None) on timeout
+    """
+    for attempt in attempts:
+        if attempt.unread:
+            return attempt, attempt.unread.popleft()
+        if not attempt.queue.empty():
+            return attempt, attempt.queue.get_nowait()
 
-        if context.variables:
-            vars_list = "\n".join(
-                f"- {name}: {dtype}"
-                for name, dtype in context.variables.items()
+    getters = {asyncio.create_task(a.queue.get()): a for a in attempts}
+    try:
+        done, _ = await asyncio.wait(
+            getters,
+            timeout=timeout,
+            return_when=asyncio.FIRST_COMPLETED
+        )
+    finally:
+        for getter in getters:
+            if not getter.done():
+                getter.cancel()
+    if not done:
+        return None, None
+    # Prefer a token over an error when both arrived together; the other
+    # events stay with their attempts
+    results = [(getters[g], g.result()) for g in done]
+    results.sort(key=lambda item: item[1][0] == "error")
+    for attempt, event in results[1:]:
+        attempt.unread.append(event)
+    return results[0]
+
+
+def format_context(
+    context: NotebookContext,
+    diff: Optional[VariableDiff] = None,
+    query: Optional[str] = None,
+    token_budget: Optional[int] = None
+) -> str:
+    """
+    Format notebook context for inclusion in prompts.
+
+    With a non-full `diff`, only variables added, removed or retyped since
+    the model's last snapshot are listed; the snapshot itself is in an
+    earlier turn of the conversation.
+
+    With a `token_budget`, the error gets up to half of it and the variable
+    listing the rest (see core.compression); variables are ranked by
+    relevance to `query`.
+    """
+    parts = []
+
+    error = context.last_error
+    variables_budget = None
+    if token_budget is not None:
+        if error:
+            error = compress_traceback(error, token_budget // 2)
+            variables_budget = token_budget - estimate_tokens(error)
+        else:
+            variables_budget = token_budget
+
+    def listing(variables: Dict[str, str], prefix: str, share: float = 1.0) -> List[str]:
+        if variables_budget is None:
+            return [f"{prefix} {name}: {dtype}" for name, dtype in variables.items()]
+        budget = int(variables_budget * share)
+        return [
+            prefix + line[1:]
+            for line in compress_variables(variables, budget, query)
+        ]
+
+    if diff is not None and not diff.full:
+        if diff.is_empty:
+            parts.append(
+                f"Variables unchanged since the previous message "
+                f"(snapshot v{diff.version})."
             )
-            parts.append(f"Available variables:\n{vars_list}")
         else:
-            parts.append("No variables currently defined in notebook.")
+            # Added variables get half the budget, removals and retypes a quarter each
+            changes = listing(diff.added, "+", 0.5)
+            if diff.removed and variables_budget is not None:
+                removed = compress_names(list(diff.removed), variables_budget // 4)
+                changes.append(f"- removed: {removed}")
+            else:
+                changes += [f"- {name} (removed)" for name in diff.removed]
+            changes += listing(
+                {name: f"{old} -> {new}" for name, (old, new) in diff.changed.items()},
+                "~",
+                0.25
+            )
+            parts.append(
+                f"Variable changes since the previous message "
+                f"(snapshot v{diff.version}):\n" + "\n".join(changes)
+            )
+    elif context.variables:
+        vars_list = "\n".join(listing(context.variables, "-"))
+        parts.append(f"Available variables:\n{vars_list}")
+    else:
+        parts.append("No variables currently defined in notebook.")
 
-        if context.last_error:
-            parts.append(f"\nRecent error:\n```\n{context.last_error}\n```")
+    if error:
+        parts.append(f"\nRecent error:\n```\n{error}\n```")
 
-        parts.append(f"\nNotebook has {context.cell_count} cells.")
+    parts.append(f"\nNotebook has {context.cell_count} cells.")
 
-        return "\n\n".join(parts)
+    return "\n\n".join(parts)
@@ -0,0 +1,157 @@
+"""
+Unified-diff edits of notebook cells
+"""
+
+from typing import Dict, List, Optional, Tuple
+import re
+
+from schemas.internal import NotebookContext, QueryRoute
+from core.config import get_settings
+from core.tokens import estimate_tokens
+
+HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,\d+)? \+\d+(?:,\d+)? @@")
+DIFF_BLOCK = re.compile(r"```(?:diff|patch)[ \t]*\n(.*?)```", re.S)
+
+# Process-wide counters; token counts are estimates of the code in the
+# answer (diff vs. the full patched cell a rewrite would have produced)
+_patch_stats = {
+    "applied": 0,
+    "failed": 0,
+    "diff_tokens": 0,
+    "full_cell_tokens": 0,
+}
+
+
+class PatchError(ValueError):
+    """A diff that is malformed or does not match the cell"""
+
+
+def uses_cell_patch(route: Optional[QueryRoute], context: NotebookContext) -> bool:
+    """Whether a query is answered with a diff against the current cell"""
+    return (
+        route == QueryRoute.QUICK_FIX
+        and bool(context.current_cell_source)
+        and get_settings().enable_cell_patches
+    )
+
+
+def extract_diff(text: str) -> Optional[str]:
+    """The first ```diff block in a response, if any"""
+    match = DIFF_BLOCK.search(text)
+    return match.group(1) if match else None
+
+
+def parse_hunks(diff: str) -> List[Tuple[int, List[str], List[str]]]:
+    """
+    Parse a unified diff for a single file.
+
+    Line counts in hunk headers are ignored (models often get them wrong);
+    the hunk body is authoritative.
+
+    Returns:
+        (1-based start line, old lines, new lines) per hunk
+
+    Raises:
+        PatchError: If the diff is malformed or changes nothing
+    """
+    hunks = []
+    current = None
+    for line in diff.split("\n"):
+        match = HUNK_HEADER.match(line)
+        if match:
+            current = (int(match.group(1)), [], [])
+            hunks.append(current)
+            continue
+        if current is None:
+            # File headers and blank lines before the first hunk
+            if line.startswith(("--- ", "+++ ", "diff ", "index ")) or not line.strip():
+                continue
+            raise PatchError(f"Unexpected line before first hunk: {line!r}")
+
+        _, old, new = current
+        if line.startswith("\\"):
+            continue  # "\ No newline at end of file"
+        if line == "" or line.startswith(" "):
+            # Blank context lines often lose their leading space
+            old.append(line[1:])
+            new.append(line[1:])
+        elif line.startswith("-"):
+            old.append(line[1:])
+        elif line.startswith("+"):
+            new.append(line[1:])
+        else:
+            raise PatchError(f"Invalid diff line: {line!r}")
+
+    # A trailing newline leaves an empty pseudo context line
+    for _, old, new in hunks:
+        while old and new and old[-1] == new[-1] == "":
+            old.pop()
+            new.pop()
+
+    if not hunks:
+        raise PatchError("Diff has no hunks")
+    if all(old == new for _, old, new in hunks):
+        raise PatchError("Diff changes nothing")
+    return hunks
+
+
+def _locate(lines: List[str], old: List[str], expected: int, start: int) -> Optional[int]:
+    """Index at or after `start` where `old` matches, closest to `expected`"""
+    if not old:
+        return min(max(expected, start), len(lines))
+    wanted = [line.rstrip() for line in old]
+    matches = [
+        i for i in range(start, len(lines) - len(old) + 1)
+        if [line.rstrip() for line in lines[i:i + len(old)]] == wanted
+    ]
+    if not matches:
+        return None
+    return min(matches, key=lambda i: abs(i - expected))
+
+
+def apply_unified_diff(source: str, diff: str) -> str:
+    """
+    Apply a unified diff to a cell's source.
+
+    Each hunk's context and removed lines must appear in the cell, in order;
+    they are matched ignoring trailing whitespace, nearest to the line
+    number in the hunk header.
+
+    Raises:
+        PatchError: If the diff is malformed or does not apply
+    """
+    lines = source.split("\n")
+    result = []
+    position = 0
+    for start, old, new in parse_hunks(diff):
+        # "@@ -N,0" inserts after line N; otherwise N is the first old line
+        expected = start if not old else start - 1
+        index = _locate(lines, old, expected, position)
+        if index is None:
+            raise PatchError(f"Hunk at line {start} does not match the cell")
+        result.extend(lines[position:index])
+        result.extend(new)
+        position = index + len(old)
+    result.extend(lines[position:])
+    return "\n".join(result)
+
+
+def record_patch(diff: Optional[str], patched: Optional[str]):
+    """Record a patch attempt (`patched` is None if it failed)"""
+    if patched is None:
+        _patch_stats["failed"] += 1
+        return
+    _patch_stats["applied"] += 1
+    _patch_stats["diff_tokens"] += estimate_tokens(diff)
+    _patch_stats["full_cell_tokens"] += estimate_tokens(patched)
+
+
+def get_cell_patch_stats() -> Dict:
+    """Get process-wide cell patch statistics"""
+    applied = _patch_stats["applied"]
+    saved = _patch_stats["full_cell_tokens"] - _patch_stats["diff_tokens"]
+    return {
+        **_patch_stats,
+        "est_output_tokens_saved": saved,
+        "est_output_tokens_saved_per_fix": round(saved / applied, 1) if applied else None,
+    }
@@ -0,0 +1,125 @@
+"""
+Static checks for generated code before it reaches the notebook
+"""
+
+from typing import Dict, Iterable, List
+import ast
+import builtins
+
+from core.cascade import PARSE_FLAGS
+
+BUILTIN_NAMES = set(dir(builtins)) | {"__file__"}
+
+# Process-wide counters
+_code_check_stats = {
+    "blocks_checked": 0,
+    "blocks_failed": 0,
+    "name_warnings": 0,
+    "repaired": 0,
+    "unrepaired": 0,
+}
+
+
+def undefined_names(tree: ast.AST, known: Iterable[str]) -> List[str]:
+    """
+    Names read in `tree` that are never bound in it and are not in `known`
+    or builtins, in order of first use.
+
+    Scopes are not distinguished: a name bound anywhere in the block counts
+    as defined everywhere, which avoids false positives at the cost of
+    missing some real errors. A star import disables the check.
+    """
+    bound = set()
+    loaded = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            if isinstance(node.ctx, ast.Load):
+                loaded.append(node)
+            else:
+                bound.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            bound.add(node.name)
+        elif isinstance(node, ast.arg):
+            bound.add(node.arg)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                if alias.name == "*":
+                    return []
+                bound.add(alias.asname or alias.name.split(".")[0])
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            bound.add(node.name)
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            bound.update(node.names)
+        elif isinstance(node, (ast.MatchAs, ast.MatchStar)) and node.name:
+            bound.add(node.name)
+        elif isinstance(node, ast.MatchMapping) and node.rest:
+            bound.add(node.rest)
+
+    defined = bound | set(known) | BUILTIN_NAMES
+    loaded.sort(key=lambda node: (node.lineno, node.col_offset))
+    return list(dict.fromkeys(node.id for node in loaded if node.id not in defined))
+
+
+def check_code(source: str, variables: Dict[str, str]) -> List[str]:
+    """
+    Find problems that would make a code block fail before doing anything
+    useful: syntax errors and names that are not defined in the block, the
+    notebook namespace (`variables`) or builtins.
+
+    Returns:
+        Human-readable problems (empty if the block looks runnable)
+    """
+    _code_check_stats["blocks_checked"] += 1
+    try:
+        tree = compile(source, "<cell>", "exec", flags=PARSE_FLAGS)
+    except SyntaxError as e:
+        problems = [f"line {e.lineno}: SyntaxError: {e.msg}"]
+    else:
+        problems = [
+            f"NameError: name '{name}' is not defined"
+            for name in undefined_names(tree, variables)
+        ]
+    if is_blocking(problems):
+        _code_check_stats["blocks_failed"] += 1
+    elif problems:
+        _code_check_stats["name_warnings"] += 1
+    return problems
+
+
+def is_blocking(problems: List[str]) -> bool:
+    """
+    Whether a block with these problems should be held back for repair.
+
+    Only syntax errors are: clients do not always send module aliases and
+    other globals from earlier cells (`pd`, `np`) in `variables`, so an
+    undefined name may well exist in the kernel.
+    """
+    return any(not problem.startswith("NameError") for problem in problems)
+
+
+def repair_prompt(failed: List[tuple]) -> str:
+    """
+    Ask for corrected versions of failing blocks.
+
+    Args:
+        failed: (code, problems) pairs
+    """
+    parts = ["Some of the code in your answer will fail before it runs:"]
+    for number, (code, problems) in enumerate(failed, 1):
+        listed = "\n".join(f"- {problem}" for problem in problems)
+        parts.append(f"Block {number}:\n```python\n{code}\n```\nProblems:\n{listed}")
+    parts.append(
+        "Reply with one corrected ```python block per block above, in the same "
+        "order, and nothing else."
+    )
+    return "\n\n".join(parts)
+
+
+def record_repair(repaired: int, unrepaired: int):
+    _code_check_stats["repaired"] += repaired
+    _code_check_stats["unrepaired"] += unrepaired
+
+
+def get_code_check_stats() -> Dict:
+    """Get process-wide code check/repair statistics"""
+    return dict(_code_check_stats)
@@ -0,0 +1,135 @@
+"""
+Incremental extraction of fenced Python code blocks from streamed text
+"""
+
+from typing import AsyncIterator, List, Optional, Tuple
+import re
+
+from schemas.responses import AgentMessage, MessageType
+
+# Up to three spaces of indent, a run of 3+ backticks or tildes, an info string
+FENCE = re.compile(r"^( {0,3})(`{3,}|~{3,})[ \t]*([^\s`]*)[^`]*$")
+
+# Info strings (first word, lowercased) treated as Python; "" is an untagged block
+PYTHON_LANGUAGES = {"", "python", "py", "python3"}
+
+
+class CodeExtractor:
+    """
+    Streaming parser for fenced code blocks.
+
+    Text is fed in arbitrary chunks; each Python block is returned as soon
+    as the line closing it has arrived. Blocks in other languages are
+    tracked so their contents are not mistaken for fences, but not returned.
+    """
+
+    def __init__(self):
+        self._pending = ""
+        # (fence, indent, language) of the open block, if any
+        self._open: Optional[Tuple[str, int, str]] = None
+        self._lines: List[str] = []
+
+    def feed(self, text: str) -> List[str]:
+        """
+        Add streamed text.
+
+        Returns:
+            Python blocks closed by this text, in order
+        """
+        self._pending += text
+        *lines, self._pending = self._pending.split("\n")
+        blocks = []
+        for line in lines:
+            block = self._line(line)
+            if block is not None:
+                blocks.append(block)
+        return blocks
+
+    def close(self) -> Tuple[List[str], Optional[str]]:
+        """
+        End of stream.
+
+        Returns:
+            Tuple of (blocks closed by the last line, unterminated Python block)
+        """
+        blocks = []
+        if self._pending:
+            block = self._line(self._pending)
+            self._pending = ""
+            if block is not None:
+                blocks.append(block)
+
+        unterminated = None
+        if self._open is not None and self._open[2] in PYTHON_LANGUAGES and self._lines:
+            unterminated = "\n".join(self._lines)
+        self._open = None
+        self._lines = []
+        return blocks, unterminated
+
+    def _line(self, line: str) -> Optional[str]:
+        line = line.rstrip("\r")
+        match = FENCE.match(line)
+
+        if self._open is None:
+            if match:
+                indent, fence, info = match.groups()
+                self._open = (fence, len(indent), info.lower())
+                self._lines = []
+            return None
+
+        fence, indent, language = self._open
+        if (
+            match
+            and not match.group(3)
+            and match.group(2)[0] == fence[0]
+            and len(match.group(2)) >= len(fence)
+            and line.strip() == match.group(2)
+        ):
+            lines = self._lines
+            self._open = None
+            self._lines = []
+            if language in PYTHON_LANGUAGES and lines:
+                return "\n".join(lines)
+            return None
+
+        # Content lines lose up to the fence's indent
+        strip = min(indent, len(line) - len(line.lstrip(" ")))
+        self._lines.append(line[strip:])
+        return None
+
+
+async def extract_code(
+    stream: AsyncIterator[AgentMessage]
+) -> AsyncIterator[AgentMessage]:
+    """
+    Pass a response stream through, adding a CODE message after the
+    TEXT_DELTA that closes each fenced Python block.
+
+    A block left open when the response ends is emitted before the aggregated
+    THINKING message with `complete: False`.
+    """
+    extractor = CodeExtractor()
+    index = 0
+
+    def code(block: str, complete: bool = True) -> AgentMessage:
+        nonlocal index
+        message = AgentMessage(
+            type=MessageType.CODE,
+            content=block,
+            metadata={"language": "python", "index": index, "complete": complete}
+        )
+        index += 1
+        return message
+
+    async for message in stream:
+        if message.type == MessageType.THINKING:
+            blocks, unterminated = extractor.close()
+            for block in blocks:
+                yield code(block)
+            if unterminated is not None:
+                yield code(unterminated, complete=False)
+            extractor = CodeExtractor()
+        yield message
+        if message.type == MessageType.TEXT_DELTA:
+            for block in extractor.feed(message.content):
+                yield code(block)
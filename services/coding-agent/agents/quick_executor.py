@@ -2,13 +2,24 @@
 Quick executor agent for fast, simple queries
 """
 
-from typing import AsyncIterator
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 import logging
+import time
 
 from .base import BaseAgent
+from .code_extractor import CodeExtractor, extract_code
+from .code_check import check_code, is_blocking, record_repair, repair_prompt
+from .cell_patch import (
+    PatchError, apply_unified_diff, extract_diff, record_patch, uses_cell_patch
+)
 from schemas.responses import AgentMessage, MessageType
-from schemas.internal import NotebookContext
+from schemas.internal import NotebookContext, QueryRoute
 from prompts.system_prompts import QUICK_EXECUTOR_PROMPT
+from core.config import get_settings
+from core.cascade import (
+    CONFIDENCE_INSTRUCTION, check_draft, record_draft, uses_fast_model
+)
+from core.output_budget import record_output
 
 logger = logging.getLogger(__name__)
 
@@ -21,11 +32,91 @@ class QuickExecutor(BaseAgent):
             system_prompt=QUICK_EXECUTOR_PROMPT,
             **kwargs
         )
+        settings = get_settings()
+        self.fast_model = settings.cascade_fast_model
+        self.code_repair_attempts = (
+            settings.code_repair_attempts if settings.enable_code_repair else 0
+        )
+
+    def _prepare(
+        self,
+        query: str,
+        context: NotebookContext,
+        history: Optional[List[Dict]] = None,
+        summary: Optional[str] = None,
+        context_block: Optional[str] = None,
+        cell_source: Optional[str] = None
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Build the API messages and per-request system context for a query.
+
+        With `cell_source`, the model is asked for a unified diff against
+        that cell instead of rewritten code.
+        """
+        # Format context
+        if context_block is not None:
+            context_str = context_block
+        else:
+            context_str = self._format_context(context)
+
+        # Build messages
+        if cell_source is not None:
+            user_message = f"""{context_str}
+
+Current cell:
+```python
+{cell_source}
+```
+
+User request: {query}
+
+Fix the current cell with a unified diff in a ```diff block: @@ hunk headers, one or two
+unchanged context lines around each change, no other lines of the cell. Then briefly explain the fix."""
+        else:
+            user_message = f"""{context_str}
+
+User request: {query}
+
+Provide a quick, direct response. For code generation, output executable Python code.
+For fixes, identify the issue and provide the corrected code."""
+
+        messages = self._build_messages(history, user_message)
+
+        system_context = None
+        if summary:
+            system_context = f"Summary of earlier conversation:\n{summary}"
+        return messages, system_context
+
+    def request_params(
+        self,
+        query: str,
+        context: NotebookContext,
+        history: Optional[List[Dict]] = None,
+        summary: Optional[str] = None,
+        context_block: Optional[str] = None
+    ) -> Dict:
+        """
+        Full Messages API parameters for a query, for callers that submit the
+        request themselves (e.g. offline batches). Same prompt as `execute`.
+        """
+        messages, system_context = self._prepare(
+            query, context, history, summary, context_block
+        )
+        return {
+            "model": self.model,
+            "max_tokens": self.max_tokens,
+            "system": self._system_blocks(system_context),
+            "messages": messages,
+        }
 
     async def execute(
         self,
         query: str,
-        context: NotebookContext
+        context: NotebookContext,
+        history: Optional[List[Dict]] = None,
+        summary: Optional[str] = None,
+        context_block: Optional[str] = None,
+        route: Optional[QueryRoute] = None
     ) -> AsyncIterator[AgentMessage]:
         """
         Execute a quick query and stream results.
@@ -33,32 +124,74 @@ class QuickExecutor(BaseAgent):
         Args:
             query: User's query
             context: Notebook context
+            history: Prior conversation turns as API messages
+            summary: Running summary of turns older than `history`
+            context_block: Pre-rendered context (e.g. a variable diff)
+            route: Route of the query; sets the output budget, cheap routes
+                try the fast model first and quick fixes to
+                `context.current_cell_source` are answered with a diff
 
         Yields:
             AgentMessage objects
         """
         try:
-            # Format context
-            context_str = self._format_context(context)
+            cell_source = (
+                context.current_cell_source if uses_cell_patch(route, context) else None
+            )
+            messages, system_context = self._prepare(
+                query, context, history, summary, context_block, cell_source
+            )
 
-            # Build messages
-            user_message = f"""{context_str}
+            # Stream response
+            if uses_fast_model(route):
+                stream = self._cascade(route, messages, system_context)
+            else:
+                stream = self.stream_response(
+                    messages,
+                    system_context=system_context,
+                    route=route
+                )
+            # Code blocks are sent as CODE messages as soon as they close,
+            # unless a static check finds they cannot run; possibly undefined
+            # names are only reported, as `metadata.warnings`
+            answer = None
+            failed = []
+            code_blocks = 0
 
-User request: {query}
+            def held(message: AgentMessage) -> bool:
+                nonlocal code_blocks
+                if message.type != MessageType.CODE:
+                    return False
+                code_blocks += 1
+                if not self.code_repair_attempts:
+                    return False
+                problems = check_code(message.content, context.variables)
+                if not is_blocking(problems):
+                    if problems:
+                        message.metadata = {**message.metadata, "warnings": problems}
+                    return False
+                failed.append((message, problems))
+                return True
 
-Provide a quick, direct response. For code generation, output executable Python code.
-For fixes, identify the issue and provide the corrected code."""
+            async for message in extract_code(stream):
+                if held(message):
+                    continue
+                if message.type == MessageType.THINKING:
+                    answer = message.content
+                yield message
 
-            messages = [
-                {
-                    "role": "user",
-                    "content": user_message
-                }
-            ]
+            if cell_source is not None and answer is not None:
+                async for message in self._patch_cell(
+                    messages, system_context, answer, context, code_blocks
+                ):
+                    if not held(message):
+                        yield message
 
-            # Stream response
-            async for message in self.stream_response(messages):
-                yield message
+            if failed and answer is not None:
+                async for message in self._repair(
+                    messages, system_context, answer, failed, context
+                ):
+                    yield message
 
             # Send completion signal
             yield AgentMessage(
@@ -74,3 +207,221 @@ For fixes, identify the issue and provide the corrected code."""
                 content={"error": str(e)},
                 metadata={}
             )
+
+    async def _cascade(
+        self,
+        route: QueryRoute,
+        messages: List[Dict],
+        system_context: Optional[str]
+    ) -> AsyncIterator[AgentMessage]:
+        """
+        Draft with the fast model and keep the draft if it passes
+        `check_draft`, otherwise answer with the default model.
+
+        The draft is buffered rather than streamed so that a rejected draft
+        never reaches the client. Only the answer that is returned counts
+        towards the route's output budget.
+        """
+        draft_context = "\n\n".join(filter(None, [system_context, CONFIDENCE_INSTRUCTION]))
+        text, stop_reason, continuations, usage = "", None, 0, None
+        failed = None
+
+        start = time.monotonic()
+        async for message in self.stream_response(
+            messages,
+            system_context=draft_context,
+            model=self.fast_model,
+            route=route,
+            record=False
+        ):
+            if message.type == MessageType.THINKING:
+                text = message.content
+                stop_reason = message.metadata.get("stop_reason")
+                continuations = message.metadata.get("continuations", 0)
+            elif message.type == MessageType.USAGE:
+                usage = message
+            elif message.type == MessageType.ERROR:
+                failed = message.content.get("error")
+        draft_seconds = time.monotonic() - start
+
+        if failed is None:
+            accepted, reason, text = check_draft(text, stop_reason)
+        else:
+            accepted, reason = False, f"error ({failed})"
+
+        if accepted:
+            record_draft(route, True, draft_seconds)
+            if usage is not None:
+                record_output(route, usage.content["output_tokens"], continuations, False)
+            yield AgentMessage(
+                type=MessageType.TEXT_DELTA,
+                content=text,
+                metadata={"streaming": True}
+            )
+            yield AgentMessage(
+                type=MessageType.THINKING,
+                content=text,
+                metadata={
+                    "streaming": True,
+                    "stop_reason": stop_reason,
+                    "continuations": continuations,
+                    "model": self.fast_model
+                }
+            )
+            if usage is not None:
+                yield usage
+            return
+
+        logger.info(f"Escalating {route.value} from {self.fast_model}: {reason}")
+        if usage is not None:
+            usage.metadata = {"model": self.fast_model, "escalated": True}
+            yield usage
+
+        start = time.monotonic()
+        async for message in self.stream_response(
+            messages,
+            system_context=system_context,
+            route=route
+        ):
+            yield message
+        record_draft(route, False, draft_seconds, time.monotonic() - start)
+
+    async def _repair(
+        self,
+        messages: List[Dict],
+        system_context: Optional[str],
+        answer: str,
+        failed: List[Tuple[AgentMessage, List[str]]],
+        context: NotebookContext
+    ) -> AsyncIterator[AgentMessage]:
+        """
+        Ask for corrected versions of code blocks that failed `check_code`,
+        within the same request.
+
+        Repaired blocks are sent as CODE messages (with `repaired: True` and
+        the original block's index); blocks still failing after
+        `code_repair_attempts` are sent as generated, with their `problems`.
+        """
+        request = messages + [{"role": "assistant", "content": answer}]
+        repaired = 0
+
+        for attempt in range(self.code_repair_attempts):
+            logger.info(f"Repairing {len(failed)} code block(s), attempt {attempt + 1}")
+            request = request + [{
+                "role": "user",
+                "content": repair_prompt([(m.content, problems) for m, problems in failed])
+            }]
+            reply = None
+            async for message in self.stream_response(request, system_context=system_context):
+                if message.type == MessageType.THINKING:
+                    reply = message.content
+                elif message.type == MessageType.USAGE:
+                    message.metadata = {"repair": True}
+                    yield message
+                elif message.type == MessageType.ERROR:
+                    logger.warning(f"Code repair failed: {message.content.get('error')}")
+            if reply is None:
+                break
+
+            extractor = CodeExtractor()
+            blocks = extractor.feed(reply)
+            closed, unterminated = extractor.close()
+            blocks += closed + ([unterminated] if unterminated is not None else [])
+
+            still_failing = []
+            for i, (original, problems) in enumerate(failed):
+                if i >= len(blocks):
+                    still_failing.append((original, problems))
+                    continue
+                candidate = original.model_copy(update={"content": blocks[i]})
+                problems = check_code(blocks[i], context.variables)
+                if is_blocking(problems):
+                    still_failing.append((candidate, problems))
+                    continue
+                repaired += 1
+                candidate.metadata = {**original.metadata, "complete": True, "repaired": True}
+                if problems:
+                    candidate.metadata["warnings"] = problems
+                yield candidate
+
+            failed = still_failing
+            if not failed:
+                break
+            request = request + [{"role": "assistant", "content": reply}]
+
+        for original, problems in failed:
+            original.metadata = {**original.metadata, "problems": problems}
+            yield original
+        record_repair(repaired, len(failed))
+
+    async def _patch_cell(
+        self,
+        messages: List[Dict],
+        system_context: Optional[str],
+        answer: str,
+        context: NotebookContext,
+        index: int
+    ) -> AsyncIterator[AgentMessage]:
+        """
+        Apply the diff in `answer` to the current cell and send the patched
+        cell as a CODE message (`patched: True`, `cell` = its index).
+
+        If the diff is missing or does not apply, the full corrected cell is
+        requested instead, in the same request.
+        """
+        metadata = {
+            "language": "python",
+            "index": index,
+            "complete": True,
+            "cell": context.current_cell,
+        }
+        diff = extract_diff(answer)
+        try:
+            if diff is None:
+                raise PatchError("No ```diff block in the answer")
+            patched = apply_unified_diff(context.current_cell_source, diff)
+        except PatchError as e:
+            error = str(e)
+            record_patch(diff, None)
+            logger.info(f"Cell patch not applied ({error}), asking for the full cell")
+        else:
+            record_patch(diff, patched)
+            yield AgentMessage(
+                type=MessageType.CODE,
+                content=patched,
+                metadata={**metadata, "patched": True}
+            )
+            return
+
+        request = messages + [
+            {"role": "assistant", "content": answer},
+            {
+                "role": "user",
+                "content": (
+                    f"That diff cannot be applied to the cell ({error}). Reply with the "
+                    "complete corrected cell in one ```python block and nothing else."
+                )
+            },
+        ]
+        reply = None
+        async for message in self.stream_response(request, system_context=system_context):
+            if message.type == MessageType.THINKING:
+                reply = message.content
+            elif message.type == MessageType.USAGE:
+                message.metadata = {"patch_fallback": True}
+                yield message
+            elif message.type == MessageType.ERROR:
+                logger.warning(f"Full cell fallback failed: {message.content.get('error')}")
+        if reply is None:
+            return
+
+        extractor = CodeExtractor()
+        blocks = extractor.feed(reply)
+        closed, unterminated = extractor.close()
+        blocks += closed + ([unterminated] if unterminated is not None else [])
+        if blocks:
+            yield AgentMessage(
+                type=MessageType.CODE,
+                content=blocks[0],
+                metadata={**metadata, "patched": False}
+            )
@@ -0,0 +1,62 @@
+"""
+History summarizer agent for folding old turns into a running summary
+"""
+
+from typing import List, Optional
+import logging
+
+from .base import BaseAgent
+from core.config import get_settings
+from core.rate_limit import limited_create
+from prompts.system_prompts import HISTORY_SUMMARIZER_PROMPT
+
+logger = logging.getLogger(__name__)
+
+# Per-turn character cap so one long answer cannot blow up the request
+MAX_TURN_CHARS = 2000
+
+
+class HistorySummarizer(BaseAgent):
+    """Agent that compresses scrolled-out turns with the fast router model"""
+
+    def __init__(self, api_key: Optional[str] = None):
+        settings = get_settings()
+        super().__init__(
+            system_prompt=HISTORY_SUMMARIZER_PROMPT,
+            api_key=api_key,
+            model=settings.router_model
+        )
+        self.max_tokens = settings.history_summary_max_tokens
+
+    async def summarize(self, previous_summary: str, turns: List) -> str:
+        """
+        Fold conversation turns into the running summary.
+
+        Args:
+            previous_summary: Current summary (may be empty)
+            turns: ConversationTurn objects to fold in, oldest first
+
+        Returns:
+            Updated summary text
+        """
+        transcript = "\n\n".join(
+            f"{turn.role.capitalize()}: {turn.content[:MAX_TURN_CHARS]}"
+            for turn in turns
+        )
+        user_message = (
+            f"Current summary:\n{previous_summary or '(empty)'}\n\n"
+            f"Turns to fold in:\n{transcript}"
+        )
+
+        response = await limited_create(
+            self.client,
+            self.api_key,
+            model=self.model,
+            max_tokens=self.max_tokens,
+            system=self._system_blocks(),
+            messages=[{"role": "user", "content": user_message}]
+        )
+
+        return "".join(
+            block.text for block in response.content if hasattr(block, "text")
+        ).strip()
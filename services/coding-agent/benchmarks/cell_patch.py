@@ -0,0 +1,111 @@
+"""
+Output-token benchmark: unified diffs vs. full cell rewrites for quick fixes
+
+For a set of typical notebook fixes, compares the estimated output tokens of
+the code in a diff answer against rewriting the whole cell, and checks that
+each diff applies back to the fixed cell.
+
+Usage:
+    python -m benchmarks.cell_patch [--context-lines 1]
+"""
+
+from typing import List, Tuple
+import argparse
+import difflib
+
+from core.tokens import estimate_tokens
+from agents.cell_patch import apply_unified_diff
+
+PLOT_CELL = """import matplotlib.pyplot as plt
+import seaborn as sns
+
+fig, axes = plt.subplots(1, 2, figsize=(12, 5))
+sns.histplot(df["income"], bins=40, ax=axes[0])
+axes[0].set_title("Income distribution")
+sns.boxplot(data=df, x="education", y="income", ax=axes[1])
+axes[1].set_title("Income by education")
+axes[1].tick_params(axis="x", rotation=45)
+plt.tight_layout()
+plt.show()"""
+
+CLEANING_CELL = """df = raw.copy()
+df.columns = [c.strip().lower().replace(" ", "_") for c in df.columns]
+df["signup_date"] = pd.to_datetime(df["signup_date"])
+df["age"] = df["age"].fillna(df["age"].median())
+df = df[df["age"].between(18, 100)]
+df["income"] = df["income"].astype(float)
+df["region"] = df["region"].str.title()
+df = df.drop_duplicates(subset=["customer_id"])
+print(df.shape)"""
+
+MODEL_CELL = """from sklearn.model_selection import train_test_split
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import classification_report
+
+features = ["age", "income", "tenure_months", "support_tickets"]
+X = df[features]
+y = df["churned"]
+X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+model = LogisticRegression(max_iter=1000)
+model.fit(X_train, y_train)
+print(classification_report(y_test, model.predict(X_test)))"""
+
+# (name, broken cell, fixed cell)
+CASES: List[Tuple[str, str, str]] = [
+    (
+        "misspelled column",
+        PLOT_CELL.replace('x="education"', 'x="educaton"'),
+        PLOT_CELL,
+    ),
+    (
+        "missing import",
+        CLEANING_CELL,
+        "import pandas as pd\n" + CLEANING_CELL,
+    ),
+    (
+        "wrong keyword",
+        MODEL_CELL.replace("test_size=0.2", "test_ratio=0.2"),
+        MODEL_CELL,
+    ),
+    (
+        "two changes",
+        MODEL_CELL.replace("max_iter=1000", "max_iters=1000").replace('"churned"', '"churn"'),
+        MODEL_CELL,
+    ),
+]
+
+
+def make_diff(broken: str, fixed: str, context_lines: int) -> str:
+    """Unified diff body (hunks only) as the model is asked to write it"""
+    lines = difflib.unified_diff(
+        broken.split("\n"), fixed.split("\n"), lineterm="", n=context_lines
+    )
+    return "\n".join(line for line in lines if not line.startswith(("---", "+++")))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--context-lines", type=int, default=1)
+    args = parser.parse_args()
+
+    total_full = total_diff = 0
+    print(f"{'case':<20} {'full cell':>10} {'diff':>6} {'saved':>7}")
+    for name, broken, fixed in CASES:
+        diff = make_diff(broken, fixed, args.context_lines)
+        assert apply_unified_diff(broken, diff) == fixed, f"{name}: diff does not apply"
+
+        # Both answers are fenced; the explanation is the same either way
+        full = estimate_tokens(f"```python\n{fixed}\n```")
+        patch = estimate_tokens(f"```diff\n{diff}\n```")
+        total_full += full
+        total_diff += patch
+        print(f"{name:<20} {full:>10} {patch:>6} {(full - patch) / full:>7.0%}")
+
+    fixes = len(CASES)
+    print(f"\nper fix: {total_full / fixes:.0f} -> {total_diff / fixes:.0f} output tokens "
+          f"({(total_full - total_diff) / fixes:.0f} saved, "
+          f"{(total_full - total_diff) / total_full:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Memory benchmark: bytes per session for the compact session representation
+
+Compares the current slotted ConversationTurn / SessionState against the
+previous plain-dataclass layout (datetime timestamps, a metadata dict per
+turn, list-backed history).
+
+Usage:
+    python -m benchmarks.session_memory [--sessions 2000] [--turns 20]
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List
+import argparse
+import gc
+import tracemalloc
+
+from core.session_manager import SessionState
+
+
+@dataclass
+class LegacyTurn:
+    """ConversationTurn as it was before the compact representation"""
+    role: str
+    content: str
+    timestamp: datetime = field(default_factory=datetime.now)
+    metadata: Dict = field(default_factory=dict)
+
+
+@dataclass
+class LegacySession:
+    """SessionState as it was before the compact representation"""
+    session_id: str
+    notebook_id: str
+    conversation_history: List[LegacyTurn] = field(default_factory=list)
+    notebook_variables: Dict[str, str] = field(default_factory=dict)
+    last_activity: datetime = field(default_factory=datetime.now)
+
+    def add_turn(self, role: str, content: str, metadata: Dict = None):
+        self.conversation_history.append(
+            LegacyTurn(role=role, content=content, metadata=metadata or {})
+        )
+        self.last_activity = datetime.now()
+
+
+def build_sessions(factory, sessions: int, turns: int) -> list:
+    """Build sessions with alternating user/assistant turns"""
+    result = []
+    for s in range(sessions):
+        session = factory(session_id=f"session_{s}", notebook_id=f"nb_{s}")
+        for t in range(turns):
+            # Built from pieces so every session holds fresh role strings,
+            # the way roles arrive from request parsing
+            role = "".join(["us", "er"]) if t % 2 == 0 else "".join(["assis", "tant"])
+            metadata = {"route": "simple_code"} if role == "assistant" else None
+            session.add_turn(role, f"turn {t} of {s}: " + "x" * 200, metadata)
+        result.append(session)
+    return result
+
+
+def measure(factory, sessions: int, turns: int) -> int:
+    """Bytes allocated per session"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    built = build_sessions(factory, sessions, turns)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    allocated = sum(
+        stat.size_diff for stat in after.compare_to(before, "filename")
+    )
+    del built
+    return allocated // sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--turns", type=int, default=20)
+    args = parser.parse_args()
+
+    legacy = measure(LegacySession, args.sessions, args.turns)
+    compact = measure(SessionState, args.sessions, args.turns)
+    content = args.turns * len("turn 00 of 0000: " + "x" * 200)
+
+    print(f"{args.sessions} sessions x {args.turns} turns")
+    print(f"  legacy:  {legacy:>8,} bytes/session")
+    print(f"  compact: {compact:>8,} bytes/session")
+    print(f"  saved:   {legacy - compact:>8,} bytes/session "
+          f"({(legacy - compact) / legacy:.0%}); "
+          f"~{content:,} bytes of each session is message text")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,11 @@
 from .router import QueryRouter
-from .orchestrator import AgentOrchestrator
+from .orchestrator import AgentOrchestrator, get_orchestrator
 from .config import Settings, get_settings
 
 __all__ = [
     "QueryRouter",
     "AgentOrchestrator",
+    "get_orchestrator",
     "Settings",
     "get_settings",
 ]
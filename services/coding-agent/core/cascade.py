@@ -0,0 +1,134 @@
+"""
+Model cascade: a fast model drafts answers on cheap routes, the default model
+takes over when the draft fails a cheap check
+"""
+
+from collections import defaultdict
+from typing import Dict, Optional, Tuple
+import ast
+import re
+
+from schemas.internal import QueryRoute
+from agents.code_extractor import CodeExtractor
+from .config import get_settings
+
+# Appended (uncached) to the system prompt for drafts
+CONFIDENCE_INSTRUCTION = (
+    "After your answer, add a final line `Confidence: high` if you are sure "
+    "the answer is correct and complete, or `Confidence: low` otherwise."
+)
+
+CONFIDENCE_LINE = re.compile(r"^[ \t]*\**confidence:?\**[ \t]*(high|medium|low)\.?[ \t]*$", re.I | re.M)
+
+# Marimo cells may use top-level await
+PARSE_FLAGS = ast.PyCF_ONLY_AST | ast.PyCF_ALLOW_TOP_LEVEL_AWAIT
+
+
+def uses_fast_model(route: Optional[QueryRoute]) -> bool:
+    """Whether a route is answered by the cascade's fast model first"""
+    settings = get_settings()
+    if route is None or not settings.enable_model_cascade:
+        return False
+    routes = {r.strip() for r in settings.cascade_routes.split(",") if r.strip()}
+    return route.value in routes
+
+
+def check_draft(text: str, stop_reason: Optional[str]) -> Tuple[bool, str, str]:
+    """
+    Cheap acceptance check for a drafted answer.
+
+    The draft passes if it was not truncated, rates itself highly confident
+    and every Python code block in it parses.
+
+    Returns:
+        Tuple of (accepted, reason, text without the confidence line)
+    """
+    if stop_reason == "max_tokens":
+        return False, "truncated", text
+
+    ratings = list(CONFIDENCE_LINE.finditer(text))
+    if not ratings:
+        return False, "no confidence rating", text
+    last = ratings[-1]
+    cleaned = (text[:last.start()] + text[last.end():]).strip()
+    rating = last.group(1).lower()
+    if rating != "high":
+        return False, f"{rating} confidence", cleaned
+
+    extractor = CodeExtractor()
+    blocks = extractor.feed(cleaned)
+    closed, unterminated = extractor.close()
+    blocks += closed + ([unterminated] if unterminated is not None else [])
+    for block in blocks:
+        try:
+            compile(block, "<draft>", "exec", flags=PARSE_FLAGS)
+        except SyntaxError as e:
+            return False, f"code does not parse ({e.msg})", cleaned
+
+    return True, "accepted", cleaned
+
+
+# Per-route counters and latency sums
+_cascade_stats: Dict[str, Dict] = defaultdict(lambda: {
+    "drafts": 0,
+    "escalated": 0,
+    "draft_seconds": 0.0,
+    "escalated_seconds": 0.0,
+    "accepted_seconds": 0.0,
+})
+
+
+def record_draft(
+    route: QueryRoute,
+    accepted: bool,
+    draft_seconds: float,
+    default_seconds: Optional[float] = None
+):
+    """
+    Record one cascade run.
+
+    Args:
+        route: Route of the query
+        accepted: Whether the draft was kept
+        draft_seconds: Time spent on the fast model
+        default_seconds: Time spent on the default model after escalating
+    """
+    stats = _cascade_stats[route.value]
+    stats["drafts"] += 1
+    stats["draft_seconds"] += draft_seconds
+    if accepted:
+        stats["accepted_seconds"] += draft_seconds
+    else:
+        stats["escalated"] += 1
+        stats["escalated_seconds"] += default_seconds or 0.0
+
+
+def get_cascade_stats() -> Dict:
+    """
+    Per-route escalation rates and estimated latency saved.
+
+    Savings compare accepted drafts against the default model's latency on
+    escalated queries of the same route, minus the draft time wasted on
+    escalations.
+    """
+    report = {}
+    for route, stats in _cascade_stats.items():
+        drafts = stats["drafts"]
+        escalated = stats["escalated"]
+        accepted = drafts - escalated
+        avg_draft = stats["draft_seconds"] / drafts if drafts else None
+        avg_default = stats["escalated_seconds"] / escalated if escalated else None
+        avg_accepted = stats["accepted_seconds"] / accepted if accepted else None
+        saved = None
+        if avg_default is not None and avg_accepted is not None:
+            wasted = stats["draft_seconds"] - stats["accepted_seconds"]
+            saved = round((avg_default - avg_accepted) * accepted - wasted, 3)
+        report[route] = {
+            "drafts": drafts,
+            "escalated": escalated,
+            "escalation_rate": round(escalated / drafts, 4) if drafts else 0.0,
+            "avg_draft_seconds": round(avg_draft, 3) if avg_draft is not None else None,
+            "avg_default_seconds": round(avg_default, 3) if avg_default is not None else None,
+            "est_seconds_saved": saved,
+        }
+    return report
@@ -0,0 +1,119 @@
+"""
+Process-wide registry of pooled Anthropic clients
+"""
+
+from anthropic import AsyncAnthropic, DefaultAsyncHttpxClient, DEFAULT_TIMEOUT
+from collections import OrderedDict
+from typing import Dict, Optional
+import asyncio
+import logging
+import httpx
+
+from .config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+class ClientRegistry:
+    """
+    Shares AsyncAnthropic clients across requests.
+
+    All clients sit on one httpx connection pool, so keep-alive connections
+    are reused no matter which API key a request uses. The client for the
+    service key is pinned; clients for user-supplied keys are kept in an LRU
+    capped at `client_pool_max_keys`.
+    """
+
+    def __init__(self):
+        settings = get_settings()
+        self.max_user_clients = settings.client_pool_max_keys
+        self.warm_connections = settings.client_pool_warm_connections
+        self.http_client = DefaultAsyncHttpxClient(
+            timeout=DEFAULT_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=settings.client_pool_max_connections,
+                max_keepalive_connections=settings.client_pool_max_connections,
+                keepalive_expiry=settings.client_keepalive_seconds
+            )
+        )
+        self.default_api_key = settings.anthropic_api_key
+        self.default_client = self._build(self.default_api_key)
+        self.user_clients: "OrderedDict[str, AsyncAnthropic]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _build(self, api_key: str) -> AsyncAnthropic:
+        # Retries are deadline-aware and done by the callers (core.resilience)
+        return AsyncAnthropic(api_key=api_key, http_client=self.http_client, max_retries=0)
+
+    def get(self, api_key: Optional[str] = None) -> AsyncAnthropic:
+        """Get the shared client for an API key (service key if None)"""
+        if not api_key or api_key == self.default_api_key:
+            self.hits += 1
+            return self.default_client
+
+        client = self.user_clients.get(api_key)
+        if client is not None:
+            self.hits += 1
+            self.user_clients.move_to_end(api_key)
+            return client
+
+        self.misses += 1
+        client = self._build(api_key)
+        self.user_clients[api_key] = client
+        if len(self.user_clients) > self.max_user_clients:
+            # Evicted clients share the pool, so there is nothing to close
+            self.user_clients.popitem(last=False)
+            self.evictions += 1
+        return client
+
+    async def warm(self):
+        """Open keep-alive connections to the API before the first request"""
+        url = str(self.default_client.base_url)
+
+        async def _open():
+            # Any response (even a 404) leaves a TLS connection in the pool
+            await self.http_client.head(url)
+
+        results = await asyncio.gather(
+            *(_open() for _ in range(self.warm_connections)),
+            return_exceptions=True
+        )
+        failed = [r for r in results if isinstance(r, Exception)]
+        if failed:
+            logger.warning(f"Failed to warm {len(failed)} connection(s): {failed[0]}")
+        logger.info(
+            f"Warmed {len(results) - len(failed)} connection(s) to {url}"
+        )
+
+    async def aclose(self):
+        """Close the shared connection pool"""
+        await self.http_client.aclose()
+
+    def get_stats(self) -> Dict:
+        """Get registry statistics"""
+        return {
+            "user_clients": len(self.user_clients),
+            "max_user_clients": self.max_user_clients,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+# Global client registry instance
+_client_registry = None
+
+
+def get_client_registry() -> ClientRegistry:
+    """Get global client registry instance"""
+    global _client_registry
+    if _client_registry is None:
+        _client_registry = ClientRegistry()
+    return _client_registry
+
+
+def get_client(api_key: Optional[str] = None) -> AsyncAnthropic:
+    """Get a pooled AsyncAnthropic client for an API key"""
+    return get_client_registry().get(api_key)
@@ -0,0 +1,212 @@
+"""
+Token-budgeted compression of notebook context (tracebacks and variables)
+"""
+
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import re
+
+from schemas.internal import QueryRoute
+from .config import get_settings
+from .tokens import estimate_tokens
+
+FRAME_START = re.compile(r'^\s*File "')
+WORD = re.compile(r"[a-z0-9]+")
+
+# Single lines (e.g. a giant exception message) are clipped to this length
+MAX_LINE_CHARS = 400
+
+# Types most queries are about rank ahead of scalars and helpers
+RELEVANT_TYPES = ("DataFrame", "Series", "ndarray", "Tensor", "GeoDataFrame")
+
+
+def _clip_middle(text: str, max_chars: int) -> str:
+    """Keep the head and tail of a string"""
+    if len(text) <= max_chars:
+        return text
+    half = max(max_chars // 2 - 10, 1)
+    return f"{text[:half]} ...[{len(text) - 2 * half} chars]... {text[-half:]}"
+
+
+def _split_traceback(text: str) -> List[tuple]:
+    """
+    Split a traceback into ("frame", lines) and ("text", line) segments.
+
+    A frame is a `File "...", line N, in f` line plus the indented source and
+    caret lines that follow it.
+    """
+    segments = []
+    for line in text.splitlines():
+        if FRAME_START.match(line):
+            segments.append(("frame", [line]))
+        elif segments and segments[-1][0] == "frame" and line.startswith("    "):
+            segments[-1][1].append(line)
+        else:
+            segments.append(("text", _clip_middle(line, MAX_LINE_CHARS)))
+    return segments
+
+
+def _dedupe_frames(segments: List[tuple]) -> List[tuple]:
+    """Collapse runs of identical frames (e.g. deep recursion)"""
+    result = []
+    repeats = 0
+    for segment in segments:
+        if (
+            segment[0] == "frame" and result and result[-1][0] == "frame"
+            and result[-1][1] == segment[1]
+        ):
+            repeats += 1
+            continue
+        if repeats:
+            result.append(("text", f"  [Previous frame repeated {repeats} more times]"))
+            repeats = 0
+        result.append(segment)
+    if repeats:
+        result.append(("text", f"  [Previous frame repeated {repeats} more times]"))
+    return result
+
+
+def _render(segments: List[tuple]) -> str:
+    lines = []
+    for kind, value in segments:
+        if kind == "frame":
+            lines.extend(value)
+        else:
+            lines.append(value)
+    return "\n".join(lines)
+
+
+def compress_traceback(
+    text: str,
+    token_budget: int,
+    head_frames: int = 2,
+    tail_frames: int = 6
+) -> str:
+    """
+    Shrink a traceback to fit a token budget.
+
+    Repeated frames are collapsed first. If that is not enough, only the
+    first `head_frames` and last `tail_frames` frames are kept (fewer if
+    still over budget), along with every non-frame line, which holds the
+    exception type and message.
+    """
+    if estimate_tokens(text) <= token_budget:
+        return text
+
+    segments = _dedupe_frames(_split_traceback(text))
+    rendered = _render(segments)
+    if estimate_tokens(rendered) <= token_budget:
+        return rendered
+
+    frame_indexes = [i for i, (kind, _) in enumerate(segments) if kind == "frame"]
+    head, tail = head_frames, tail_frames
+    while True:
+        if len(frame_indexes) > head + tail:
+            dropped = set(frame_indexes[head:len(frame_indexes) - tail])
+            marker_at = frame_indexes[head]
+            kept = []
+            for i, segment in enumerate(segments):
+                if i == marker_at:
+                    kept.append(("text", f"  ... {len(dropped)} frames omitted ..."))
+                if i not in dropped:
+                    kept.append(segment)
+            rendered = _render(kept)
+        if estimate_tokens(rendered) <= token_budget or head + tail <= 1:
+            break
+        # Shed head frames first; the innermost frames locate the error
+        if head > 0:
+            head -= 1
+        else:
+            tail -= 1
+
+    if estimate_tokens(rendered) > token_budget:
+        rendered = _clip_middle(rendered, token_budget * 4)
+    return rendered
+
+
+def _relevance(name: str, dtype: str, query_words: set) -> tuple:
+    """Sort key: mentioned in the query, then data-like types (stable otherwise)"""
+    name_words = set(WORD.findall(name.lower()))
+    mentioned = name.lower() in query_words or bool(name_words & query_words)
+    data_like = any(t in dtype for t in RELEVANT_TYPES)
+    return (not mentioned, not data_like)
+
+
+def compress_variables(
+    variables: Dict[str, str],
+    token_budget: int,
+    query: Optional[str] = None
+) -> List[str]:
+    """
+    List variables within a token budget.
+
+    Variables are ranked by relevance to the query. The top-ranked ones are
+    listed as `name: dtype`; the rest are grouped by type, with name lists
+    shortened (or dropped) until the result fits.
+
+    Returns:
+        Lines describing the variables
+    """
+    full = [f"- {name}: {dtype}" for name, dtype in variables.items()]
+    if estimate_tokens("\n".join(full)) <= token_budget:
+        return full
+
+    query_words = set(WORD.findall((query or "").lower()))
+    ranked = sorted(
+        variables.items(),
+        key=lambda item: _relevance(item[0], item[1], query_words)
+    )
+
+    # Individually listed variables use up to half the budget
+    listed = []
+    used = 0
+    for name, dtype in ranked:
+        line = f"- {name}: {dtype}"
+        cost = estimate_tokens(line) + 1
+        if used + cost > token_budget // 2:
+            break
+        listed.append(line)
+        used += cost
+
+    by_type: "OrderedDict[str, List[str]]" = OrderedDict()
+    for name, dtype in ranked[len(listed):]:
+        by_type.setdefault(dtype, []).append(name)
+
+    # Shrink per-type name lists until the grouped summary fits
+    for names_per_type in (20, 8, 3, 0):
+        grouped = []
+        for dtype, names in by_type.items():
+            if names_per_type and len(names) > names_per_type:
+                shown = ", ".join(names[:names_per_type])
+                grouped.append(
+                    f"- {len(names)} more {dtype}: {shown}, ... "
+                    f"(+{len(names) - names_per_type})"
+                )
+            elif names_per_type:
+                grouped.append(f"- {dtype}: {', '.join(names)}")
+            else:
+                grouped.append(f"- {len(names)} more {dtype}")
+        if estimate_tokens("\n".join(listed + grouped)) <= token_budget:
+            break
+
+    return listed + grouped
+
+
+def compress_names(names: List[str], token_budget: int) -> str:
+    """Comma-join names, eliding the tail once over budget"""
+    text = ", ".join(names)
+    if estimate_tokens(text) <= token_budget:
+        return text
+    kept = []
+    used = 0
+    for name in names:
+        used += estimate_tokens(name) + 1
+        if used > token_budget:
+            break
+        kept.append(name)
+    return ", ".join(kept) + f", ... (+{len(names) - len(kept)} more)"
+
+
+def context_budget(route: QueryRoute) -> int:
+    """Token budget for the context block sent on a route"""
+    return getattr(get_settings(), f"context_budget_{route.value}")
@@ -19,6 +19,9 @@ class Settings(BaseSettings):
     anthropic_api_key: str
     default_model: str = "claude-sonnet-4-20250514"
     router_model: str = "claude-3-5-haiku-20241022"
+    router_confidence_threshold: float = 0.8
+    route_cache_max_entries: int = 2048
+    route_cache_ttl_seconds: float = 600.0
 
     # Service configuration
     service_host: str = "0.0.0.0"
@@ -33,9 +36,114 @@ class Settings(BaseSettings):
     enable_self_critique: bool = False
     max_tokens_per_request: int = 8000
     enable_usage_tracking: bool = True
+    enable_speculative_execution: bool = True
+    enable_prompt_caching: bool = True
+    enable_request_coalescing: bool = True
+
+    # Model cascade: cheap routes are drafted by a fast model and escalate
+    # to default_model when the draft fails its check
+    enable_model_cascade: bool = True
+    cascade_fast_model: str = "claude-3-5-haiku-20241022"
+    cascade_routes: str = "quick_fix,simple_code"  # Comma-separated routes
+
+    # Generated code is parsed and checked for undefined names; failing
+    # blocks get a repair call within the same request
+    enable_code_repair: bool = True
+    code_repair_attempts: int = 1
+
+    # quick_fix answers are a unified diff against context.current_cell_source,
+    # applied server-side
+    enable_cell_patches: bool = True
+
+    # Conversation history
+    history_token_budget: int = 4000
+    history_summary_max_tokens: int = 400
+
+    # Context compression (token budgets for the notebook context block)
+    context_budget_quick_fix: int = 1500
+    context_budget_simple_code: int = 1000
+    context_budget_complex_eda: int = 3000
+    context_budget_explain: int = 2000
+    context_budget_storytelling: int = 3000
+    router_context_budget: int = 300
+
+    # Output budgets (max_tokens per route until enough responses are seen,
+    # then the observed percentile length times headroom)
+    enable_adaptive_output_budget: bool = True
+    output_budget_quick_fix: int = 1024
+    output_budget_simple_code: int = 2048
+    output_budget_complex_eda: int = 8000
+    output_budget_explain: int = 2048
+    output_budget_storytelling: int = 8000
+    output_budget_percentile: float = 0.95
+    output_budget_headroom: float = 1.5
+    output_budget_min_tokens: int = 256
+    max_continuations: int = 2  # Follow-up calls when a response hits max_tokens
+
+    # Session limits
+    max_sessions: int = 1000
+    session_max_turns: int = 200
+    session_max_bytes: int = 256 * 1024 * 1024
+
+    # Session persistence ("memory" or "sqlite")
+    session_store_backend: str = "memory"
+    session_store_path: str = "sessions.db"
+    session_store_batch_size: int = 100
+    session_store_flush_interval_ms: int = 50
+
+    # Multi-worker session affinity (each worker runs on its own URL)
+    worker_url: str = ""
+    worker_urls: str = ""  # Comma-separated URLs of all workers
+    shard_mode: str = "forward"  # "forward" (proxy) or "redirect" (307)
+    shard_virtual_nodes: int = 100
+    # Shared secret for worker-to-worker requests and PUT /api/cluster/workers
+    # (which is disabled while empty), and extra hosts workers may live on
+    cluster_secret: str = ""
+    cluster_allowed_hosts: str = ""  # Comma-separated hostnames
+
+    # Client pool
+    client_pool_max_keys: int = 32
+    client_pool_max_connections: int = 100
+    client_pool_warm_connections: int = 2
+    client_keepalive_seconds: float = 60.0
+
+    # Client-side rate limits per (API key, model); 0 disables a limit
+    rate_limit_requests_per_minute: int = 0
+    rate_limit_tokens_per_minute: int = 0
+    rate_limit_max_concurrency: int = 0
+    rate_limit_max_wait_seconds: float = 30.0
+    rate_limit_max_queue: int = 256
+
+    # Batch endpoint
+    batch_max_concurrency: int = 16
+    batch_max_queries: int = 1000
+
+    # Offline batch jobs
+    offline_batch_poll_seconds: float = 30.0
+    offline_batch_max_requests: int = 10000
+
+    # Priority scheduling: concurrent executions and queue deadlines per class
+    # (interactive: quick_fix/simple_code, standard: explain,
+    # background: complex_eda/storytelling)
+    scheduler_max_concurrency: int = 64
+    scheduler_interactive_slots: int = 64
+    scheduler_standard_slots: int = 32
+    scheduler_background_slots: int = 8
+    scheduler_interactive_deadline_seconds: float = 30.0
+    scheduler_standard_deadline_seconds: float = 10.0
+    scheduler_background_deadline_seconds: float = 5.0
+
+    # Retries and hedging for LLM calls
+    llm_max_retries: int = 3
+    llm_retry_base_seconds: float = 0.5
+    llm_retry_max_seconds: float = 8.0
+    enable_hedging: bool = True
+    hedge_percentile: float = 0.95  # of recent time-to-first-token
+    hedge_initial_delay_seconds: float = 3.0
+    hedge_min_delay_seconds: float = 1.0
 
     # Timeouts
-    agent_timeout_seconds: int = 120
+    agent_timeout_seconds: int = 120  # End-to-end deadline per query
     tool_timeout_seconds: int = 30
 
 
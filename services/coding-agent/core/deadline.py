@@ -0,0 +1,72 @@
+"""
+Request deadlines propagated through routing and execution
+"""
+
+from contextlib import contextmanager
+from contextvars import Context, ContextVar, copy_context
+from typing import Iterator, Optional
+import time
+
+# Absolute deadline (time.monotonic) of the request being served, if any.
+# Tasks started while serving a request inherit it.
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """The request ran out of time"""
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float]) -> Iterator[None]:
+    """
+    Bound the enclosed work to `seconds` from now.
+
+    Nested scopes can only tighten an enclosing deadline.
+    """
+    if seconds is None:
+        yield
+        return
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        deadline = min(deadline, current)
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline (None if unbounded)"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def cap(seconds: Optional[float]) -> Optional[float]:
+    """Limit a timeout to the time left (either may be None)"""
+    left = remaining()
+    if left is None:
+        return seconds
+    if seconds is None:
+        return max(left, 0.0)
+    return max(min(seconds, left), 0.0)
+
+
+def check():
+    """
+    Raises:
+        DeadlineExceeded: If the current deadline has passed
+    """
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+
+
+def detached_context() -> Context:
+    """Copy of the current context without a deadline, for background tasks"""
+    context = copy_context()
+    context.run(_deadline.set, None)
+    return context
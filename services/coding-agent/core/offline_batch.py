@@ -0,0 +1,296 @@
+"""
+Offline bulk execution through the provider's message batch API
+"""
+
+from abc import ABC, abstractmethod
+from pathlib import Path
+from types import SimpleNamespace
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
+import itertools
+import json
+import logging
+import re
+import time
+import uuid
+
+from schemas.internal import NotebookContext
+from .tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Allowed custom_id format for batch requests
+CUSTOM_ID = re.compile(r"^[a-zA-Z0-9_-]{1,64}$")
+
+# Batch requests are billed at half the interactive rate
+BATCH_DISCOUNT = 0.5
+
+
+class BatchProvider(ABC):
+    """
+    Interface for asynchronous batch backends.
+
+    Requests are dicts with `custom_id` and `params` (Messages API
+    parameters). Results are dicts with `custom_id`, `status` ("succeeded",
+    "errored", "canceled" or "expired") and either `text` and `usage` or
+    `error`.
+    """
+
+    @abstractmethod
+    async def submit(self, requests: List[Dict]) -> str:
+        """Submit requests, returning the batch ID"""
+
+    @abstractmethod
+    async def is_done(self, batch_id: str) -> bool:
+        """Check whether a batch has finished processing"""
+
+    @abstractmethod
+    def results(self, batch_id: str) -> AsyncIterator[Dict]:
+        """Iterate over the results of a finished batch"""
+
+
+class AnthropicBatchProvider(BatchProvider):
+    """Message Batches API (`client.beta.messages.batches`)"""
+
+    def __init__(self, client):
+        self.client = client
+
+    async def submit(self, requests: List[Dict]) -> str:
+        batch = await self.client.beta.messages.batches.create(requests=requests)
+        return batch.id
+
+    async def is_done(self, batch_id: str) -> bool:
+        batch = await self.client.beta.messages.batches.retrieve(batch_id)
+        return batch.processing_status == "ended"
+
+    async def results(self, batch_id: str) -> AsyncIterator[Dict]:
+        async for entry in await self.client.beta.messages.batches.results(batch_id):
+            result = entry.result
+            if result.type == "succeeded":
+                message = result.message
+                yield {
+                    "custom_id": entry.custom_id,
+                    "status": "succeeded",
+                    "text": "".join(
+                        block.text for block in message.content if hasattr(block, "text")
+                    ),
+                    "stop_reason": message.stop_reason,
+                    "usage": message.usage.model_dump(),
+                }
+            else:
+                error = getattr(result, "error", None)
+                yield {
+                    "custom_id": entry.custom_id,
+                    "status": result.type,
+                    "error": str(error.model_dump() if error is not None else result.type),
+                }
+
+
+class StubBatchProvider(BatchProvider):
+    """
+    In-memory provider for running the pipeline without network access.
+
+    Each batch reports done after `polls_until_done` status checks. Every
+    request succeeds with a short echo of its last user message, unless its
+    custom_id is listed in `fail_ids`.
+    """
+
+    def __init__(self, polls_until_done: int = 1, fail_ids: Iterable[str] = ()):
+        self.polls_until_done = polls_until_done
+        self.fail_ids = set(fail_ids)
+        self.batches: Dict[str, List[Dict]] = {}
+        self._polls: Dict[str, int] = {}
+
+    async def submit(self, requests: List[Dict]) -> str:
+        batch_id = f"stub_{uuid.uuid4().hex[:12]}"
+        self.batches[batch_id] = list(requests)
+        self._polls[batch_id] = 0
+        return batch_id
+
+    async def is_done(self, batch_id: str) -> bool:
+        self._polls[batch_id] += 1
+        return self._polls[batch_id] >= self.polls_until_done
+
+    async def results(self, batch_id: str) -> AsyncIterator[Dict]:
+        for request in self.batches[batch_id]:
+            custom_id = request["custom_id"]
+            if custom_id in self.fail_ids:
+                yield {"custom_id": custom_id, "status": "errored", "error": "stub failure"}
+                continue
+            params = request["params"]
+            prompt = json.dumps(params["system"]) + json.dumps(params["messages"])
+            last = params["messages"][-1]["content"]
+            if not isinstance(last, str):
+                last = "".join(block.get("text", "") for block in last)
+            request_lines = [
+                line for line in last.splitlines() if line.startswith("User request:")
+            ]
+            text = f"[stub] {(request_lines or [''])[-1][:200]}"
+            yield {
+                "custom_id": custom_id,
+                "status": "succeeded",
+                "text": text,
+                "stop_reason": "end_turn",
+                "usage": {
+                    "input_tokens": estimate_tokens(prompt),
+                    "output_tokens": estimate_tokens(text),
+                },
+            }
+
+
+def load_items(path: Path) -> List[Dict]:
+    """
+    Read batch items from a JSONL file.
+
+    Each line has `query` and `context` (the request's notebook context) and
+    optionally `id`, `history` (prior API messages) and `summary`.
+    """
+    items = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                items.append(json.loads(line))
+    return items
+
+
+class OfflineBatchRunner:
+    """
+    Packs QuickExecutor prompts into batch submissions and collects results.
+
+    Items are split into batches of at most `chunk_size` requests. The IDs of
+    submitted batches are written to `manifest.json` in the output
+    directory before polling starts, so an interrupted job can be resumed
+    with `collect`. Results are appended to `results.jsonl`; results already
+    in the file are skipped, so collecting again does not duplicate them.
+    """
+
+    def __init__(
+        self,
+        provider: BatchProvider,
+        executor,
+        output_dir: Path,
+        poll_interval: float = 30.0,
+        chunk_size: int = 10000
+    ):
+        self.provider = provider
+        self.executor = executor
+        self.output_dir = Path(output_dir)
+        self.poll_interval = poll_interval
+        self.chunk_size = chunk_size
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.output_dir / "manifest.json"
+
+    @property
+    def results_path(self) -> Path:
+        return self.output_dir / "results.jsonl"
+
+    def build_requests(self, items: List[Dict]) -> List[Dict]:
+        """Turn items into batch requests with the interactive prompt"""
+        requests = []
+        seen = set()
+        for index, item in enumerate(items):
+            custom_id = str(item.get("id") or f"item-{index}")
+            if not CUSTOM_ID.match(custom_id) or custom_id in seen:
+                raise ValueError(f"Invalid or duplicate item id: {custom_id!r}")
+            seen.add(custom_id)
+            context = NotebookContext(**item["context"])
+            requests.append({
+                "custom_id": custom_id,
+                "params": self.executor.request_params(
+                    item["query"],
+                    context,
+                    history=item.get("history"),
+                    summary=item.get("summary")
+                ),
+            })
+        return requests
+
+    async def submit(self, items: List[Dict]) -> List[str]:
+        """Submit all items, recording each batch in the manifest"""
+        requests = self.build_requests(items)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        batch_ids = []
+        iterator = iter(requests)
+        while True:
+            chunk = list(itertools.islice(iterator, self.chunk_size))
+            if not chunk:
+                break
+            batch_id = await self.provider.submit(chunk)
+            logger.info(f"Submitted batch {batch_id} with {len(chunk)} requests")
+            batch_ids.append(batch_id)
+            self.manifest_path.write_text(json.dumps({
+                "batch_ids": batch_ids,
+                "requests": len(requests),
+                "submitted_at": time.time(),
+            }, indent=2))
+        return batch_ids
+
+    async def collect(self, batch_ids: Optional[List[str]] = None) -> Dict:
+        """
+        Poll batches until they end and write their results.
+
+        Args:
+            batch_ids: Batches to collect (default: those in the manifest)
+
+        Returns:
+            Counts of results by status, plus estimated cost
+        """
+        if batch_ids is None:
+            batch_ids = json.loads(self.manifest_path.read_text())["batch_ids"]
+
+        pending = list(batch_ids)
+        summary: Dict = {"estimated_cost_usd": 0.0}
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        written = self._written()
+        with open(self.results_path, "a") as out:
+            while pending:
+                for batch_id in list(pending):
+                    if not await self.provider.is_done(batch_id):
+                        continue
+                    async for result in self.provider.results(batch_id):
+                        if (batch_id, result["custom_id"]) in written:
+                            summary["already_collected"] = summary.get("already_collected", 0) + 1
+                            continue
+                        result["batch_id"] = batch_id
+                        if "usage" in result:
+                            result["estimated_cost_usd"] = self._cost(result["usage"])
+                            summary["estimated_cost_usd"] += result["estimated_cost_usd"]
+                        summary[result["status"]] = summary.get(result["status"], 0) + 1
+                        out.write(json.dumps(result) + "\n")
+                    out.flush()
+                    pending.remove(batch_id)
+                    logger.info(f"Collected batch {batch_id}")
+                if pending:
+                    await asyncio.sleep(self.poll_interval)
+
+        summary["estimated_cost_usd"] = round(summary["estimated_cost_usd"], 6)
+        return summary
+
+    async def run(self, items: List[Dict]) -> Dict:
+        """Submit items, wait for all batches and write results"""
+        return await self.collect(await self.submit(items))
+
+    def _written(self) -> Set[Tuple[str, str]]:
+        """(batch ID, custom_id) of results already in the results file"""
+        if not self.results_path.exists():
+            return set()
+        written = set()
+        with open(self.results_path) as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Partial line from an interrupted write
+                written.add((result.get("batch_id"), result.get("custom_id")))
+        return written
+
+    def _cost(self, usage: Dict) -> float:
+        fields = (
+            "input_tokens", "output_tokens",
+            "cache_creation_input_tokens", "cache_read_input_tokens",
+        )
+        usage = SimpleNamespace(**{name: usage.get(name) or 0 for name in fields})
+        cost = self.executor._calculate_cost(usage, self.executor.model)
+        return round(cost * BATCH_DISCOUNT, 6)
@@ -2,17 +2,29 @@
 Agent orchestrator - coordinates routing and execution
 """
 
-from typing import AsyncIterator, Optional
+from typing import AsyncIterator, Optional, Tuple
+import asyncio
 import logging
 
-from schemas.responses import AgentMessage
+from schemas.responses import AgentMessage, MessageType
 from schemas.internal import NotebookContext, QueryRoute
 from .router import QueryRouter
 from .session_manager import get_session_manager
-from agents import QuickExecutor
+from .compression import context_budget
+from .singleflight import get_singleflight, request_key
+from .scheduler import BACKGROUND, LoadShed, get_scheduler
+from .config import get_settings
+from . import deadline
+from agents import QuickExecutor, HistorySummarizer, format_context
 
 logger = logging.getLogger(__name__)
 
+# Marks the end of a speculative executor stream
+_DONE = object()
+
+# Process-wide speculation counters (orchestrators for user keys are transient)
+_speculation_stats = {"kept": 0, "cancelled": 0}
+
 
 class AgentOrchestrator:
     """Coordinates query routing and agent execution"""
@@ -20,18 +32,140 @@ class AgentOrchestrator:
     def __init__(self, api_key: Optional[str] = None):
         self.router = QueryRouter(api_key=api_key)
         self.quick_executor = QuickExecutor(api_key=api_key)
+        self.summarizer = HistorySummarizer(api_key=api_key)
         self.session_manager = get_session_manager()
+        self.scheduler = get_scheduler()
+        settings = get_settings()
+        self.api_key = api_key or settings.anthropic_api_key
+        self.speculative = settings.enable_speculative_execution
+        self.coalesce = settings.enable_request_coalescing
+        self.history_token_budget = settings.history_token_budget
+        self._background_tasks = set()
         # TODO: Add other agents in Phase 2+
         # self.planner = Planner(api_key=api_key)
         # self.executor = Executor(api_key=api_key)
         # self.critic = Critic(api_key=api_key)
         # self.storyteller = Storyteller(api_key=api_key)
 
+    def _executor_for(self, route: QueryRoute) -> QuickExecutor:
+        """
+        Get the agent that handles a route.
+
+        Phase 1: Only quick_executor for all routes
+        Phase 2+: Add specialized routes
+        """
+        # TODO: Phase 2 - Planner for COMPLEX_EDA, explainer for EXPLAIN
+        # TODO: Phase 4 - Storyteller for STORYTELLING
+        return self.quick_executor
+
+    async def _speculate(
+        self,
+        query: str,
+        context: NotebookContext,
+        **execute_kwargs
+    ) -> Tuple[QueryRoute, AsyncIterator[AgentMessage]]:
+        """
+        Run the router and the most likely executor concurrently.
+
+        The executor for the heuristic route starts immediately and its
+        messages are buffered. If the router agrees on the route the buffered
+        stream is kept, so router latency is off the critical path; otherwise
+        the speculative run is cancelled and the right executor starts from
+        scratch. The route, not just the executor, must match: it also
+        decides the model, output budget and response mode (e.g. cell
+        patches).
+
+        Returns:
+            The classified route and the message stream to forward
+        """
+        predicted = self.router.classify_heuristic(query, context)
+        speculative = self._executor_for(predicted)
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def pump():
+            try:
+                async for message in speculative.execute(
+                    query, context, route=predicted, **execute_kwargs
+                ):
+                    await queue.put(message)
+            except Exception as e:
+                await queue.put(e)
+            finally:
+                await queue.put(_DONE)
+
+        task = asyncio.create_task(pump())
+
+        try:
+            route = await self.router.classify(query, context)
+        except BaseException:
+            task.cancel()
+            raise
+
+        if route != predicted:
+            task.cancel()
+            _speculation_stats["cancelled"] += 1
+            logger.info(
+                f"Speculated {predicted.value} but routed to {route.value}, "
+                "restarting executor"
+            )
+            return route, self._executor_for(route).execute(
+                query, context, route=route, **execute_kwargs
+            )
+
+        _speculation_stats["kept"] += 1
+
+        async def drain():
+            try:
+                while True:
+                    item = await queue.get()
+                    if item is _DONE:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    yield item
+            finally:
+                # Stop the executor if the consumer goes away early
+                task.cancel()
+
+        return route, drain()
+
+    def _schedule_summary(self, session, upto: int):
+        """Fold turns before `upto` into the session summary in the background"""
+        if session.summarizing or upto <= session.summarized_turns:
+            return
+
+        async def fold():
+            try:
+                turns = session.turns_between(session.summarized_turns, upto)
+                summary = await self.summarizer.summarize(session.summary, turns)
+                self.session_manager.apply_summary(session.session_id, summary, upto)
+                logger.info(
+                    f"Folded {len(turns)} turns into summary for "
+                    f"session {session.session_id}"
+                )
+            except Exception as e:
+                # The turns stay unsummarized and are retried next request
+                logger.error(f"Error summarizing history: {e}", exc_info=True)
+
+        def done(task: asyncio.Task):
+            # Also runs if the task is cancelled before it starts
+            session.summarizing = False
+            self._background_tasks.discard(task)
+
+        # Mark the session before the task starts, so requests arriving
+        # in the meantime do not schedule a second summary
+        session.summarizing = True
+        # Summaries outlive the request, so they do not inherit its deadline
+        task = asyncio.create_task(fold(), context=deadline.detached_context())
+        self._background_tasks.add(task)
+        task.add_done_callback(done)
+
     async def handle_query(
         self,
         query: str,
         context: NotebookContext,
-        require_high_quality: bool = False
+        require_high_quality: bool = False,
+        batch: bool = False
     ) -> AsyncIterator[AgentMessage]:
         """
         Main entry point - routes query and coordinates agent execution.
@@ -40,19 +174,94 @@ class AgentOrchestrator:
             query: User's query
             context: Notebook context
             require_high_quality: Whether to use self-critique (Phase 3)
+            batch: Whether the query is part of a batch; batch queries are
+                admitted in the background class and wait for a slot
+                instead of being shed, so they never crowd out interactive
+                requests
 
         Yields:
             AgentMessage objects
         """
+        if not self.coalesce:
+            async for message in self._handle_query(
+                query, context, require_high_quality, batch
+            ):
+                yield message
+            return
+
+        # Identical concurrent requests (double submits, client retries)
+        # share one routing and execution pass
+        key = request_key(self.api_key, query, context, require_high_quality)
+        async for message in get_singleflight().run(
+            key,
+            lambda: self._handle_query(query, context, require_high_quality, batch)
+        ):
+            yield message
+
+    async def _handle_query(
+        self,
+        query: str,
+        context: NotebookContext,
+        require_high_quality: bool,
+        batch: bool = False
+    ) -> AsyncIterator[AgentMessage]:
+        """Route and execute one query, recording it in the session"""
+        # Admit by the likely route's priority before touching the session,
+        # so a shed request leaves nothing in history
+        predicted = self.router.classify_heuristic(query, context)
+        try:
+            ticket = await self.scheduler.acquire(
+                predicted,
+                priority=BACKGROUND if batch else None,
+                shed=not batch
+            )
+        except LoadShed as e:
+            yield AgentMessage(
+                type=MessageType.ERROR,
+                content={"error": str(e), "retry_after": e.retry_after},
+                metadata={"shed": True}
+            )
+            return
+
         try:
             # Get or create session
-            session = self.session_manager.get_or_create_session(
+            session = await self.session_manager.get_or_create_session(
                 context.session_id,
                 context.notebook_id
             )
 
-            # Add user query to conversation history
-            self.session_manager.add_user_message(context.session_id, query)
+            # Prior turns that fit the history budget (older ones are summarized)
+            window = session.get_history_window(self.history_token_budget)
+
+            # Send only variable changes while the last full snapshot is
+            # still in the history window
+            diff = session.diff_variables(
+                context.variables,
+                window.fold_upto,
+                full_refresh=context.full_context_refresh
+            )
+            # Size the context block for the likely route (routing itself
+            # may not have finished yet when speculating)
+            context_block = format_context(
+                context,
+                diff,
+                query=query,
+                token_budget=context_budget(predicted)
+            )
+            session.mark_context_sent(context.variables, diff, session.total_turns)
+
+            execute_kwargs = {
+                "history": window.messages,
+                "summary": window.summary,
+                "context_block": context_block,
+            }
+
+            # Add user query (and the context sent with it) to history
+            self.session_manager.add_user_message(
+                context.session_id,
+                query,
+                metadata={"context": context_block}
+            )
 
             # Update session with current notebook variables
             self.session_manager.update_notebook_state(
@@ -60,59 +269,32 @@ class AgentOrchestrator:
                 context.variables
             )
 
-            # Classify the query
-            route = await self.router.classify(query, context)
+            # Classify the query and pick its executor. In speculative mode
+            # the likely executor is already running while the router works.
+            if self.speculative:
+                route, stream = await self._speculate(
+                    query, context, **execute_kwargs
+                )
+            else:
+                route = await self.router.classify(query, context)
+                stream = self._executor_for(route).execute(
+                    query, context, route=route, **execute_kwargs
+                )
 
             logger.info(f"Routing query to: {route.value}")
-
-            # Route to appropriate handler
-            # Phase 1: Only quick_executor for all routes
-            # Phase 2+: Add specialized routes
+            if route in (QueryRoute.COMPLEX_EDA, QueryRoute.STORYTELLING):
+                logger.warning(
+                    f"{route.value} agent not implemented yet, "
+                    "using quick executor"
+                )
 
             # Collect assistant response for history
             assistant_response = ""
 
-            if route == QueryRoute.QUICK_FIX:
-                async for message in self.quick_executor.execute(query, context):
-                    if message.type.value == "thinking":
-                        assistant_response += message.content
-                    yield message
-
-            elif route == QueryRoute.SIMPLE_CODE:
-                async for message in self.quick_executor.execute(query, context):
-                    if message.type.value == "thinking":
-                        assistant_response += message.content
-                    yield message
-
-            elif route == QueryRoute.COMPLEX_EDA:
-                # TODO: Phase 2 - Add planning workflow
-                # For now, fall back to quick executor
-                logger.warning(
-                    "Complex EDA detected but planner not implemented yet, "
-                    "using quick executor"
-                )
-                async for message in self.quick_executor.execute(query, context):
-                    if message.type.value == "thinking":
-                        assistant_response += message.content
-                    yield message
-
-            elif route == QueryRoute.EXPLAIN:
-                # TODO: Phase 2 - Add explainer agent
-                async for message in self.quick_executor.execute(query, context):
-                    if message.type.value == "thinking":
-                        assistant_response += message.content
-                    yield message
-
-            elif route == QueryRoute.STORYTELLING:
-                # TODO: Phase 4 - Add storyteller agent
-                logger.warning(
-                    "Storytelling detected but not implemented yet, "
-                    "using quick executor"
-                )
-                async for message in self.quick_executor.execute(query, context):
-                    if message.type.value == "thinking":
-                        assistant_response += message.content
-                    yield message
+            async for message in stream:
+                if message.type == MessageType.THINKING:
+                    assistant_response += message.content
+                yield message
 
             # Save assistant response to conversation history
             if assistant_response:
@@ -122,11 +304,43 @@ class AgentOrchestrator:
                     metadata={"route": route.value}
                 )
 
+            # Keep the prompt size constant as the session grows
+            self._schedule_summary(session, window.fold_upto)
+
         except Exception as e:
             logger.error(f"Error in orchestrator: {e}", exc_info=True)
-            from schemas.responses import MessageType
             yield AgentMessage(
                 type=MessageType.ERROR,
                 content={"error": str(e)},
                 metadata={}
             )
+        finally:
+            self.scheduler.release(ticket)
+
+
+# Shared orchestrator for the service API key
+_orchestrator = None
+
+
+def get_orchestrator(api_key: Optional[str] = None) -> AgentOrchestrator:
+    """
+    Get an orchestrator for an API key.
+
+    The service-key orchestrator is built once per process. Orchestrators for
+    user-supplied keys are cheap to build because their clients come from the
+    shared client registry.
+    """
+    global _orchestrator
+    if api_key and api_key != get_settings().anthropic_api_key:
+        return AgentOrchestrator(api_key=api_key)
+    if _orchestrator is None:
+        _orchestrator = AgentOrchestrator()
+    return _orchestrator
+
+
+def get_orchestrator_stats() -> dict:
+    """Get process-wide orchestrator statistics"""
+    return {
+        "speculation": dict(_speculation_stats),
+        "coalescing": get_singleflight().get_stats(),
+    }
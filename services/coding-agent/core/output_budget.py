@@ -0,0 +1,80 @@
+"""
+Per-route output token budgets adapted from observed response lengths
+"""
+
+from collections import defaultdict
+from typing import Dict, Optional
+
+from schemas.internal import QueryRoute
+from .config import get_settings
+from .percentiles import PercentileWindow
+
+# Output lengths (tokens) of recent responses per route
+_output_tokens: Dict[str, PercentileWindow] = defaultdict(lambda: PercentileWindow(window=500))
+
+_output_stats: Dict[str, Dict] = defaultdict(lambda: {
+    "responses": 0,
+    "continued": 0,
+    "truncated": 0,
+})
+
+
+def output_budget(route: Optional[QueryRoute]) -> int:
+    """
+    max_tokens for a response on a route.
+
+    Starts at the route's configured budget; once enough responses have been
+    observed it becomes the configured percentile of their output lengths
+    times headroom, clamped to [output_budget_min_tokens,
+    max_tokens_per_request]. Responses that outgrow it are continued, so a
+    tight budget costs a follow-up call rather than a truncated answer.
+    """
+    settings = get_settings()
+    ceiling = settings.max_tokens_per_request
+    if route is None or not settings.enable_adaptive_output_budget:
+        return ceiling
+
+    observed = _output_tokens[route.value].percentile(settings.output_budget_percentile)
+    if observed is None:
+        budget = getattr(settings, f"output_budget_{route.value}")
+    else:
+        budget = int(observed * settings.output_budget_headroom)
+    return max(settings.output_budget_min_tokens, min(budget, ceiling))
+
+
+def record_output(
+    route: QueryRoute,
+    output_tokens: int,
+    continuations: int,
+    truncated: bool
+):
+    """
+    Record a finished response.
+
+    Args:
+        route: Route of the query
+        output_tokens: Output tokens across the response and its continuations
+        continuations: Follow-up calls made after hitting max_tokens
+        truncated: Whether it still ended at max_tokens
+    """
+    _output_tokens[route.value].record(output_tokens)
+    stats = _output_stats[route.value]
+    stats["responses"] += 1
+    if continuations:
+        stats["continued"] += 1
+    if truncated:
+        stats["truncated"] += 1
+
+
+def get_output_budget_stats() -> Dict:
+    """Current budget and observed output length per route"""
+    p = get_settings().output_budget_percentile
+    return {
+        route: {
+            **stats,
+            "max_tokens": output_budget(QueryRoute(route)),
+            "output_tokens_p": p,
+            "output_tokens": _output_tokens[route].percentile(p),
+        }
+        for route, stats in _output_stats.items()
+    }
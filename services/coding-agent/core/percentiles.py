@@ -0,0 +1,25 @@
+"""
+Sliding windows of observations with percentile lookup
+"""
+
+from collections import deque
+from typing import Deque, Optional
+
+
+class PercentileWindow:
+    """Sliding window of recent observations with percentile lookup"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def record(self, value: float):
+        self.samples.append(value)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Value at quantile `p` in [0, 1] (None until enough samples)"""
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(int(p * len(ordered)), len(ordered) - 1)
+        return ordered[index]
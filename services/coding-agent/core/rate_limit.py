@@ -0,0 +1,319 @@
+"""
+Client-side rate limiting for LLM calls
+"""
+
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+import asyncio
+import hashlib
+import logging
+import time
+
+from .config import get_settings
+from . import deadline
+from .resilience import backoff_delay, count, is_overloaded
+from .tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitExceeded(Exception):
+    """A call could not be admitted within the allowed wait"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `per_minute / 60` per second.
+
+    A `per_minute` of 0 disables the bucket. The level may go negative when a
+    call turns out to cost more than reserved; later calls then wait longer.
+    """
+
+    def __init__(self, per_minute: int, clock: Callable[[], float] = time.monotonic):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.clock = clock
+        self.updated = clock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    def _refill(self):
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` can be taken (0 if available now)"""
+        if not self.enabled:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount: float):
+        if self.enabled:
+            self._refill()
+            self.level -= amount
+
+
+class Lease:
+    """Admission for one call; report actual usage with `settle`"""
+
+    def __init__(self, limiter: "RateLimiter", reserved: int):
+        self.limiter = limiter
+        self.reserved = reserved
+
+    def settle(self, actual_tokens: int):
+        """Charge the difference between actual and reserved tokens"""
+        self.limiter.tokens.take(actual_tokens - self.reserved)
+        self.reserved = actual_tokens
+
+
+class RateLimiter:
+    """
+    Request and token budgets plus a concurrency cap for one (API key, model).
+
+    Calls queue in arrival order instead of failing: each waits for a
+    concurrency slot and then for both buckets to have room. A call is
+    rejected with RateLimitExceeded only if the queue already holds
+    `max_queue` calls, or if admission would take longer than `max_wait`
+    seconds.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int,
+        tokens_per_minute: int,
+        max_concurrency: int,
+        max_wait: float,
+        max_queue: int,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.requests = TokenBucket(requests_per_minute, clock)
+        self.tokens = TokenBucket(tokens_per_minute, clock)
+        self.max_concurrency = max_concurrency
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.clock = clock
+        self._slots = asyncio.Semaphore(max_concurrency) if max_concurrency > 0 else None
+        self._order = asyncio.Lock()
+
+        self.queued = 0
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.max_queue_depth = 0
+        self.total_wait = 0.0
+        self.max_wait_seen = 0.0
+
+    def _reject(self, reason: str, retry_after: float):
+        self.rejected += 1
+        logger.warning(f"Rate limit: {reason}, retry after {retry_after:.1f}s")
+        raise RateLimitExceeded(
+            f"Rate limited ({reason}); retry after {retry_after:.1f}s",
+            retry_after
+        )
+
+    async def acquire(self, estimated_tokens: int = 0) -> Lease:
+        """
+        Wait for admission.
+
+        Args:
+            estimated_tokens: Tokens reserved up front (settled after the call)
+
+        Returns:
+            Lease to settle and release once the call is done
+
+        Raises:
+            RateLimitExceeded: If the call cannot be admitted in time
+        """
+        if self.queued >= self.max_queue:
+            self._reject("queue full", self.max_wait)
+
+        # Never wait past the request deadline
+        max_wait = deadline.cap(self.max_wait)
+        start = self.clock()
+        self.queued += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queued)
+        got_slot = False
+        try:
+            if self._slots is not None:
+                try:
+                    await asyncio.wait_for(self._slots.acquire(), max_wait)
+                except asyncio.TimeoutError:
+                    self._reject("concurrency limit", self.max_wait)
+                got_slot = True
+
+            # Admit in arrival order so a large call is not starved
+            async with self._order:
+                wait = max(
+                    self.requests.wait_time(1),
+                    self.tokens.wait_time(estimated_tokens)
+                )
+                if self.clock() - start + wait > max_wait:
+                    self._reject("budget exhausted", wait)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                self.requests.take(1)
+                self.tokens.take(estimated_tokens)
+        except BaseException:
+            if got_slot:
+                self._slots.release()
+            raise
+        finally:
+            self.queued -= 1
+
+        waited = self.clock() - start
+        self.admitted += 1
+        self.active += 1
+        self.total_wait += waited
+        self.max_wait_seen = max(self.max_wait_seen, waited)
+        return Lease(self, estimated_tokens)
+
+    async def try_acquire(self, estimated_tokens: int = 0) -> Optional[Lease]:
+        """Admit a call only if that needs no waiting (e.g. for hedges)"""
+        if self.queued or self._order.locked():
+            return None
+        if self._slots is not None and self._slots.locked():
+            return None
+        if self.requests.wait_time(1) or self.tokens.wait_time(estimated_tokens):
+            return None
+        if self._slots is not None:
+            await self._slots.acquire()  # returns at once, a slot is free
+        self.requests.take(1)
+        self.tokens.take(estimated_tokens)
+        self.admitted += 1
+        self.active += 1
+        return Lease(self, estimated_tokens)
+
+    def release(self, lease: Lease):
+        self.active -= 1
+        if self._slots is not None:
+            self._slots.release()
+
+    def get_stats(self) -> Dict:
+        return {
+            "queue_depth": self.queued,
+            "max_queue_depth": self.max_queue_depth,
+            "active": self.active,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "avg_wait_seconds": round(self.total_wait / self.admitted, 4) if self.admitted else 0.0,
+            "max_wait_seconds": round(self.max_wait_seen, 4),
+        }
+
+
+# Limiters by (API key label, model), least recently used first
+_limiters: "OrderedDict[Tuple[str, str], RateLimiter]" = OrderedDict()
+_limiter_evictions = 0
+
+
+def _key_label(api_key: str) -> str:
+    """Identify an API key without keeping the secret"""
+    if api_key == get_settings().anthropic_api_key:
+        return "default"
+    return "key-" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def get_rate_limiter(api_key: str, model: str) -> RateLimiter:
+    """
+    Get the limiter for an API key and model.
+
+    Limiters for user-supplied keys are kept in an LRU capped at
+    `client_pool_max_keys` entries, like their clients; the least recently
+    used idle ones are evicted, limiters with calls in flight or queued are
+    never dropped. Keys are stored hashed.
+    """
+    global _limiter_evictions
+    key = (_key_label(api_key), model)
+    limiter = _limiters.get(key)
+    if limiter is not None:
+        _limiters.move_to_end(key)
+        return limiter
+
+    settings = get_settings()
+    limiter = RateLimiter(
+        requests_per_minute=settings.rate_limit_requests_per_minute,
+        tokens_per_minute=settings.rate_limit_tokens_per_minute,
+        max_concurrency=settings.rate_limit_max_concurrency,
+        max_wait=settings.rate_limit_max_wait_seconds,
+        max_queue=settings.rate_limit_max_queue
+    )
+    _limiters[key] = limiter
+
+    user_keys = [k for k in _limiters if k[0] != "default"]
+    excess = len(user_keys) - settings.client_pool_max_keys
+    for old in user_keys:
+        if excess <= 0:
+            break
+        if old != key and not _limiters[old].active and not _limiters[old].queued:
+            del _limiters[old]
+            _limiter_evictions += 1
+            excess -= 1
+    return limiter
+
+
+async def limited_create(client, api_key: str, **kwargs):
+    """
+    Non-streaming `messages.create` call admitted through the rate limiter.
+
+    Overload errors are retried with jittered backoff while the request
+    deadline allows; each attempt's timeout is capped by the deadline.
+
+    Raises:
+        RateLimitExceeded: If the call cannot be admitted in time
+        DeadlineExceeded: If the deadline passes before a response
+    """
+    limiter = get_rate_limiter(api_key, kwargs["model"])
+    lease = await limiter.acquire(
+        estimate_tokens(str(kwargs.get("system", "")) + str(kwargs["messages"]))
+    )
+    try:
+        attempt = 0
+        while True:
+            deadline.check()
+            timeout = deadline.remaining()
+            if timeout is not None:
+                kwargs["timeout"] = timeout
+            try:
+                response = await client.messages.create(**kwargs)
+                break
+            except Exception as e:
+                delay = backoff_delay(attempt, e)
+                left = deadline.remaining()
+                if (
+                    not is_overloaded(e)
+                    or attempt >= get_settings().llm_max_retries
+                    or (left is not None and delay >= left)
+                ):
+                    raise
+                attempt += 1
+                count("retries")
+                await asyncio.sleep(delay)
+
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            lease.settle(usage.input_tokens + usage.output_tokens)
+        return response
+    finally:
+        limiter.release(lease)
+
+
+def get_rate_limit_stats() -> Dict:
+    """Get limiter statistics, labelled without exposing API keys"""
+    return {
+        "limiters": {
+            f"{label}/{model}": limiter.get_stats()
+            for (label, model), limiter in _limiters.items()
+        },
+        "evictions": _limiter_evictions,
+    }
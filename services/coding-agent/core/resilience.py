@@ -0,0 +1,98 @@
+"""
+Retry, hedging and latency tracking for LLM calls
+"""
+
+from typing import Dict, Optional
+import random
+
+import anthropic
+
+from .config import get_settings
+from .percentiles import PercentileWindow
+
+# Provider responses worth retrying: rate limited, unavailable, overloaded
+OVERLOAD_STATUS = {429, 503, 529}
+
+# Process-wide counters
+_llm_call_stats = {
+    "retries": 0,
+    "hedged": 0,
+    "hedge_wins": 0,
+    "deadline_exceeded": 0,
+}
+
+
+def is_overloaded(error: BaseException) -> bool:
+    """Whether an API error is a transient overload that may be retried"""
+    return (
+        isinstance(error, anthropic.APIStatusError)
+        and error.status_code in OVERLOAD_STATUS
+    )
+
+
+def backoff_delay(attempt: int, error: Optional[BaseException] = None) -> float:
+    """
+    Seconds to wait before retry number `attempt` (0-based).
+
+    Full jitter: uniform in [0, min(max, base * 2^attempt)], but never less
+    than a `retry-after` header sent with the error.
+    """
+    settings = get_settings()
+    ceiling = min(
+        settings.llm_retry_max_seconds,
+        settings.llm_retry_base_seconds * (2 ** attempt)
+    )
+    delay = random.uniform(0, ceiling)
+
+    response = getattr(error, "response", None)
+    if response is not None:
+        try:
+            delay = max(delay, float(response.headers.get("retry-after", 0)))
+        except (TypeError, ValueError):
+            pass
+    return delay
+
+
+# Time to first token (seconds) per model
+_first_token_latency: Dict[str, PercentileWindow] = {}
+
+
+def first_token_tracker(model: str) -> PercentileWindow:
+    tracker = _first_token_latency.get(model)
+    if tracker is None:
+        tracker = _first_token_latency[model] = PercentileWindow()
+    return tracker
+
+
+def hedge_delay(model: str) -> Optional[float]:
+    """
+    How long to wait for a first token before sending a hedged duplicate.
+
+    Uses the configured percentile of recent first-token latencies, or the
+    initial delay until enough calls have been observed. None disables
+    hedging.
+    """
+    settings = get_settings()
+    if not settings.enable_hedging:
+        return None
+    observed = first_token_tracker(model).percentile(settings.hedge_percentile)
+    if observed is None:
+        return settings.hedge_initial_delay_seconds
+    return max(observed, settings.hedge_min_delay_seconds)
+
+
+def count(event: str):
+    _llm_call_stats[event] += 1
+
+
+def get_llm_call_stats() -> Dict:
+    """Get process-wide retry/hedging statistics"""
+    p = get_settings().hedge_percentile
+    return {
+        **_llm_call_stats,
+        "first_token_p": p,
+        "first_token_seconds": {
+            model: tracker.percentile(p)
+            for model, tracker in _first_token_latency.items()
+        },
+    }
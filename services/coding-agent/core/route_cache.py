@@ -0,0 +1,118 @@
+"""
+LRU/TTL cache for router classifications
+"""
+
+from collections import Counter, OrderedDict
+from typing import Callable, Dict, Hashable, Optional, Tuple
+import re
+import time
+
+from schemas.internal import QueryRoute, NotebookContext
+from .config import get_settings
+
+_NON_WORD = re.compile(r"[^\w\s]+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase a query and strip punctuation and repeated whitespace"""
+    query = _NON_WORD.sub(" ", query.lower())
+    return _WHITESPACE.sub(" ", query).strip()
+
+
+def fingerprint_context(context: NotebookContext) -> Tuple:
+    """
+    Compact fingerprint of the parts of a context that affect routing.
+
+    Variable names are ignored; only the multiset of variable types counts,
+    so notebooks with the same shape share cache entries.
+    """
+    type_counts = Counter(context.variables.values())
+    return (
+        context.has_error(),
+        context.is_empty(),
+        tuple(sorted(type_counts.items())),
+    )
+
+
+class RouteCache:
+    """In-memory LRU cache with per-entry TTL for routing decisions"""
+
+    def __init__(
+        self,
+        max_entries: int = 2048,
+        ttl_seconds: float = 600.0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.entries: "OrderedDict[Hashable, Tuple[QueryRoute, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def make_key(query: str, context: NotebookContext) -> Tuple:
+        """Build a cache key from a query and its notebook context"""
+        return (normalize_query(query), fingerprint_context(context))
+
+    def get(self, key: Hashable) -> Optional[QueryRoute]:
+        """Get a cached route, or None on miss or expiry"""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        route, expires_at = entry
+        if self.clock() >= expires_at:
+            del self.entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return route
+
+    def put(self, key: Hashable, route: QueryRoute):
+        """Cache a route, evicting the least recently used entry if full"""
+        self.entries[key] = (route, self.clock() + self.ttl_seconds)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Drop all cached routes"""
+        self.entries.clear()
+
+    def get_stats(self) -> Dict:
+        """Get cache statistics"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Global route cache instance
+_route_cache = None
+
+
+def get_route_cache() -> RouteCache:
+    """Get global route cache instance"""
+    global _route_cache
+    if _route_cache is None:
+        settings = get_settings()
+        _route_cache = RouteCache(
+            max_entries=settings.route_cache_max_entries,
+            ttl_seconds=settings.route_cache_ttl_seconds
+        )
+    return _route_cache
@@ -2,24 +2,68 @@
 Query router for classifying user requests
 """
 
-from anthropic import Anthropic
 import logging
-from typing import Optional
+import re
+from typing import Dict, Optional, Tuple
 
 from schemas.internal import QueryRoute, NotebookContext
 from prompts.router_prompts import ROUTER_SYSTEM_PROMPT, ROUTER_USER_TEMPLATE
 from .config import get_settings
+from .clients import get_client
+from .route_cache import RouteCache, get_route_cache
+from .compression import compress_traceback, compress_variables
+from .tokens import estimate_tokens
+from .rate_limit import limited_create
 
 logger = logging.getLogger(__name__)
 
+# Keyword patterns for the zero-LLM tier, checked in priority order.
+# Each entry is (route, pattern, confidence when it is the only match).
+ROUTE_PATTERNS = [
+    (
+        QueryRoute.STORYTELLING,
+        re.compile(r"\b(summari[sz]e|summary|report|tell me|story|narrative)\b"),
+        0.85,
+    ),
+    (
+        QueryRoute.EXPLAIN,
+        re.compile(r"\b(explain|what does|what is|interpret\w*|meaning|why (is|does|did))\b"),
+        0.85,
+    ),
+    (
+        QueryRoute.COMPLEX_EDA,
+        re.compile(
+            r"\b(analy[sz]e\b.*\brelationship|compare|correlation|analysis"
+            r"|investigate|explore|distribution|tests?)\b"
+        ),
+        0.8,
+    ),
+]
+
+# Single-step actions that make the simple_code default a confident guess
+SIMPLE_CODE_PATTERN = re.compile(
+    r"\b(show|print|display|plot|histogram|bar ?chart|scatter|head|tail"
+    r"|filter|sort|select|drop|rename|group ?by|count|mean|load|read)\b"
+)
+
+# Confidence penalty when more than one route's keywords match
+AMBIGUITY_PENALTY = 0.6
+
+# Process-wide hit counters per tier (routers for user keys are transient)
+_router_stats = {"fast_path": 0, "llm": 0, "llm_errors": 0}
+
 
 class QueryRouter:
     """Routes queries to appropriate handlers based on complexity and intent"""
 
     def __init__(self, api_key: Optional[str] = None):
         settings = get_settings()
-        self.client = Anthropic(api_key=api_key or settings.anthropic_api_key)
+        self.api_key = api_key or settings.anthropic_api_key
+        self.client = get_client(api_key)
         self.model = settings.router_model
+        self.confidence_threshold = settings.router_confidence_threshold
+        self.context_budget = settings.router_context_budget
+        self.cache = get_route_cache()
 
     async def classify(
         self,
@@ -29,6 +73,10 @@ class QueryRouter:
         """
         Classify a query into a route.
 
+        The keyword tier answers when its confidence reaches
+        `router_confidence_threshold`; otherwise the route cache is checked
+        and only a miss goes to Haiku.
+
         Args:
             query: User's query text
             context: Notebook context
@@ -36,22 +84,68 @@ class QueryRouter:
         Returns:
             QueryRoute enum value
         """
+        route, confidence = self.classify_fast(query, context)
+        if confidence >= self.confidence_threshold:
+            _router_stats["fast_path"] += 1
+            logger.info(
+                f"Classified query as: {route.value} "
+                f"(fast path, confidence {confidence:.2f})"
+            )
+            return route
+
+        cache_key = RouteCache.make_key(query, context)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Classified query as: {cached.value} (cached)")
+            return cached
+
+        return await self._classify_llm(
+            query,
+            context,
+            fallback=route,
+            cache_key=cache_key
+        )
+
+    async def _classify_llm(
+        self,
+        query: str,
+        context: NotebookContext,
+        fallback: QueryRoute,
+        cache_key: Optional[Tuple] = None
+    ) -> QueryRoute:
+        """
+        Classify with the router model, returning `fallback` on error.
+
+        Successful classifications are stored under `cache_key` if given.
+        """
+        _router_stats["llm"] += 1
         try:
-            # Format context for prompt
-            variables_str = ", ".join(
-                f"{k}:{v}" for k, v in context.variables.items()
+            # Format context for prompt, compressed to the router budget
+            budget = self.context_budget
+            last_error = (
+                compress_traceback(context.last_error, budget // 2)
+                if context.last_error else "None"
+            )
+            variables_str = "; ".join(
+                line[2:] for line in compress_variables(
+                    context.variables,
+                    budget - estimate_tokens(last_error),
+                    query
+                )
             ) if context.variables else "None"
 
             user_message = ROUTER_USER_TEMPLATE.format(
                 query=query,
                 variables=variables_str,
-                last_error=context.last_error or "None",
+                last_error=last_error,
                 cell_count=context.cell_count,
                 is_empty=context.is_empty()
             )
 
-            # Fast classification with Haiku
-            response = self.client.messages.create(
+            # Fast classification with Haiku (async so the event loop stays free)
+            response = await limited_create(
+                self.client,
+                self.api_key,
                 model=self.model,
                 max_tokens=50,
                 system=ROUTER_SYSTEM_PROMPT,
@@ -78,17 +172,57 @@ class QueryRouter:
             if route is None:
                 logger.warning(
                     f"Unknown route '{route_text}' from classifier, "
-                    f"defaulting to simple_code"
+                    f"defaulting to {fallback.value}"
                 )
-                route = QueryRoute.SIMPLE_CODE
+                route = fallback
+            elif cache_key is not None:
+                self.cache.put(cache_key, route)
 
             logger.info(f"Classified query as: {route.value}")
             return route
 
         except Exception as e:
+            _router_stats["llm_errors"] += 1
             logger.error(f"Error classifying query: {e}", exc_info=True)
-            # Default to simple_code on error
-            return QueryRoute.SIMPLE_CODE
+            # Fall back to the keyword tier's best guess
+            return fallback
+
+    def classify_fast(
+        self,
+        query: str,
+        context: NotebookContext
+    ) -> Tuple[QueryRoute, float]:
+        """
+        Keyword/regex classification with a confidence score (no API call).
+
+        Args:
+            query: User's query text
+            context: Notebook context
+
+        Returns:
+            Tuple of (route, confidence in [0, 1])
+        """
+        # Quick fix if there's an error
+        if context.has_error():
+            return QueryRoute.QUICK_FIX, 0.95
+
+        query_lower = query.lower()
+        matches = [
+            (route, confidence)
+            for route, pattern, confidence in ROUTE_PATTERNS
+            if pattern.search(query_lower)
+        ]
+
+        if matches:
+            route, confidence = matches[0]
+            if len(matches) > 1:
+                confidence *= AMBIGUITY_PENALTY
+            return route, confidence
+
+        # Default to simple code
+        if SIMPLE_CODE_PATTERN.search(query_lower):
+            return QueryRoute.SIMPLE_CODE, 0.8
+        return QueryRoute.SIMPLE_CODE, 0.4
 
     def classify_heuristic(
         self,
@@ -107,32 +241,14 @@ class QueryRouter:
         Returns:
             QueryRoute enum value
         """
-        query_lower = query.lower()
+        return self.classify_fast(query, context)[0]
 
-        # Quick fix if there's an error
-        if context.has_error():
-            return QueryRoute.QUICK_FIX
-
-        # Storytelling keywords
-        if any(kw in query_lower for kw in ["summarize", "summary", "report", "tell me", "story"]):
-            return QueryRoute.STORYTELLING
-
-        # Explanation keywords
-        if any(kw in query_lower for kw in ["explain", "what does", "what is", "interpret", "meaning"]):
-            return QueryRoute.EXPLAIN
-
-        # Complex EDA keywords
-        if any(kw in query_lower for kw in [
-            "analyze relationship",
-            "compare",
-            "correlation",
-            "analysis",
-            "investigate",
-            "explore",
-            "distribution",
-            "test"
-        ]):
-            return QueryRoute.COMPLEX_EDA
 
-        # Default to simple code
-        return QueryRoute.SIMPLE_CODE
+def get_router_stats() -> Dict:
+    """Get process-wide router tier statistics"""
+    total = _router_stats["fast_path"] + _router_stats["llm"]
+    return {
+        **_router_stats,
+        "llm_calls_saved": _router_stats["fast_path"],
+        "fast_path_rate": round(_router_stats["fast_path"] / total, 4) if total else 0.0,
+    }
@@ -0,0 +1,242 @@
+"""
+Priority scheduling and load shedding for agent executions
+"""
+
+from typing import Callable, Dict, List, Optional
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import time
+
+from schemas.internal import QueryRoute
+from .config import get_settings
+from . import deadline
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, most urgent first
+INTERACTIVE = "interactive"
+STANDARD = "standard"
+BACKGROUND = "background"
+PRIORITIES = {INTERACTIVE: 0, STANDARD: 1, BACKGROUND: 2}
+
+ROUTE_CLASSES = {
+    QueryRoute.QUICK_FIX: INTERACTIVE,
+    QueryRoute.SIMPLE_CODE: INTERACTIVE,
+    QueryRoute.EXPLAIN: STANDARD,
+    QueryRoute.COMPLEX_EDA: BACKGROUND,
+    QueryRoute.STORYTELLING: BACKGROUND,
+}
+
+
+class LoadShed(Exception):
+    """A request was dropped because its queue wait exceeded the deadline"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Pool:
+    """Concurrency pool and queue deadline for one priority class"""
+
+    def __init__(self, name: str, slots: int, deadline: float):
+        self.name = name
+        self.slots = slots
+        self.deadline = deadline
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed = 0
+        self.avg_hold = 0.0  # EWMA of seconds a slot is held
+
+    @property
+    def has_room(self) -> bool:
+        return self.active < self.slots
+
+
+class Ticket:
+    """A granted execution slot"""
+
+    def __init__(self, pool: _Pool, granted_at: float):
+        self.pool = pool
+        self.granted_at = granted_at
+
+
+class Scheduler:
+    """
+    Admits executions by route priority.
+
+    Each priority class has its own concurrency pool, so slow background
+    work can never take every slot, and all classes share `total_slots`.
+    When a shared slot frees up it goes to the most urgent waiter whose pool
+    has room (first come, first served within a class). A waiter that has
+    queued longer than its class deadline is shed with LoadShed and a
+    retry-after estimate.
+    """
+
+    def __init__(
+        self,
+        total_slots: int,
+        pools: Dict[str, tuple],
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Args:
+            total_slots: Executions running at once across all classes
+            pools: Priority class -> (slots, queue deadline in seconds)
+            clock: Time source
+        """
+        self.total_slots = total_slots
+        self.pools = {
+            name: _Pool(name, slots, deadline)
+            for name, (slots, deadline) in pools.items()
+        }
+        self.clock = clock
+        self.active = 0
+        self._waiters: List[tuple] = []  # heap of (priority, seq, pool, future)
+        self._seq = itertools.count()
+
+    def _grant(self, pool: _Pool) -> Ticket:
+        pool.active += 1
+        pool.admitted += 1
+        self.active += 1
+        return Ticket(pool, self.clock())
+
+    def _dispatch(self):
+        """Hand free slots to the most urgent eligible waiters"""
+        skipped = []
+        while self._waiters and self.active < self.total_slots:
+            entry = heapq.heappop(self._waiters)
+            _, _, pool, future = entry
+            if future.done():
+                continue
+            if not pool.has_room:
+                skipped.append(entry)
+                continue
+            pool.waiting -= 1
+            future.set_result(self._grant(pool))
+        for entry in skipped:
+            heapq.heappush(self._waiters, entry)
+
+    def retry_after(self, pool: _Pool) -> float:
+        """Estimated seconds until a new request of this class would run"""
+        backlog = (pool.waiting + 1) / max(pool.slots, 1)
+        return max(1.0, math.ceil(pool.avg_hold * backlog))
+
+    async def acquire(
+        self,
+        route: QueryRoute,
+        priority: Optional[str] = None,
+        shed: bool = True
+    ) -> Ticket:
+        """
+        Wait for an execution slot.
+
+        Args:
+            route: Route of the request, which picks its priority class
+            priority: Priority class to use instead of the route's
+            shed: Whether to shed the request after its class deadline;
+                otherwise it waits until the request deadline
+
+        Raises:
+            LoadShed: If the request queued longer than its class deadline
+                (or than the time left before the request deadline)
+        """
+        pool = self.pools[priority or ROUTE_CLASSES.get(route, STANDARD)]
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(
+            self._waiters,
+            (PRIORITIES[pool.name], next(self._seq), pool, future)
+        )
+        pool.waiting += 1
+        self._dispatch()
+        if future.done():
+            return future.result()
+
+        try:
+            return await asyncio.wait_for(
+                asyncio.shield(future),
+                deadline.cap(pool.deadline if shed else None)
+            )
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(future.result())
+            else:
+                future.cancel()
+                pool.waiting -= 1
+            raise
+
+        # Granted just as the deadline passed
+        if future.done():
+            return future.result()
+        future.cancel()
+        pool.waiting -= 1
+        pool.shed += 1
+        retry_after = self.retry_after(pool)
+        logger.warning(
+            f"Shedding {route.value} request after queueing "
+            f"(retry after {retry_after:.0f}s)"
+        )
+        raise LoadShed(
+            f"Server busy, {route.value} request shed; retry after {retry_after:.0f}s",
+            retry_after
+        )
+
+    def release(self, ticket: Ticket):
+        pool = ticket.pool
+        pool.active -= 1
+        self.active -= 1
+        held = self.clock() - ticket.granted_at
+        pool.avg_hold = held if not pool.avg_hold else 0.8 * pool.avg_hold + 0.2 * held
+        self._dispatch()
+
+    def get_stats(self) -> Dict:
+        return {
+            "active": self.active,
+            "total_slots": self.total_slots,
+            "classes": {
+                name: {
+                    "active": pool.active,
+                    "slots": pool.slots,
+                    "waiting": pool.waiting,
+                    "admitted": pool.admitted,
+                    "shed": pool.shed,
+                    "avg_hold_seconds": round(pool.avg_hold, 3),
+                }
+                for name, pool in self.pools.items()
+            },
+        }
+
+
+# Global scheduler instance
+_scheduler: Optional[Scheduler] = None
+
+
+def get_scheduler() -> Scheduler:
+    """Get global scheduler instance"""
+    global _scheduler
+    if _scheduler is None:
+        settings = get_settings()
+        _scheduler = Scheduler(
+            total_slots=settings.scheduler_max_concurrency,
+            pools={
+                INTERACTIVE: (
+                    settings.scheduler_interactive_slots,
+                    settings.scheduler_interactive_deadline_seconds
+                ),
+                STANDARD: (
+                    settings.scheduler_standard_slots,
+                    settings.scheduler_standard_deadline_seconds
+                ),
+                BACKGROUND: (
+                    settings.scheduler_background_slots,
+                    settings.scheduler_background_deadline_seconds
+                ),
+            }
+        )
+    return _scheduler
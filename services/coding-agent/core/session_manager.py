@@ -2,44 +2,158 @@
 Session manager for maintaining conversation state
 """
 
-from typing import Dict, List, Optional
+from collections import OrderedDict, deque
+from itertools import islice
+from typing import Deque, Dict, List, Optional, Tuple
 from dataclasses import dataclass, field
 from datetime import datetime
+import asyncio
 import json
+import logging
+import sys
+import time
+
+from .config import get_settings
+from .session_store import SessionStore, create_session_store
+from .tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Rough per-object overhead used for the session byte budget
+SESSION_OVERHEAD_BYTES = 1024
+TURN_OVERHEAD_BYTES = 256
+VARIABLE_OVERHEAD_BYTES = 64
 
 
-@dataclass
 class ConversationTurn:
-    """Single turn in a conversation"""
-    role: str  # "user" or "assistant"
-    content: str
-    timestamp: datetime = field(default_factory=datetime.now)
-    metadata: Dict = field(default_factory=dict)
+    """
+    Single turn in a conversation.
+
+    Thousands of sessions each hold many turns, so turns are slotted, roles
+    are interned, timestamps are epoch floats and the metadata dict is only
+    allocated when a turn actually has metadata.
+    """
+
+    __slots__ = ("role", "content", "timestamp", "_metadata")
+
+    def __init__(
+        self,
+        role: str,  # "user" or "assistant"
+        content: str,
+        timestamp: Optional[float] = None,
+        metadata: Optional[Dict] = None
+    ):
+        self.role = sys.intern(role)
+        self.content = content
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self._metadata = metadata or None
+
+    @property
+    def metadata(self) -> Dict:
+        if self._metadata is None:
+            self._metadata = {}
+        return self._metadata
+
+    def prompt_text(self) -> str:
+        """Turn content as it was sent to the model (with its context block)"""
+        context = self._metadata.get("context") if self._metadata else None
+        if context:
+            return f"{context}\n\nUser request: {self.content}"
+        return self.content
+
+    def __repr__(self) -> str:
+        return f"ConversationTurn(role={self.role!r}, content={self.content[:40]!r})"
+
+
+def _turn_bytes(turn: ConversationTurn) -> int:
+    context = turn._metadata.get("context", "") if turn._metadata else ""
+    return len(turn.content) + len(context) + TURN_OVERHEAD_BYTES
+
+
+def _new_history() -> Deque[ConversationTurn]:
+    return deque(maxlen=get_settings().session_max_turns)
 
 
 @dataclass
+class VariableDiff:
+    """Change in notebook variables relative to what the model last saw"""
+    version: int
+    full: bool  # True when the model needs the whole snapshot
+    added: Dict[str, str] = field(default_factory=dict)
+    removed: List[str] = field(default_factory=list)
+    changed: Dict[str, Tuple[str, str]] = field(default_factory=dict)
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self.added or self.removed or self.changed)
+
+
+@dataclass
+class HistoryWindow:
+    """Recent conversation that fits a prompt token budget"""
+    messages: List[Dict]
+    summary: str
+    fold_upto: int  # Turns before this index belong in the summary
+
+
+@dataclass(slots=True)
 class SessionState:
-    """State for a single session"""
+    """
+    State for a single session.
+
+    History is a bounded deque, so turn positions are counted from the start
+    of the session (`total_turns` ever added) rather than deque indices.
+    """
     session_id: str
     notebook_id: str
-    conversation_history: List[ConversationTurn] = field(default_factory=list)
+    conversation_history: Deque[ConversationTurn] = field(default_factory=_new_history)
     notebook_variables: Dict[str, str] = field(default_factory=dict)
-    last_activity: datetime = field(default_factory=datetime.now)
+    last_activity: float = field(default_factory=time.time)
+    size_bytes: int = SESSION_OVERHEAD_BYTES
+    total_turns: int = 0
+    summary: str = ""
+    summarized_turns: int = 0  # Leading turns already folded into summary
+    summarizing: bool = False
+    variables_version: int = 0
+    sent_variables: Optional[Dict[str, str]] = None  # What the model last saw
+    snapshot_turn: int = -1  # Position of the turn carrying the full snapshot
+
+    @property
+    def first_turn(self) -> int:
+        """Position of the oldest turn still held in history"""
+        return self.total_turns - len(self.conversation_history)
 
     def add_turn(self, role: str, content: str, metadata: Dict = None):
         """Add a conversation turn"""
-        turn = ConversationTurn(
-            role=role,
-            content=content,
-            metadata=metadata or {}
+        history = self.conversation_history
+        if history.maxlen is not None and len(history) == history.maxlen:
+            self.size_bytes -= _turn_bytes(history[0])
+        turn = ConversationTurn(role, content, metadata=metadata)
+        history.append(turn)
+        self.total_turns += 1
+        self.size_bytes += _turn_bytes(turn)
+        self.last_activity = time.time()
+
+    def recompute_size(self):
+        """Recompute the approximate size from scratch"""
+        self.size_bytes = (
+            SESSION_OVERHEAD_BYTES +
+            len(self.summary) +
+            sum(_turn_bytes(t) for t in self.conversation_history) +
+            _variables_bytes(self.notebook_variables)
         )
-        self.conversation_history.append(turn)
-        self.last_activity = datetime.now()
+
+    def turns_between(self, start: int, end: int) -> List[ConversationTurn]:
+        """Get held turns with positions in [start, end)"""
+        offset = self.first_turn
+        start = max(start - offset, 0)
+        end = max(end - offset, start)
+        return list(islice(self.conversation_history, start, end))
 
     def get_history_for_agent(self, max_turns: int = 10) -> List[Dict]:
         """Get conversation history formatted for agent"""
         # Get recent turns
-        recent = self.conversation_history[-max_turns:]
+        recent = self.turns_between(self.total_turns - max_turns, self.total_turns)
 
         # Format for Claude API
         return [
@@ -47,41 +161,259 @@ class SessionState:
             for turn in recent
         ]
 
+    def get_history_window(self, token_budget: int) -> HistoryWindow:
+        """
+        Get the most recent turns that fit within a token budget.
+
+        Turns older than the window are represented only by the running
+        summary; `fold_upto` tells the caller which turns still need to be
+        folded into it.
+        """
+        budget = token_budget - estimate_tokens(self.summary)
+        floor = max(self.summarized_turns, self.first_turn)
+        window: List[ConversationTurn] = []
+        used = 0
+        for turn in reversed(self.conversation_history):
+            if self.total_turns - len(window) <= floor:
+                break
+            cost = estimate_tokens(turn.prompt_text())
+            if used + cost > budget:
+                break
+            used += cost
+            window.append(turn)
+        window.reverse()
+
+        # The API expects the conversation to open with a user turn
+        while window and window[0].role != "user":
+            window.pop(0)
+
+        # Merge consecutive same-role turns (e.g. a query that got no reply)
+        messages = []
+        for turn in window:
+            text = turn.prompt_text()
+            if messages and messages[-1]["role"] == turn.role:
+                messages[-1]["content"] += "\n\n" + text
+            else:
+                messages.append({"role": turn.role, "content": text})
+
+        return HistoryWindow(
+            messages=messages,
+            summary=self.summary,
+            fold_upto=self.total_turns - len(window)
+        )
+
+    def apply_summary(self, summary: str, upto: int):
+        """Replace the running summary with one covering turns before `upto`"""
+        self.size_bytes += len(summary) - len(self.summary)
+        self.summary = summary
+        self.summarized_turns = max(self.summarized_turns, upto)
+
     def update_variables(self, variables: Dict[str, str]):
-        """Update tracked notebook variables"""
-        self.notebook_variables.update(variables)
-        self.last_activity = datetime.now()
+        """Replace tracked notebook variables, bumping the version on change"""
+        if variables == self.notebook_variables:
+            self.last_activity = time.time()
+            return
+        self.size_bytes += (
+            _variables_bytes(variables) - _variables_bytes(self.notebook_variables)
+        )
+        self.notebook_variables = dict(variables)
+        self.variables_version += 1
+        self.last_activity = time.time()
+
+    def diff_variables(
+        self,
+        variables: Dict[str, str],
+        window_start: int,
+        full_refresh: bool = False
+    ) -> VariableDiff:
+        """
+        Diff variables against what the model saw on earlier turns.
+
+        A diff is only usable while the turn carrying the last full snapshot
+        is still inside the history window that will be sent (positions
+        >= `window_start`); otherwise a full snapshot is returned.
+        """
+        known = self.sent_variables
+        if full_refresh or known is None or self.snapshot_turn < window_start:
+            return VariableDiff(
+                version=self.variables_version,
+                full=True,
+                added=dict(variables)
+            )
+
+        return VariableDiff(
+            version=self.variables_version,
+            full=False,
+            added={k: v for k, v in variables.items() if k not in known},
+            removed=[k for k in known if k not in variables],
+            changed={
+                k: (known[k], v)
+                for k, v in variables.items()
+                if k in known and known[k] != v
+            }
+        )
+
+    def mark_context_sent(
+        self,
+        variables: Dict[str, str],
+        diff: VariableDiff,
+        turn_position: int
+    ):
+        """Record the variables the model now knows about"""
+        self.sent_variables = dict(variables)
+        if diff.full:
+            self.snapshot_turn = turn_position
+
+
+def _variables_bytes(variables: Dict[str, str]) -> int:
+    return sum(
+        len(name) + len(dtype) + VARIABLE_OVERHEAD_BYTES
+        for name, dtype in variables.items()
+    )
 
 
 class SessionManager:
-    """Manages conversation sessions and state"""
+    """
+    Manages conversation sessions and state.
+
+    Sessions are kept in LRU order. Inserting a session or growing one can
+    evict the least recently used sessions until both the session cap and
+    the approximate byte budget hold; each eviction is O(1).
 
-    def __init__(self, max_sessions: int = 1000):
-        self.sessions: Dict[str, SessionState] = {}
+    With a `store`, every change is also handed to it write-behind, and
+    sessions missing from memory (evicted or from before a restart) are
+    lazy-loaded from it by the async accessors, off the event loop. The
+    synchronous mutators only act on sessions in memory, so request
+    handlers load a session first (`get_or_create_session`).
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 1000,
+        max_bytes: Optional[int] = None,
+        store: Optional[SessionStore] = None
+    ):
+        self.sessions: "OrderedDict[str, SessionState]" = OrderedDict()
         self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.store = store
+        self.total_bytes = 0
+        self.evictions = {"max_sessions": 0, "max_bytes": 0}
+        self.loads = 0
+
+    def _insert(self, session: SessionState):
+        self.sessions[session.session_id] = session
+        self.total_bytes += session.size_bytes
+        self._evict_lru()
+
+    async def _load(self, session_id: str) -> Optional[SessionState]:
+        """
+        Lazy-load a cold session from the store.
+
+        The read (and any wait for this session's pending writes) runs in a
+        worker thread so the event loop never blocks on disk.
+        """
+        if self.store is None:
+            return None
+        data = await asyncio.to_thread(
+            self.store.load, session_id, get_settings().session_max_turns
+        )
+        if data is None:
+            return None
+        # Another request may have loaded or created it meanwhile
+        if session_id in self.sessions:
+            return self._cached(session_id)
 
-    def get_or_create_session(
+        session = SessionState(
+            session_id=session_id,
+            notebook_id=data["notebook_id"],
+            notebook_variables=data["variables"],
+            last_activity=data["last_activity"],
+            total_turns=data["total_turns"],
+            summary=data["summary"],
+            summarized_turns=data["summarized_turns"]
+        )
+        session.conversation_history.extend(
+            ConversationTurn(role, content, timestamp, metadata)
+            for role, content, timestamp, metadata in data["turns"]
+        )
+        session.recompute_size()
+        self._insert(session)
+        self.loads += 1
+        return session
+
+    def _cached(self, session_id: str) -> Optional[SessionState]:
+        """Get a session from memory only, marking it recently used"""
+        session = self.sessions.get(session_id)
+        if session is not None:
+            self.sessions.move_to_end(session_id)
+        return session
+
+    async def get_session(self, session_id: str) -> Optional[SessionState]:
+        """Get a session, loading it from the store if needed"""
+        session = self._cached(session_id)
+        if session is not None:
+            return session
+        return await self._load(session_id)
+
+    async def has_session(self, session_id: str) -> bool:
+        """Check whether a session exists in memory or in the store"""
+        return await self.get_session(session_id) is not None
+
+    async def get_or_create_session(
         self,
         session_id: str,
         notebook_id: str
     ) -> SessionState:
         """Get existing session or create new one"""
-        if session_id not in self.sessions:
-            # Clean up old sessions if needed
-            if len(self.sessions) >= self.max_sessions:
-                self._cleanup_old_sessions()
-
-            self.sessions[session_id] = SessionState(
-                session_id=session_id,
-                notebook_id=notebook_id
-            )
+        session = await self.get_session(session_id)
+        if session is not None:
+            return session
+        if session_id in self.sessions:
+            # Created by another request while the store was read
+            return self._cached(session_id)
+
+        session = SessionState(
+            session_id=session_id,
+            notebook_id=notebook_id
+        )
+        self._insert(session)
+        if self.store is not None:
+            self.store.save_state(session)
+        return session
+
+    def _resized(self, session: SessionState, previous_bytes: int):
+        """Account for a session growing and evict if over budget"""
+        self.total_bytes += session.size_bytes - previous_bytes
+        self._evict_lru()
 
-        return self.sessions[session_id]
+    def _add_turn(
+        self,
+        session_id: str,
+        role: str,
+        message: str,
+        metadata: Dict = None
+    ):
+        session = self._cached(session_id)
+        if session is not None:
+            previous = session.size_bytes
+            session.add_turn(role, message, metadata=metadata)
+            if self.store is not None:
+                self.store.save_turn(
+                    session,
+                    session.conversation_history[-1],
+                    session.total_turns - 1
+                )
+            self._resized(session, previous)
 
-    def add_user_message(self, session_id: str, message: str):
+    def add_user_message(
+        self,
+        session_id: str,
+        message: str,
+        metadata: Dict = None
+    ):
         """Add user message to session"""
-        if session_id in self.sessions:
-            self.sessions[session_id].add_turn("user", message)
+        self._add_turn(session_id, "user", message, metadata=metadata)
 
     def add_assistant_message(
         self,
@@ -90,12 +422,7 @@ class SessionManager:
         metadata: Dict = None
     ):
         """Add assistant message to session"""
-        if session_id in self.sessions:
-            self.sessions[session_id].add_turn(
-                "assistant",
-                message,
-                metadata=metadata
-            )
+        self._add_turn(session_id, "assistant", message, metadata=metadata)
 
     def update_notebook_state(
         self,
@@ -103,46 +430,104 @@ class SessionManager:
         variables: Dict[str, str]
     ):
         """Update notebook variable state"""
-        if session_id in self.sessions:
-            self.sessions[session_id].update_variables(variables)
+        session = self._cached(session_id)
+        if session is not None:
+            previous = session.size_bytes
+            session.update_variables(variables)
+            if self.store is not None:
+                self.store.save_state(session)
+            self._resized(session, previous)
 
-    def get_conversation_context(
+    async def get_conversation_context(
         self,
         session_id: str,
         max_turns: int = 10
     ) -> List[Dict]:
         """Get conversation history for agent"""
-        if session_id in self.sessions:
-            return self.sessions[session_id].get_history_for_agent(max_turns)
+        session = await self.get_session(session_id)
+        if session is not None:
+            return session.get_history_for_agent(max_turns)
         return []
 
+    def apply_summary(self, session_id: str, summary: str, upto: int):
+        """Store a new running summary for a session"""
+        session = self._cached(session_id)
+        if session is not None:
+            previous = session.size_bytes
+            session.apply_summary(summary, upto)
+            if self.store is not None:
+                self.store.save_state(session)
+            self._resized(session, previous)
+
     def clear_session(self, session_id: str):
         """Clear a specific session"""
-        if session_id in self.sessions:
-            del self.sessions[session_id]
+        session = self.sessions.pop(session_id, None)
+        if session is not None:
+            self.total_bytes -= session.size_bytes
+        if self.store is not None:
+            self.store.delete(session_id)
 
-    def _cleanup_old_sessions(self, max_age_hours: int = 24):
-        """Remove old inactive sessions"""
-        now = datetime.now()
-        to_remove = []
+    async def release_sessions(self, session_ids: List[str]):
+        """
+        Drop sessions from memory after another worker took ownership.
 
-        for session_id, session in self.sessions.items():
-            age = (now - session.last_activity).total_seconds() / 3600
-            if age > max_age_hours:
-                to_remove.append(session_id)
+        Pending writes are flushed first (off the event loop) so the new
+        owner loads the latest state from the shared store.
+        """
+        if self.store is not None:
+            await asyncio.to_thread(self.store.flush)
+        elif session_ids:
+            logger.warning(
+                f"Releasing {len(session_ids)} sessions without a session store; "
+                "their history is lost"
+            )
+        for session_id in session_ids:
+            session = self.sessions.pop(session_id, None)
+            if session is not None:
+                self.total_bytes -= session.size_bytes
+
+    def close(self):
+        """Flush pending writes and close the store"""
+        if self.store is not None:
+            self.store.close()
+
+    def _evict_lru(self):
+        """Evict least recently used sessions until within limits"""
+        # The most recently used session is never evicted
+        while len(self.sessions) > 1:
+            if len(self.sessions) > self.max_sessions:
+                reason = "max_sessions"
+            elif self.max_bytes is not None and self.total_bytes > self.max_bytes:
+                reason = "max_bytes"
+            else:
+                break
+            _, session = self.sessions.popitem(last=False)
+            self.total_bytes -= session.size_bytes
+            self.evictions[reason] += 1
 
-        for session_id in to_remove:
-            del self.sessions[session_id]
+    def get_stats(self) -> Dict:
+        """Get session store statistics"""
+        return {
+            "sessions": len(self.sessions),
+            "max_sessions": self.max_sessions,
+            "approx_bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": dict(self.evictions),
+            "loads": self.loads,
+            "store": self.store.get_stats() if self.store is not None else None,
+        }
 
-    def get_session_info(self, session_id: str) -> Optional[Dict]:
+    async def get_session_info(self, session_id: str) -> Optional[Dict]:
         """Get session information"""
-        if session_id in self.sessions:
-            session = self.sessions[session_id]
+        session = await self.get_session(session_id)
+        if session is not None:
             return {
                 "session_id": session.session_id,
                 "notebook_id": session.notebook_id,
                 "turn_count": len(session.conversation_history),
-                "last_activity": session.last_activity.isoformat(),
+                "last_activity": datetime.fromtimestamp(
+                    session.last_activity
+                ).isoformat(),
                 "variables": list(session.notebook_variables.keys())
             }
         return None
@@ -156,5 +541,10 @@ def get_session_manager() -> SessionManager:
     """Get global session manager instance"""
     global _session_manager
     if _session_manager is None:
-        _session_manager = SessionManager()
+        settings = get_settings()
+        _session_manager = SessionManager(
+            max_sessions=settings.max_sessions,
+            max_bytes=settings.session_max_bytes,
+            store=create_session_store(settings)
+        )
     return _session_manager
@@ -0,0 +1,308 @@
+"""
+Durable session storage with write-behind batching
+"""
+
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+from collections import defaultdict
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    notebook_id TEXT NOT NULL,
+    variables TEXT NOT NULL DEFAULT '{}',
+    summary TEXT NOT NULL DEFAULT '',
+    summarized_turns INTEGER NOT NULL DEFAULT 0,
+    total_turns INTEGER NOT NULL DEFAULT 0,
+    last_activity REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS turns (
+    session_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    metadata TEXT,
+    PRIMARY KEY (session_id, position)
+);
+"""
+
+
+class SessionStore(ABC):
+    """
+    Interface for session persistence backends.
+
+    Writes are fire-and-forget from the request path; implementations are
+    expected to persist them asynchronously. `load` must observe every write
+    previously issued for the same session.
+    """
+
+    @abstractmethod
+    def load(self, session_id: str, max_turns: int) -> Optional[Dict]:
+        """
+        Load a stored session.
+
+        Returns:
+            Dict with notebook_id, variables, summary, summarized_turns,
+            total_turns, last_activity and turns (oldest first, at most
+            `max_turns`), or None if the session is unknown
+        """
+
+    @abstractmethod
+    def save_turn(self, session, turn, position: int):
+        """Persist one conversation turn"""
+
+    @abstractmethod
+    def save_state(self, session):
+        """Persist session-level fields (variables, summary, counters)"""
+
+    @abstractmethod
+    def delete(self, session_id: str):
+        """Delete a session and its turns"""
+
+    def flush(self):
+        """Block until all issued writes are durable"""
+
+    def close(self):
+        """Flush and release resources"""
+
+    def get_stats(self) -> Dict:
+        return {}
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    SQLite (WAL mode) session store.
+
+    Writes go onto a queue drained by one background thread, which commits
+    them in batches of up to `batch_size` operations or every
+    `flush_interval` seconds. Session-level state updates are coalesced
+    within a batch, and turns older than the newest `max_turns` of a session
+    are deleted as new ones are written. Reads use a separate connection; WAL lets them run
+    while the writer commits.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        batch_size: int = 100,
+        flush_interval: float = 0.05,
+        max_turns: int = 200
+    ):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_turns = max_turns
+
+        self._reader = sqlite3.connect(path, check_same_thread=False)
+        self._reader.execute("PRAGMA journal_mode=WAL")
+        self._reader.executescript(SCHEMA)
+        self._reader.commit()
+
+        self._queue: "queue.Queue[Optional[Tuple]]" = queue.Queue()
+        self._pending: Dict[str, int] = defaultdict(int)
+        self._pending_lock = threading.Condition()
+        self.batches = 0
+        self.writes = 0
+        self.load_waits = 0
+
+        self._writer = threading.Thread(
+            target=self._run_writer,
+            name="session-store-writer",
+            daemon=True
+        )
+        self._writer.start()
+
+    # Request path
+
+    def _enqueue(self, session_id: str, op: Tuple):
+        with self._pending_lock:
+            self._pending[session_id] += 1
+        self._queue.put(op)
+
+    def save_turn(self, session, turn, position: int):
+        self._enqueue(session.session_id, (
+            "turn",
+            session.session_id,
+            position,
+            turn.role,
+            turn.content,
+            turn.timestamp,
+            json.dumps(turn._metadata) if turn._metadata else None,
+        ))
+        self.save_state(session)
+
+    def save_state(self, session):
+        self._enqueue(session.session_id, (
+            "state",
+            session.session_id,
+            session.notebook_id,
+            json.dumps(session.notebook_variables),
+            session.summary,
+            session.summarized_turns,
+            session.total_turns,
+            session.last_activity,
+        ))
+
+    def delete(self, session_id: str):
+        self._enqueue(session_id, ("delete", session_id))
+
+    def load(self, session_id: str, max_turns: int) -> Optional[Dict]:
+        # Only wait when this session has writes still in flight
+        with self._pending_lock:
+            if self._pending.get(session_id):
+                self.load_waits += 1
+                self._pending_lock.wait_for(
+                    lambda: not self._pending.get(session_id)
+                )
+
+        row = self._reader.execute(
+            "SELECT notebook_id, variables, summary, summarized_turns, "
+            "total_turns, last_activity FROM sessions WHERE session_id = ?",
+            (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        turn_rows = self._reader.execute(
+            "SELECT role, content, timestamp, metadata FROM turns "
+            "WHERE session_id = ? ORDER BY position DESC LIMIT ?",
+            (session_id, max_turns)
+        ).fetchall()
+        turn_rows.reverse()
+
+        return {
+            "notebook_id": row[0],
+            "variables": json.loads(row[1]),
+            "summary": row[2],
+            "summarized_turns": row[3],
+            "total_turns": row[4],
+            "last_activity": row[5],
+            "turns": [
+                (role, content, timestamp, json.loads(metadata) if metadata else None)
+                for role, content, timestamp, metadata in turn_rows
+            ],
+        }
+
+    def flush(self):
+        with self._pending_lock:
+            self._pending_lock.wait_for(lambda: not any(self._pending.values()))
+
+    def close(self):
+        self._queue.put(None)
+        self._writer.join()
+        self._reader.close()
+
+    def get_stats(self) -> Dict:
+        with self._pending_lock:
+            pending = sum(self._pending.values())
+        return {
+            "backend": "sqlite",
+            "pending_writes": pending,
+            "writes": self.writes,
+            "batches": self.batches,
+            "load_waits": self.load_waits,
+        }
+
+    # Writer thread
+
+    def _run_writer(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        stopping = False
+        while not stopping:
+            op = self._queue.get()
+            if op is None:
+                break
+            batch = [op]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    op = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if op is None:
+                    stopping = True
+                    break
+                batch.append(op)
+
+            try:
+                self._write_batch(conn, batch)
+            except Exception as e:
+                logger.error(f"Error writing session batch: {e}", exc_info=True)
+            finally:
+                with self._pending_lock:
+                    for op in batch:
+                        self._pending[op[1]] -= 1
+                        if self._pending[op[1]] <= 0:
+                            del self._pending[op[1]]
+                    self._pending_lock.notify_all()
+        conn.close()
+
+    def _write_batch(self, conn: sqlite3.Connection, batch: List[Tuple]):
+        # Only the newest state per session matters
+        states = {}
+        # Newest turn position written per session
+        newest = {}
+        with conn:
+            for op in batch:
+                kind = op[0]
+                if kind == "turn":
+                    conn.execute(
+                        "INSERT OR REPLACE INTO turns "
+                        "(session_id, position, role, content, timestamp, metadata) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        op[1:]
+                    )
+                    newest[op[1]] = max(newest.get(op[1], -1), op[2])
+                elif kind == "state":
+                    states[op[1]] = op[1:]
+                elif kind == "delete":
+                    states.pop(op[1], None)
+                    newest.pop(op[1], None)
+                    conn.execute("DELETE FROM turns WHERE session_id = ?", (op[1],))
+                    conn.execute("DELETE FROM sessions WHERE session_id = ?", (op[1],))
+            conn.executemany(
+                "INSERT OR REPLACE INTO sessions "
+                "(session_id, notebook_id, variables, summary, summarized_turns, "
+                "total_turns, last_activity) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                states.values()
+            )
+            # Keep the stored history as bounded as the in-memory one
+            conn.executemany(
+                "DELETE FROM turns WHERE session_id = ? AND position <= ?",
+                [
+                    (session_id, position - self.max_turns)
+                    for session_id, position in newest.items()
+                    if position >= self.max_turns
+                ]
+            )
+        self.batches += 1
+        self.writes += len(batch)
+
+
+def create_session_store(settings) -> Optional[SessionStore]:
+    """Build the configured session store (None keeps sessions in memory only)"""
+    backend = settings.session_store_backend.lower()
+    if backend == "memory":
+        return None
+    if backend == "sqlite":
+        return SQLiteSessionStore(
+            settings.session_store_path,
+            batch_size=settings.session_store_batch_size,
+            flush_interval=settings.session_store_flush_interval_ms / 1000,
+            max_turns=settings.session_max_turns
+        )
+    raise ValueError(f"Unknown session store backend: {settings.session_store_backend}")
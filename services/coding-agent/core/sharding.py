@@ -0,0 +1,251 @@
+"""
+Session affinity across workers via consistent hashing
+"""
+
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlsplit
+import bisect
+import hashlib
+import hmac
+import logging
+
+import httpx
+from fastapi import Request
+from fastapi.responses import RedirectResponse, Response
+
+from .config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Workers a request was forwarded by, comma-separated. Trusted together
+# with the cluster secret (the owner handles it without forwarding again);
+# without it, a worker that finds itself in the chain stops the loop
+FORWARDED_HEADER = "x-socio-forwarded-by"
+CLUSTER_SECRET_HEADER = "x-socio-cluster-secret"
+
+# Hop-by-hop headers that must not be copied when proxying
+HOP_HEADERS = {
+    "connection", "keep-alive", "transfer-encoding", "te", "trailer",
+    "upgrade", "host", "content-length",
+}
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent hash ring with virtual nodes"""
+
+    def __init__(self, nodes: Iterable[str] = (), virtual_nodes: int = 100):
+        self.virtual_nodes = virtual_nodes
+        self.set_nodes(nodes)
+
+    def set_nodes(self, nodes: Iterable[str]):
+        """Rebuild the ring; only ~1/N of keys move when one node changes"""
+        self.nodes = sorted(set(nodes))
+        points = sorted(
+            (_hash(f"{node}#{i}"), node)
+            for node in self.nodes
+            for i in range(self.virtual_nodes)
+        )
+        self._hashes = [h for h, _ in points]
+        self._owners = [node for _, node in points]
+
+    def node_for(self, key: str) -> Optional[str]:
+        """Get the node that owns a key"""
+        if not self._hashes:
+            return None
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._owners[index]
+
+
+class ShardRouter:
+    """
+    Maps session IDs to workers and forwards requests to their owner.
+
+    Each worker runs as its own process with its own URL (`worker_url`),
+    and all workers are configured with the same `worker_urls`. Sharding is
+    disabled with fewer than two workers.
+
+    Workers authenticate to each other with a shared `secret`: forwarded
+    requests carry it, and the worker set can only be replaced by callers
+    that present it, with URLs on `allowed_hosts` (the configured workers'
+    hosts plus any extra hosts).
+    """
+
+    def __init__(
+        self,
+        self_url: str = "",
+        worker_urls: Iterable[str] = (),
+        mode: str = "forward",
+        virtual_nodes: int = 100,
+        secret: str = "",
+        allowed_hosts: Iterable[str] = ()
+    ):
+        self.self_url = self_url.rstrip("/")
+        self.mode = mode
+        worker_urls = [url.rstrip("/") for url in worker_urls]
+        self.ring = HashRing(worker_urls, virtual_nodes=virtual_nodes)
+        self.secret = secret
+        self.allowed_hosts = {
+            urlsplit(url).hostname for url in [self.self_url, *worker_urls] if url
+        } | set(allowed_hosts)
+        self._client: Optional[httpx.AsyncClient] = None
+        self.forwarded = 0
+        self.redirected = 0
+        self.loops = 0
+        if self.enabled and not secret:
+            logger.warning(
+                "Sharding is enabled without CLUSTER_SECRET: forwarded requests "
+                "are not trusted and worker set changes are refused"
+            )
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.self_url) and len(self.ring.nodes) > 1
+
+    def owner(self, session_id: str) -> str:
+        """Get the URL of the worker that owns a session"""
+        if not self.enabled:
+            return self.self_url
+        return self.ring.node_for(session_id)
+
+    def is_local(self, session_id: str) -> bool:
+        """Check whether this worker owns a session"""
+        return not self.enabled or self.owner(session_id) == self.self_url
+
+    def is_trusted(self, headers) -> bool:
+        """Whether a request carries the cluster secret"""
+        presented = headers.get(CLUSTER_SECRET_HEADER)
+        return bool(self.secret) and presented is not None and hmac.compare_digest(
+            presented.encode("utf-8"), self.secret.encode("utf-8")
+        )
+
+    def check_workers(self, worker_urls: Iterable[str]):
+        """
+        Raises:
+            ValueError: If a URL is not http(s) on an allowed host
+        """
+        for url in worker_urls:
+            parts = urlsplit(url)
+            if parts.scheme not in ("http", "https") or parts.hostname not in self.allowed_hosts:
+                raise ValueError(f"Worker URL not allowed: {url}")
+
+    def rebalance(self, worker_urls: Iterable[str], local_sessions: Iterable[str]) -> List[str]:
+        """
+        Replace the worker set (callers check `is_trusted` and
+        `check_workers` first).
+
+        Returns:
+            Local session IDs that are now owned by another worker
+        """
+        self.ring.set_nodes(url.rstrip("/") for url in worker_urls)
+        moved = [sid for sid in local_sessions if not self.is_local(sid)]
+        logger.info(
+            f"Rebalanced to {len(self.ring.nodes)} workers, "
+            f"{len(moved)} local sessions moved"
+        )
+        return moved
+
+    async def route(self, request: Request, session_id: str) -> Optional[Response]:
+        """
+        Forward or redirect a request that belongs to another worker.
+
+        Returns:
+            The response to send, or None if this worker should handle it
+        """
+        if self.is_local(session_id):
+            return None
+        chain = [
+            url.strip() for url in request.headers.get(FORWARDED_HEADER, "").split(",")
+            if url.strip()
+        ]
+        if chain and self.is_trusted(request.headers):
+            return None
+        if self.self_url in chain:
+            # Workers disagree on the owner (e.g. during a membership
+            # change); handle it here rather than bounce it back again
+            self.loops += 1
+            logger.warning(
+                f"Session {session_id} came back after {len(chain)} forwards, "
+                f"handling it locally"
+            )
+            return None
+
+        owner = self.owner(session_id)
+        url = f"{owner}{request.url.path}"
+        if request.url.query:
+            url += f"?{request.url.query}"
+
+        if self.mode == "redirect":
+            self.redirected += 1
+            return RedirectResponse(url, status_code=307)
+
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=get_settings().agent_timeout_seconds
+            )
+        headers = {
+            k: v for k, v in request.headers.items()
+            if k.lower() not in HOP_HEADERS | {FORWARDED_HEADER, CLUSTER_SECRET_HEADER}
+        }
+        headers[FORWARDED_HEADER] = ", ".join(chain + [self.self_url])
+        if self.secret:
+            headers[CLUSTER_SECRET_HEADER] = self.secret
+        upstream = await self._client.request(
+            request.method,
+            url,
+            headers=headers,
+            content=await request.body()
+        )
+        self.forwarded += 1
+        return Response(
+            content=upstream.content,
+            status_code=upstream.status_code,
+            headers={
+                k: v for k, v in upstream.headers.items() if k.lower() not in HOP_HEADERS
+            }
+        )
+
+    def websocket_url(self, session_id: str, path: str) -> str:
+        """WebSocket URL of the worker that owns a session"""
+        owner = self.owner(session_id)
+        return owner.replace("http://", "ws://", 1).replace("https://", "wss://", 1) + path
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+
+    def get_stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "self": self.self_url,
+            "workers": list(self.ring.nodes),
+            "mode": self.mode,
+            "forwarded": self.forwarded,
+            "redirected": self.redirected,
+            "loops": self.loops,
+        }
+
+
+# Global shard router instance
+_shard_router = None
+
+
+def get_shard_router() -> ShardRouter:
+    """Get global shard router instance"""
+    global _shard_router
+    if _shard_router is None:
+        settings = get_settings()
+        _shard_router = ShardRouter(
+            self_url=settings.worker_url,
+            worker_urls=[u.strip() for u in settings.worker_urls.split(",") if u.strip()],
+            mode=settings.shard_mode,
+            virtual_nodes=settings.shard_virtual_nodes,
+            secret=settings.cluster_secret,
+            allowed_hosts=[
+                h.strip() for h in settings.cluster_allowed_hosts.split(",") if h.strip()
+            ]
+        )
+    return _shard_router
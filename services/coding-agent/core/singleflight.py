@@ -0,0 +1,155 @@
+"""
+In-flight request coalescing (singleflight)
+"""
+
+from typing import AsyncIterator, Callable, Dict, Hashable, List, Optional
+import asyncio
+import hashlib
+import json
+import logging
+
+from schemas.internal import NotebookContext
+
+logger = logging.getLogger(__name__)
+
+
+def request_key(
+    api_key: str,
+    query: str,
+    context: NotebookContext,
+    *extra
+) -> str:
+    """
+    Key identifying an agent request.
+
+    Two requests share a key only if everything that can change the answer
+    matches: API key, session, query text and notebook context.
+    """
+    payload = json.dumps([
+        api_key,
+        context.session_id,
+        context.notebook_id,
+        query,
+        sorted(context.variables.items()),
+        context.last_error,
+        context.cell_count,
+        context.current_cell,
+        context.current_cell_source,
+        context.full_context_refresh,
+        *extra,
+    ], default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    """One upstream execution and the messages it has produced so far"""
+
+    def __init__(self):
+        self.messages: List = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.changed = asyncio.Condition()
+        self.task: Optional[asyncio.Task] = None
+
+
+class SingleFlight:
+    """
+    Shares one execution among concurrent identical requests.
+
+    The first request for a key (the leader) starts the producer in a
+    background task; requests arriving while it runs subscribe to it. Every
+    subscriber receives the full message stream, including messages produced
+    before it joined. The execution is cancelled once all subscribers have
+    gone away. Nothing is cached after completion: a request that arrives
+    later runs again.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def run(
+        self,
+        key: Hashable,
+        producer: Callable[[], AsyncIterator]
+    ) -> AsyncIterator:
+        """
+        Stream the messages of the execution for `key`.
+
+        Args:
+            key: Request key (see `request_key`)
+            producer: Starts the execution; only called for the leader
+
+        Yields:
+            Messages from the shared execution
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight()
+            self._flights[key] = flight
+            flight.task = asyncio.create_task(self._pump(key, flight, producer))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+            logger.info("Coalesced duplicate request into in-flight execution")
+
+        flight.subscribers += 1
+        index = 0
+        try:
+            while True:
+                async with flight.changed:
+                    await flight.changed.wait_for(
+                        lambda: index < len(flight.messages) or flight.done
+                    )
+                    pending = flight.messages[index:]
+                    finished = flight.done
+                for message in pending:
+                    yield message
+                index += len(pending)
+                if finished and index >= len(flight.messages):
+                    break
+            if flight.error is not None:
+                raise flight.error
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                flight.task.cancel()
+
+    async def _pump(self, key: Hashable, flight: _Flight, producer: Callable[[], AsyncIterator]):
+        try:
+            async for message in producer():
+                async with flight.changed:
+                    flight.messages.append(message)
+                    flight.changed.notify_all()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            flight.error = e
+        finally:
+            # Later identical requests start a fresh execution
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            async with flight.changed:
+                flight.done = True
+                flight.changed.notify_all()
+
+    def get_stats(self) -> Dict:
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+        }
+
+
+# Global singleflight instance
+_singleflight = None
+
+
+def get_singleflight() -> SingleFlight:
+    """Get global singleflight instance"""
+    global _singleflight
+    if _singleflight is None:
+        _singleflight = SingleFlight()
+    return _singleflight
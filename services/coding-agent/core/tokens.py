@@ -0,0 +1,14 @@
+"""
+Cheap token estimates for prompt budgeting
+"""
+
+# Claude tokenizers average roughly four characters per token for English
+# prose and code; close enough for budgeting without a network round trip.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the token count of a string"""
+    if not text:
+        return 0
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
@@ -0,0 +1,70 @@
+"""
+Offline bulk job: run QuickExecutor prompts through the message batch API
+
+Input is a JSONL file with one item per line:
+    {"id": "eval-1", "query": "...", "context": {"notebook_id": "...", "session_id": "...", ...}}
+(`id`, `history` and `summary` are optional). Results go to
+OUTPUT_DIR/results.jsonl; the submitted batch IDs to OUTPUT_DIR/manifest.json.
+
+Usage:
+    python -m jobs.offline_batch items.jsonl --output-dir out/ [--provider stub]
+    python -m jobs.offline_batch --resume --output-dir out/
+"""
+
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import logging
+
+from core.config import get_settings
+from core.clients import get_client
+from core.offline_batch import (
+    AnthropicBatchProvider, OfflineBatchRunner, StubBatchProvider, load_items
+)
+from agents import QuickExecutor
+
+
+async def main(args: argparse.Namespace):
+    settings = get_settings()
+    if args.provider == "stub":
+        provider = StubBatchProvider()
+    else:
+        provider = AnthropicBatchProvider(get_client())
+
+    runner = OfflineBatchRunner(
+        provider,
+        QuickExecutor(),
+        output_dir=args.output_dir,
+        poll_interval=(
+            args.poll_interval if args.poll_interval is not None
+            else settings.offline_batch_poll_seconds
+        ),
+        chunk_size=settings.offline_batch_max_requests
+    )
+
+    if args.resume:
+        summary = await runner.collect()
+    else:
+        summary = await runner.run(load_items(args.input))
+
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("input", type=Path, nargs="?", help="JSONL file of items")
+    parser.add_argument("--output-dir", type=Path, required=True)
+    parser.add_argument("--provider", choices=["anthropic", "stub"], default="anthropic")
+    parser.add_argument("--poll-interval", type=float, default=None)
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Collect batches listed in an existing manifest instead of submitting"
+    )
+    args = parser.parse_args()
+    if not args.resume and args.input is None:
+        parser.error("input is required unless --resume is given")
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(args))
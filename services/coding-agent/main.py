@@ -2,16 +2,35 @@
 FastAPI server for the coding agent service
 """
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import ValidationError
+from contextlib import asynccontextmanager
+import asyncio
 import logging
 import json
-from typing import Optional
-
-from core import AgentOrchestrator, get_settings
+import math
+from typing import Dict, Optional
+
+from core import get_orchestrator, get_settings
+from core.cascade import get_cascade_stats
+from core.clients import get_client_registry
+from core.deadline import deadline_scope
+from core.orchestrator import get_orchestrator_stats
+from core.output_budget import get_output_budget_stats
+from core.router import get_router_stats
+from core.rate_limit import get_rate_limit_stats
+from core.resilience import get_llm_call_stats
+from core.route_cache import get_route_cache
+from core.scheduler import get_scheduler
 from core.session_manager import get_session_manager
-from schemas.requests import QuickQueryRequest, NotebookContextData, ApprovalResponse
+from core.sharding import get_shard_router
+from agents.cell_patch import get_cell_patch_stats
+from agents.code_check import get_code_check_stats
+from schemas.requests import (
+    QueryRequest, QuickQueryRequest, BatchQueryRequest, NotebookContextData, ApprovalResponse, ClusterWorkersRequest
+)
 from schemas.responses import AgentResponse, AgentMessage, MessageType
 from schemas.internal import NotebookContext
 
@@ -22,11 +41,24 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm pooled API connections on startup; close them and flush sessions on shutdown"""
+    registry = get_client_registry()
+    await registry.warm()
+    yield
+    await registry.aclose()
+    await get_shard_router().aclose()
+    get_session_manager().close()
+
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Socio Coding Agent",
     description="LLM-powered coding assistant for marimo notebooks",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -41,6 +73,13 @@ app.add_middleware(
 settings = get_settings()
 
 
+def request_timeout(requested: Optional[float] = None) -> float:
+    """End-to-end deadline for a query: the client's, capped by the server's"""
+    if requested:
+        return min(requested, settings.agent_timeout_seconds)
+    return settings.agent_timeout_seconds
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -57,7 +96,11 @@ async def root():
         "endpoints": {
             "health": "/health",
             "quick_query": "/api/agent/quick (POST)",
+            "batch_query": "/api/agent/batch (POST, NDJSON)",
             "stream": "/api/agent/stream (WebSocket)",
+            "stats": "/api/stats (GET)",
+            "cluster": "/api/cluster (GET)",
+            "cluster_workers": "/api/cluster/workers (PUT)",
             "session_info": "/api/sessions/{session_id} (GET)",
             "session_history": "/api/sessions/{session_id}/history (GET)",
             "clear_session": "/api/sessions/{session_id} (DELETE)"
@@ -65,11 +108,66 @@ async def root():
     }
 
 
+@app.get("/api/stats")
+async def get_stats():
+    """Runtime statistics for capacity planning"""
+    return {
+        "cascade": get_cascade_stats(),
+        "cell_patches": get_cell_patch_stats(),
+        "clients": get_client_registry().get_stats(),
+        "code_checks": get_code_check_stats(),
+        "orchestrator": get_orchestrator_stats(),
+        "output_budgets": get_output_budget_stats(),
+        "rate_limits": get_rate_limit_stats(),
+        "llm_calls": get_llm_call_stats(),
+        "router": get_router_stats(),
+        "route_cache": get_route_cache().get_stats(),
+        "scheduler": get_scheduler().get_stats(),
+        "sessions": get_session_manager().get_stats(),
+        "sharding": get_shard_router().get_stats(),
+    }
+
+
+@app.get("/api/cluster")
+async def get_cluster():
+    """Worker set used for session affinity"""
+    return get_shard_router().get_stats()
+
+
+@app.put("/api/cluster/workers")
+async def set_cluster_workers(body: ClusterWorkersRequest, request: Request):
+    """
+    Replace the worker set and release sessions now owned elsewhere.
+
+    Must be sent to every worker with the cluster secret. Released sessions
+    are reloaded by their new owner from the shared session store.
+    """
+    shard_router = get_shard_router()
+    if not shard_router.is_trusted(request.headers):
+        raise HTTPException(status_code=403, detail="Cluster secret required")
+    try:
+        shard_router.check_workers(body.workers)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    session_manager = get_session_manager()
+    moved = shard_router.rebalance(
+        body.workers,
+        list(session_manager.sessions)
+    )
+    await session_manager.release_sessions(moved)
+    return {"workers": shard_router.ring.nodes, "released_sessions": len(moved)}
+
+
 @app.get("/api/sessions/{session_id}")
-async def get_session_info(session_id: str):
+async def get_session_info(session_id: str, request: Request):
     """Get session information"""
+    forwarded = await get_shard_router().route(request, session_id)
+    if forwarded is not None:
+        return forwarded
+
     session_manager = get_session_manager()
-    info = session_manager.get_session_info(session_id)
+    info = await session_manager.get_session_info(session_id)
 
     if info is None:
         raise HTTPException(status_code=404, detail="Session not found")
@@ -80,15 +178,20 @@ async def get_session_info(session_id: str):
 @app.get("/api/sessions/{session_id}/history")
 async def get_session_history(
     session_id: str,
+    request: Request,
     max_turns: int = 20
 ):
     """Get conversation history for a session"""
+    forwarded = await get_shard_router().route(request, session_id)
+    if forwarded is not None:
+        return forwarded
+
     session_manager = get_session_manager()
 
-    if session_id not in session_manager.sessions:
+    if not await session_manager.has_session(session_id):
         raise HTTPException(status_code=404, detail="Session not found")
 
-    history = session_manager.get_conversation_context(session_id, max_turns)
+    history = await session_manager.get_conversation_context(session_id, max_turns)
 
     return {
         "session_id": session_id,
@@ -98,8 +201,12 @@ async def get_session_history(
 
 
 @app.delete("/api/sessions/{session_id}")
-async def clear_session(session_id: str):
+async def clear_session(session_id: str, request: Request):
     """Clear a session and its history"""
+    forwarded = await get_shard_router().route(request, session_id)
+    if forwarded is not None:
+        return forwarded
+
     session_manager = get_session_manager()
     session_manager.clear_session(session_id)
 
@@ -107,27 +214,46 @@ async def clear_session(session_id: str):
 
 
 @app.post("/api/agent/quick")
-async def quick_query(request: QuickQueryRequest) -> JSONResponse:
+async def quick_query(request: QuickQueryRequest, http_request: Request) -> JSONResponse:
     """
     Non-streaming endpoint for quick queries.
 
     Args:
         request: Query request with context
+        http_request: Raw request, forwarded if another worker owns the session
 
     Returns:
         Complete agent response
     """
+    forwarded = await get_shard_router().route(
+        http_request,
+        request.context.session_id
+    )
+    if forwarded is not None:
+        return forwarded
+
     try:
         # Convert context
         context = NotebookContext(**request.context.model_dump())
 
-        # Create orchestrator (with optional user API key)
-        orchestrator = AgentOrchestrator(api_key=request.api_key)
+        # Get orchestrator (with optional user API key)
+        orchestrator = get_orchestrator(request.api_key)
 
-        # Collect all messages
+        # Collect all messages (deltas are only useful when streaming)
         messages = []
-        async for message in orchestrator.handle_query(request.query, context):
-            messages.append(message.model_dump())
+        with deadline_scope(request_timeout(request.timeout_seconds)):
+            async for message in orchestrator.handle_query(request.query, context):
+                if message.type == MessageType.TEXT_DELTA:
+                    continue
+                if message.type == MessageType.ERROR and "retry_after" in message.content:
+                    # Shed or rate limited: tell the client when to come back
+                    retry_after = message.content["retry_after"]
+                    return JSONResponse(
+                        status_code=503,
+                        content=message.content,
+                        headers={"Retry-After": str(math.ceil(retry_after))}
+                    )
+                messages.append(message.model_dump())
 
         # Build response
         response = AgentResponse(
@@ -144,6 +270,94 @@ async def quick_query(request: QuickQueryRequest) -> JSONResponse:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/agent/batch")
+async def batch_query(request: BatchQueryRequest) -> StreamingResponse:
+    """
+    Run many quick queries concurrently.
+
+    Results are streamed as NDJSON, one line per query in completion order,
+    each tagged with the query's `index` in the request. Queries for the
+    same session run one after another so its history stays ordered.
+    Queries are admitted at background priority, so a large batch cannot
+    crowd out interactive requests.
+    Queries for sessions owned by another worker are not run here; their
+    line carries an error and the owner's URL.
+
+    Args:
+        request: Queries and optional parallelism limit
+
+    Returns:
+        NDJSON stream of agent responses
+    """
+    settings = get_settings()
+    if len(request.queries) > settings.batch_max_queries:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch exceeds {settings.batch_max_queries} queries"
+        )
+
+    concurrency = min(
+        request.max_concurrency or settings.batch_max_concurrency,
+        settings.batch_max_concurrency
+    )
+    semaphore = asyncio.Semaphore(concurrency)
+    session_locks: Dict[str, asyncio.Lock] = {}
+    results: asyncio.Queue = asyncio.Queue()
+    shard_router = get_shard_router()
+
+    async def run(index: int, item: QuickQueryRequest) -> Dict:
+        session_id = item.context.session_id
+        if not shard_router.is_local(session_id):
+            return {
+                "index": index,
+                "error": "Session is owned by another worker",
+                "owner": shard_router.owner(session_id),
+            }
+
+        lock = session_locks.setdefault(session_id, asyncio.Lock())
+        async with lock, semaphore:
+            context = NotebookContext(**item.context.model_dump())
+            orchestrator = get_orchestrator(item.api_key)
+            # The deadline starts when the query starts, not while it queues
+            with deadline_scope(request_timeout(item.timeout_seconds)):
+                messages = [
+                    message async for message in orchestrator.handle_query(
+                        item.query, context, batch=True
+                    )
+                    if message.type != MessageType.TEXT_DELTA
+                ]
+        response = AgentResponse(
+            query=item.query,
+            route="unknown",
+            messages=messages,
+            session_id=session_id
+        )
+        return {"index": index, **response.model_dump()}
+
+    async def run_and_report(index: int, item: QuickQueryRequest):
+        try:
+            result = await run(index, item)
+        except Exception as e:
+            logger.error(f"Error in batch query {index}: {e}", exc_info=True)
+            result = {"index": index, "error": str(e)}
+        await results.put(result)
+
+    async def stream():
+        tasks = [
+            asyncio.create_task(run_and_report(index, item))
+            for index, item in enumerate(request.queries)
+        ]
+        try:
+            for _ in tasks:
+                yield json.dumps(await results.get(), default=str) + "\n"
+        finally:
+            # Client went away: stop queries that have not finished
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
 @app.websocket("/api/agent/stream")
 async def stream_agent(websocket: WebSocket):
     """
@@ -151,7 +365,8 @@ async def stream_agent(websocket: WebSocket):
 
     Protocol:
     1. Client sends query message
-    2. Server streams AgentMessage objects
+    2. Server streams AgentMessage objects (text_delta messages as tokens
+       arrive, then the aggregated thinking message and usage)
     3. If approval needed, server sends approval_needed message
     4. Client sends approval response
     5. Server continues execution
@@ -167,49 +382,69 @@ async def stream_agent(websocket: WebSocket):
             message_type = data.get("type")
 
             if message_type == "query":
-                # Extract query and context
-                query = data.get("query")
-                context_data = data.get("context")
-                require_high_quality = data.get("require_high_quality", False)
-                api_key = data.get("api_key")
-
-                if not query or not context_data:
+                if not data.get("query") or not data.get("context"):
                     await websocket.send_json({
                         "type": "error",
                         "content": {"error": "Missing query or context"}
                     })
                     continue
 
-                # Convert context
-                context = NotebookContext(**context_data)
+                # Same validation as HTTP requests (e.g. timeout_seconds > 0)
+                try:
+                    request = QueryRequest(**data)
+                except ValidationError as e:
+                    await websocket.send_json({
+                        "type": "error",
+                        "content": {"error": f"Invalid query: {e}"}
+                    })
+                    continue
 
-                # Create orchestrator
-                orchestrator = AgentOrchestrator(api_key=api_key)
+                # Convert context
+                context = NotebookContext(**request.context.model_dump())
 
-                # Stream responses
-                async for message in orchestrator.handle_query(
-                    query,
-                    context,
-                    require_high_quality
-                ):
-                    # Send message to client
+                # Sessions are pinned to one worker; point the client there
+                shard_router = get_shard_router()
+                if not shard_router.is_local(context.session_id):
                     await websocket.send_json({
-                        "type": message.type.value,
-                        "content": message.content,
-                        "metadata": message.metadata
+                        "type": "error",
+                        "content": {
+                            "error": "Session is owned by another worker",
+                            "redirect": shard_router.websocket_url(
+                                context.session_id,
+                                websocket.url.path
+                            )
+                        }
                     })
+                    continue
+
+                # Get orchestrator
+                orchestrator = get_orchestrator(request.api_key)
 
-                    # If approval needed, wait for response
-                    if message.type == MessageType.APPROVAL_NEEDED:
-                        approval_data = await websocket.receive_json()
-
-                        if approval_data.get("type") == "approval":
-                            approval = ApprovalResponse(**approval_data.get("data", {}))
-                            # TODO: Pass approval to orchestrator
-                            # For Phase 2 when planning is implemented
-                        elif approval_data.get("type") == "cancel":
-                            logger.info("User cancelled operation")
-                            break
+                # Stream responses
+                with deadline_scope(request_timeout(request.timeout_seconds)):
+                    async for message in orchestrator.handle_query(
+                        request.query,
+                        context,
+                        request.require_high_quality
+                    ):
+                        # Send message to client
+                        await websocket.send_json({
+                            "type": message.type.value,
+                            "content": message.content,
+                            "metadata": message.metadata
+                        })
+
+                        # If approval needed, wait for response
+                        if message.type == MessageType.APPROVAL_NEEDED:
+                            approval_data = await websocket.receive_json()
+
+                            if approval_data.get("type") == "approval":
+                                approval = ApprovalResponse(**approval_data.get("data", {}))
+                                # TODO: Pass approval to orchestrator
+                                # For Phase 2 when planning is implemented
+                            elif approval_data.get("type") == "cancel":
+                                logger.info("User cancelled operation")
+                                break
 
             elif message_type == "cancel":
                 logger.info("Received cancel message")
@@ -3,6 +3,7 @@ from .system_prompts import (
     QUICK_EXECUTOR_PROMPT,
     PLANNER_PROMPT,
     EXECUTOR_PROMPT,
+    HISTORY_SUMMARIZER_PROMPT,
 )
 from .router_prompts import ROUTER_SYSTEM_PROMPT
 from .design_space import (
@@ -16,6 +17,7 @@ __all__ = [
     "QUICK_EXECUTOR_PROMPT",
     "PLANNER_PROMPT",
     "EXECUTOR_PROMPT",
+    "HISTORY_SUMMARIZER_PROMPT",
     "ROUTER_SYSTEM_PROMPT",
     "SEMANTIC_PRECISION_GUIDELINES",
     "RHETORICAL_PERSUASION_GUIDELINES",
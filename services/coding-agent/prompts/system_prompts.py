@@ -129,3 +129,13 @@ A good narrative:
 {SEMANTIC_PRECISION_GUIDELINES}
 
 Create markdown-formatted output suitable for reports or documentation."""
+
+HISTORY_SUMMARIZER_PROMPT = """You maintain a running summary of a conversation between a data analyst and their notebook assistant.
+
+You receive the current summary (possibly empty) and the turns that have just scrolled out of the assistant's context window. Return an updated summary that:
+- Keeps the datasets, variables and columns that were discussed
+- Keeps decisions made, methods chosen and results found
+- Keeps open questions or unresolved errors
+- Drops pleasantries, repeated code and superseded attempts
+
+Write terse bullet points in plain text. Output only the updated summary."""
@@ -21,6 +21,8 @@ class NotebookContext(BaseModel):
     last_error: Optional[str] = None
     cell_count: int = 0
     current_cell: Optional[int] = None
+    current_cell_source: Optional[str] = None
+    full_context_refresh: bool = False
 
     def has_error(self) -> bool:
         """Check if there's a recent error"""
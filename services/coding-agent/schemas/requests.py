@@ -21,6 +21,14 @@ class NotebookContextData(BaseModel):
         None,
         description="Current cell index"
     )
+    current_cell_source: Optional[str] = Field(
+        None,
+        description="Source of the current cell; quick fixes to it are returned as a patched cell"
+    )
+    full_context_refresh: bool = Field(
+        False,
+        description="Send the full variable list instead of changes since the last turn"
+    )
     notebook_id: str = Field(
         ...,
         description="Unique notebook identifier"
@@ -50,6 +58,11 @@ class QueryRequest(BaseModel):
         None,
         description="Optional user-provided API key to override default"
     )
+    timeout_seconds: Optional[float] = Field(
+        None,
+        gt=0,
+        description="Deadline for the whole query (capped by the server's agent_timeout_seconds)"
+    )
 
 
 class QuickQueryRequest(BaseModel):
@@ -67,6 +80,25 @@ class QuickQueryRequest(BaseModel):
         None,
         description="Optional user-provided API key"
     )
+    timeout_seconds: Optional[float] = Field(
+        None,
+        gt=0,
+        description="Deadline for the whole query (capped by the server's agent_timeout_seconds)"
+    )
+
+
+class BatchQueryRequest(BaseModel):
+    """Many quick queries run concurrently, results streamed as NDJSON"""
+
+    queries: List[QuickQueryRequest] = Field(
+        ...,
+        description="Queries to run; queries for the same session run in order"
+    )
+    max_concurrency: Optional[int] = Field(
+        None,
+        ge=1,
+        description="Queries run at once (capped by the server's batch_max_concurrency)"
+    )
 
 
 class StreamMessage(BaseModel):
@@ -93,3 +125,12 @@ class ApprovalResponse(BaseModel):
         None,
         description="User's requested modifications to the plan"
     )
+
+
+class ClusterWorkersRequest(BaseModel):
+    """New worker set for session sharding"""
+
+    workers: List[str] = Field(
+        ...,
+        description="Base URLs of all workers, e.g. http://10.0.0.5:8000"
+    )
@@ -6,6 +6,7 @@ from enum import Enum
 class MessageType(str, Enum):
     """Types of messages that can be streamed"""
     THINKING = "thinking"
+    TEXT_DELTA = "text_delta"
     PLAN = "plan"
     APPROVAL_NEEDED = "approval_needed"
     CODE = "code"
@@ -110,6 +111,8 @@ class UsageStats(BaseModel):
 
     input_tokens: int
     output_tokens: int
+    cache_creation_input_tokens: int = 0
+    cache_read_input_tokens: int = 0
     total_tokens: int
     estimated_cost_usd: float
 
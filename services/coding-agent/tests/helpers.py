@@ -0,0 +1,48 @@
+"""
+Test doubles for the Anthropic client, shared by the agent tests
+"""
+
+from types import SimpleNamespace
+
+
+class FakeStream:
+    """Minimal stand-in for the SDK's AsyncMessageStream"""
+
+    def __init__(self, chunks, stop_reason="end_turn"):
+        self.chunks = chunks
+        self.stop_reason = stop_reason
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    @property
+    async def text_stream(self):
+        for chunk in self.chunks:
+            yield chunk
+
+    async def get_final_message(self):
+        return SimpleNamespace(
+            content=[SimpleNamespace(text="".join(self.chunks))],
+            stop_reason=self.stop_reason,
+            usage=SimpleNamespace(
+                input_tokens=10,
+                output_tokens=4,
+                cache_creation_input_tokens=0,
+                cache_read_input_tokens=500,
+            ),
+        )
+
+
+class ReplyMessages:
+    """Each call to stream() answers with the next reply"""
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.calls = []
+
+    def stream(self, **kwargs):
+        self.calls.append(kwargs)
+        return FakeStream([self.replies.pop(0)])
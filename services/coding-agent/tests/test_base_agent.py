@@ -0,0 +1,337 @@
+"""
+Tests for BaseAgent streaming
+"""
+
+import asyncio
+import pytest
+from types import SimpleNamespace
+
+import anthropic
+import httpx
+
+from core import get_settings
+from core.deadline import deadline_scope
+from core.output_budget import output_budget, record_output
+from core.resilience import get_llm_call_stats
+from agents import base
+from agents.base import BaseAgent
+from schemas.internal import QueryRoute
+from schemas.responses import MessageType
+from tests.helpers import FakeStream
+
+
+class FakeMessages:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.calls = []
+
+    def stream(self, **kwargs):
+        self.calls.append(kwargs)
+        return FakeStream(self.chunks)
+
+
+class TestBaseAgentStreaming:
+    """Test incremental streaming from the agent"""
+
+    @pytest.mark.asyncio
+    async def test_deltas_then_aggregate_then_usage(self):
+        agent = BaseAgent(system_prompt="test")
+        fake = FakeMessages(["Hel", "lo"])
+        agent.client = SimpleNamespace(messages=fake)
+
+        messages = [
+            m async for m in agent.stream_response(
+                [{"role": "user", "content": "hi"}]
+            )
+        ]
+
+        types = [m.type for m in messages]
+        assert types == [
+            MessageType.TEXT_DELTA,
+            MessageType.TEXT_DELTA,
+            MessageType.THINKING,
+            MessageType.USAGE,
+        ]
+        assert messages[2].content == "Hello"
+        assert messages[3].content["output_tokens"] == 4
+        assert messages[3].content["cache_read_input_tokens"] == 500
+        assert messages[3].content["total_tokens"] == 514
+        assert fake.calls[0]["max_tokens"] == get_settings().max_tokens_per_request
+
+    @pytest.mark.asyncio
+    async def test_system_prompt_marked_cacheable(self):
+        agent = BaseAgent(system_prompt="static instructions")
+        fake = FakeMessages(["ok"])
+        agent.client = SimpleNamespace(messages=fake)
+
+        async for _ in agent.stream_response([{"role": "user", "content": "hi"}]):
+            pass
+
+        assert fake.calls[0]["system"] == [{
+            "type": "text",
+            "text": "static instructions",
+            "cache_control": {"type": "ephemeral"},
+        }]
+
+    @pytest.mark.asyncio
+    async def test_usage_priced_by_calling_model(self):
+        agent = BaseAgent(system_prompt="test", model="claude-sonnet-4-20250514")
+        agent.client = SimpleNamespace(messages=FakeMessages(["ok"]))
+        costs = {}
+        for model in ["claude-sonnet-4-20250514", "claude-3-5-haiku-20241022"]:
+            async for message in agent.stream_response(
+                [{"role": "user", "content": "hi"}], model=model
+            ):
+                if message.type == MessageType.USAGE:
+                    costs[model] = message.content["estimated_cost_usd"]
+
+        assert costs["claude-3-5-haiku-20241022"] < costs["claude-sonnet-4-20250514"]
+
+
+class ScriptedMessages:
+    """Each call to stream() plays the next script: a delay, then chunks or an error"""
+
+    def __init__(self, scripts):
+        self.scripts = list(scripts)
+        self.calls = []
+
+    def stream(self, **kwargs):
+        self.calls.append(kwargs)
+        delay, outcome = self.scripts.pop(0)
+        return DelayedStream(delay, outcome)
+
+
+class DelayedStream(FakeStream):
+    def __init__(self, delay, outcome):
+        super().__init__(outcome if isinstance(outcome, list) else [])
+        self.delay = delay
+        self.error = None if isinstance(outcome, list) else outcome
+
+    async def __aenter__(self):
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return self
+
+
+def overloaded_error():
+    request = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+    return anthropic.InternalServerError(
+        "Overloaded",
+        response=httpx.Response(529, request=request),
+        body=None
+    )
+
+
+class GatedMessages:
+    """The first `gated` calls all fail together once `gate` opens; later calls succeed"""
+
+    def __init__(self, gated, chunks):
+        self.gate = asyncio.Event()
+        self.gated = gated
+        self.chunks = chunks
+        self.calls = []
+
+    def stream(self, **kwargs):
+        self.calls.append(kwargs)
+        if len(self.calls) > self.gated:
+            return FakeStream(self.chunks)
+        return GatedStream(self.gate)
+
+
+class GatedStream(FakeStream):
+    def __init__(self, gate):
+        super().__init__([])
+        self.gate = gate
+
+    async def __aenter__(self):
+        await self.gate.wait()
+        raise overloaded_error()
+
+
+class SlowStartMessages:
+    """Streams that take `delay` to produce anything, recording how they ended"""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.outcomes = {"finished": 0, "cancelled": 0}
+
+    def stream(self, **kwargs):
+        return SlowStartStream(self)
+
+
+class SlowStartStream(FakeStream):
+    def __init__(self, messages):
+        super().__init__(["late"])
+        self.messages = messages
+
+    async def __aenter__(self):
+        try:
+            await asyncio.sleep(self.messages.delay)
+        except asyncio.CancelledError:
+            self.messages.outcomes["cancelled"] += 1
+            raise
+        self.messages.outcomes["finished"] += 1
+        return self
+
+
+class TestHedgingAndRetries:
+    """Test hedged requests, overload retries and deadlines"""
+
+    async def run(self, agent):
+        return [
+            m async for m in agent.stream_response([{"role": "user", "content": "hi"}])
+        ]
+
+    @pytest.mark.asyncio
+    async def test_slow_first_token_is_hedged(self, monkeypatch):
+        monkeypatch.setattr(base, "hedge_delay", lambda model: 0.02)
+        agent = BaseAgent(system_prompt="test")
+        fake = ScriptedMessages([(1.0, ["slow"]), (0.0, ["fast"])])
+        agent.client = SimpleNamespace(messages=fake)
+
+        messages = await self.run(agent)
+
+        assert len(fake.calls) == 2
+        assert messages[0].content == "fast"
+        assert get_llm_call_stats()["hedge_wins"] >= 1
+
+    @pytest.mark.asyncio
+    async def test_overload_is_retried_with_backoff(self, monkeypatch):
+        monkeypatch.setattr(base, "hedge_delay", lambda model: None)
+        monkeypatch.setattr(base, "backoff_delay", lambda attempt, error: 0.0)
+        agent = BaseAgent(system_prompt="test")
+        fake = ScriptedMessages([(0.0, overloaded_error()), (0.0, ["ok"])])
+        agent.client = SimpleNamespace(messages=fake)
+
+        messages = await self.run(agent)
+
+        assert len(fake.calls) == 2
+        assert messages[0].content == "ok"
+
+    @pytest.mark.asyncio
+    async def test_primary_and_hedge_failing_together_are_retried(self, monkeypatch):
+        monkeypatch.setattr(base, "hedge_delay", lambda model: 0.01)
+        monkeypatch.setattr(base, "backoff_delay", lambda attempt, error: 0.0)
+        agent = BaseAgent(system_prompt="test")
+        fake = GatedMessages(gated=2, chunks=["ok"])
+        agent.client = SimpleNamespace(messages=fake)
+
+        async def open_gate():
+            while len(fake.calls) < 2:
+                await asyncio.sleep(0.005)
+            fake.gate.set()
+
+        opener = asyncio.create_task(open_gate())
+        with deadline_scope(2.0):
+            messages = await asyncio.wait_for(self.run(agent), timeout=1.0)
+        await opener
+
+        assert len(fake.calls) == 3
+        assert messages[0].content == "ok"
+
+    @pytest.mark.asyncio
+    async def test_deadline_bounds_the_call(self, monkeypatch):
+        monkeypatch.setattr(base, "hedge_delay", lambda model: None)
+        agent = BaseAgent(system_prompt="test")
+        fake = ScriptedMessages([(1.0, ["late"])])
+        agent.client = SimpleNamespace(messages=fake)
+
+        loop = asyncio.get_running_loop()
+        begin = loop.time()
+        with deadline_scope(0.05):
+            messages = await self.run(agent)
+
+        assert loop.time() - begin < 0.5
+        assert [m.type for m in messages] == [MessageType.ERROR]
+        assert "deadline" in messages[0].content["error"]
+        assert fake.calls[0]["timeout"] <= 0.05
+
+
+    @pytest.mark.asyncio
+    async def test_cancelled_consumer_cancels_upstream(self, monkeypatch):
+        monkeypatch.setattr(base, "hedge_delay", lambda model: None)
+        agent = BaseAgent(system_prompt="test")
+        fake = SlowStartMessages(delay=0.5)
+        agent.client = SimpleNamespace(messages=fake)
+
+        consumer = asyncio.create_task(self.run(agent))
+        await asyncio.sleep(0.1)
+        consumer.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await consumer
+
+        assert fake.outcomes == {"finished": 0, "cancelled": 1}
+
+    @pytest.mark.asyncio
+    async def test_expired_deadline_cancels_upstream(self, monkeypatch):
+        monkeypatch.setattr(base, "hedge_delay", lambda model: None)
+        agent = BaseAgent(system_prompt="test")
+        fake = SlowStartMessages(delay=0.5)
+        agent.client = SimpleNamespace(messages=fake)
+
+        with deadline_scope(0.05):
+            messages = await self.run(agent)
+
+        assert [m.type for m in messages] == [MessageType.ERROR]
+        assert fake.outcomes == {"finished": 0, "cancelled": 1}
+
+
+class TruncatingMessages:
+    """Each call to stream() plays the next (chunks, stop_reason)"""
+
+    def __init__(self, scripts):
+        self.scripts = list(scripts)
+        self.calls = []
+
+    def stream(self, **kwargs):
+        self.calls.append(kwargs)
+        return FakeStream(*self.scripts.pop(0))
+
+
+class TestOutputBudget:
+    """Test per-route max_tokens and continuation of truncated responses"""
+
+    @pytest.mark.asyncio
+    async def test_truncated_response_is_continued(self):
+        agent = BaseAgent(system_prompt="test")
+        fake = TruncatingMessages([(["Hel "], "max_tokens"), (["lo"], "end_turn")])
+        agent.client = SimpleNamespace(messages=fake)
+        request = [{"role": "user", "content": "hi"}]
+
+        messages = [
+            m async for m in agent.stream_response(request, route=QueryRoute.QUICK_FIX)
+        ]
+
+        assert [m.content for m in messages if m.type == MessageType.TEXT_DELTA] == ["Hel ", "lo"]
+        assert messages[-2].content == "Hel lo"
+        assert messages[-2].metadata["stop_reason"] == "end_turn"
+        assert messages[-1].content["output_tokens"] == 8
+        assert fake.calls[0]["max_tokens"] == get_settings().output_budget_quick_fix
+        assert fake.calls[1]["messages"] == request + [{"role": "assistant", "content": "Hel"}]
+
+    @pytest.mark.asyncio
+    async def test_continuations_are_bounded(self):
+        agent = BaseAgent(system_prompt="test")
+        agent.max_continuations = 1
+        fake = TruncatingMessages([(["a"], "max_tokens"), (["b"], "max_tokens")])
+        agent.client = SimpleNamespace(messages=fake)
+
+        messages = [
+            m async for m in agent.stream_response(
+                [{"role": "user", "content": "hi"}], route=QueryRoute.EXPLAIN
+            )
+        ]
+
+        assert len(fake.calls) == 2
+        assert messages[-2].metadata["stop_reason"] == "max_tokens"
+
+    def test_budget_adapts_to_observed_lengths(self):
+        settings = get_settings()
+        route = QueryRoute.COMPLEX_EDA
+        assert output_budget(route) == settings.output_budget_complex_eda
+
+        for _ in range(30):
+            record_output(route, 1000, continuations=0, truncated=False)
+
+        assert output_budget(route) == int(1000 * settings.output_budget_headroom)
@@ -0,0 +1,135 @@
+"""
+Tests for the batch query endpoint
+"""
+
+import asyncio
+import json
+import pytest
+import httpx
+
+import main
+from core.orchestrator import AgentOrchestrator
+from core.scheduler import BACKGROUND, INTERACTIVE, STANDARD, Scheduler
+from schemas.internal import NotebookContext, QueryRoute
+from schemas.responses import AgentMessage, MessageType
+
+
+class FakeOrchestrator:
+    """Answers after a delay encoded in the query, tracking concurrency"""
+
+    def __init__(self):
+        self.running = 0
+        self.peak = 0
+
+    async def handle_query(self, query, context, require_high_quality=False, batch=False):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            await asyncio.sleep(float(query))
+            yield AgentMessage(type=MessageType.TEXT_DELTA, content="...")
+            yield AgentMessage(type=MessageType.THINKING, content=f"answer {query}")
+        finally:
+            self.running -= 1
+
+
+def make_item(query, session_id):
+    return {
+        "query": query,
+        "context": {"notebook_id": "nb", "session_id": session_id},
+    }
+
+
+async def post_batch(payload):
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.post("/api/agent/batch", json=payload)
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    return response, lines
+
+
+class TestBatchEndpoint:
+    """Test completion order, parallelism and per-session ordering"""
+
+    @pytest.mark.asyncio
+    async def test_results_stream_in_completion_order(self, monkeypatch):
+        orchestrator = FakeOrchestrator()
+        monkeypatch.setattr(main, "get_orchestrator", lambda api_key=None: orchestrator)
+
+        response, lines = await post_batch({
+            "queries": [
+                make_item("0.06", "a"),
+                make_item("0.01", "b"),
+                make_item("0.03", "c"),
+            ],
+            "max_concurrency": 3,
+        })
+
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        assert [line["index"] for line in lines] == [1, 2, 0]
+        # Deltas are dropped; the aggregated answer is kept
+        assert [m["type"] for m in lines[0]["messages"]] == ["thinking"]
+
+    @pytest.mark.asyncio
+    async def test_parallelism_limit_and_session_order(self, monkeypatch):
+        orchestrator = FakeOrchestrator()
+        monkeypatch.setattr(main, "get_orchestrator", lambda api_key=None: orchestrator)
+
+        _, lines = await post_batch({
+            "queries": [
+                make_item("0.03", "same"),
+                make_item("0.01", "same"),
+                make_item("0.01", "x"),
+                make_item("0.01", "y"),
+            ],
+            "max_concurrency": 2,
+        })
+
+        assert orchestrator.peak <= 2
+        order = [line["index"] for line in lines]
+        assert order.index(0) < order.index(1)
+
+
+class QuickRouter:
+    def classify_heuristic(self, query, context):
+        return QueryRoute.QUICK_FIX
+
+    async def classify(self, query, context):
+        return QueryRoute.QUICK_FIX
+
+
+class SleepingExecutor:
+    """Takes the number of seconds in the query to answer"""
+
+    async def execute(self, query, context, **kwargs):
+        await asyncio.sleep(float(query))
+        yield AgentMessage(type=MessageType.THINKING, content=f"answer {query}")
+
+
+class TestBatchPriority:
+    """Test that batch items do not crowd out interactive requests"""
+
+    @pytest.mark.asyncio
+    async def test_interactive_request_admitted_during_batch(self, monkeypatch):
+        orchestrator = AgentOrchestrator()
+        orchestrator.router = QuickRouter()
+        orchestrator.quick_executor = SleepingExecutor()
+        orchestrator.scheduler = Scheduler(
+            total_slots=2,
+            pools={INTERACTIVE: (2, 0.05), STANDARD: (2, 0.05), BACKGROUND: (1, 0.05)}
+        )
+        monkeypatch.setattr(main, "get_orchestrator", lambda api_key=None: orchestrator)
+
+        batch = asyncio.create_task(post_batch({
+            "queries": [make_item("0.1", f"batch-{i}") for i in range(4)],
+            "max_concurrency": 4,
+        }))
+        await asyncio.sleep(0.02)
+
+        context = NotebookContext(notebook_id="nb", session_id="interactive")
+        messages = [m async for m in orchestrator.handle_query("0.01", context)]
+        _, lines = await batch
+
+        assert [m.content for m in messages] == ["answer 0.01"]
+        # Batch items waited for the background slot instead of being shed
+        assert all(line["messages"][0]["content"].startswith("answer") for line in lines)
+        assert orchestrator.scheduler.get_stats()["classes"][BACKGROUND]["admitted"] == 4
@@ -0,0 +1,128 @@
+"""
+Tests for the fast-model cascade
+"""
+
+import pytest
+from types import SimpleNamespace
+
+from core.cascade import check_draft, get_cascade_stats
+from core.output_budget import get_output_budget_stats
+from agents import QuickExecutor
+from schemas.internal import NotebookContext, QueryRoute
+from schemas.responses import MessageType
+from tests.helpers import FakeStream
+
+
+class ModelMessages:
+    """Answers with a fixed text per model"""
+
+    def __init__(self, answers):
+        self.answers = answers
+        self.models = []
+
+    def stream(self, **kwargs):
+        self.models.append(kwargs["model"])
+        return FakeStream([self.answers[kwargs["model"]]])
+
+
+def make_executor(fast_answer, default_answer="default answer"):
+    executor = QuickExecutor()
+    executor.client = SimpleNamespace(messages=ModelMessages({
+        executor.fast_model: fast_answer,
+        executor.model: default_answer,
+    }))
+    return executor
+
+
+async def run(executor, route):
+    context = NotebookContext(notebook_id="nb", session_id="s")
+    return [m async for m in executor.execute("fix it", context, route=route)]
+
+
+class TestCheckDraft:
+    """Test the draft acceptance check"""
+
+    def test_confident_parsing_draft_accepted(self):
+        text = "Use:\n```python\nx = await load()\n```\nConfidence: high"
+        accepted, _, cleaned = check_draft(text, "end_turn")
+        assert accepted
+        assert "Confidence" not in cleaned
+
+    def test_low_confidence_rejected(self):
+        accepted, reason, _ = check_draft("Maybe x\nConfidence: low", "end_turn")
+        assert not accepted
+        assert reason == "low confidence"
+
+    def test_missing_rating_rejected(self):
+        accepted, _, _ = check_draft("x = 1", "end_turn")
+        assert not accepted
+
+    def test_unparseable_code_rejected(self):
+        text = "```python\ndef f(:\n```\nConfidence: high"
+        accepted, reason, _ = check_draft(text, "end_turn")
+        assert not accepted
+        assert reason.startswith("code does not parse")
+
+    def test_only_python_blocks_are_parsed(self):
+        # A cell-patch fix: the diff's closing fence must not open a block
+        text = (
+            "```diff\n@@ -1 +1 @@\n-print(df.colums)\n+print(df.columns)\n```\n"
+            "Fixes the typo: it's `columns`.\n"
+            "```python\ndf.head()\n```\nConfidence: high"
+        )
+        accepted, reason, _ = check_draft(text, "end_turn")
+        assert accepted, reason
+
+    def test_truncated_rejected(self):
+        accepted, reason, _ = check_draft("x\nConfidence: high", "max_tokens")
+        assert not accepted
+        assert reason == "truncated"
+
+
+class TestQuickExecutorCascade:
+    """Test drafting with the fast model and escalating"""
+
+    @pytest.mark.asyncio
+    async def test_accepted_draft_is_the_answer(self):
+        executor = make_executor("```python\nx = 1\n```\nConfidence: high")
+        before = get_cascade_stats().get("quick_fix", {}).get("drafts", 0)
+
+        messages = await run(executor, QueryRoute.QUICK_FIX)
+
+        assert executor.client.messages.models == [executor.fast_model]
+        deltas = [m.content for m in messages if m.type == MessageType.TEXT_DELTA]
+        assert deltas == ["```python\nx = 1\n```"]
+        assert messages[-1].type == MessageType.COMPLETE
+        assert get_cascade_stats()["quick_fix"]["drafts"] == before + 1
+
+    @pytest.mark.asyncio
+    async def test_rejected_draft_escalates(self):
+        executor = make_executor("not sure\nConfidence: low")
+
+        messages = await run(executor, QueryRoute.SIMPLE_CODE)
+
+        assert executor.client.messages.models == [executor.fast_model, executor.model]
+        deltas = [m.content for m in messages if m.type == MessageType.TEXT_DELTA]
+        assert deltas == ["default answer"]
+        usage = [m for m in messages if m.type == MessageType.USAGE]
+        assert usage[0].metadata == {"model": executor.fast_model, "escalated": True}
+        assert len(usage) == 2
+        assert get_cascade_stats()["simple_code"]["escalated"] >= 1
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("draft", ["x = 1\nConfidence: high", "x\nConfidence: low"])
+    async def test_only_the_returned_answer_counts_towards_budget(self, draft):
+        executor = make_executor(draft)
+        before = get_output_budget_stats().get("quick_fix", {}).get("responses", 0)
+
+        await run(executor, QueryRoute.QUICK_FIX)
+
+        assert get_output_budget_stats()["quick_fix"]["responses"] == before + 1
+
+    @pytest.mark.asyncio
+    async def test_other_routes_skip_the_cascade(self):
+        executor = make_executor("unused")
+
+        await run(executor, QueryRoute.EXPLAIN)
+
+        assert executor.client.messages.models == [executor.model]
@@ -0,0 +1,95 @@
+"""
+Tests for diff-based cell edits
+"""
+
+import pytest
+from types import SimpleNamespace
+
+from agents import QuickExecutor
+from agents.cell_patch import PatchError, apply_unified_diff, get_cell_patch_stats
+from schemas.internal import NotebookContext, QueryRoute
+from schemas.responses import MessageType
+from tests.helpers import ReplyMessages
+
+CELL = "import pandas as pd\n\ndf = load()\nprint(df.colums)\ndf.head()"
+
+
+class TestApplyUnifiedDiff:
+    """Test parsing and applying diffs to cell source"""
+
+    def test_applies_with_headers(self):
+        diff = "--- a/cell\n+++ b/cell\n@@ -3,3 +3,3 @@\n df = load()\n-print(df.colums)\n+print(df.columns)\n df.head()\n"
+        assert apply_unified_diff(CELL, diff) == CELL.replace("colums", "columns")
+
+    def test_wrong_line_numbers_are_tolerated(self):
+        diff = "@@ -1,2 +1,2 @@\n-print(df.colums)\n+print(df.columns)"
+        assert apply_unified_diff(CELL, diff) == CELL.replace("colums", "columns")
+
+    def test_blank_context_line_without_space(self):
+        diff = "@@ -1,3 +1,4 @@\n import pandas as pd\n+import numpy as np\n\n df = load()"
+        assert apply_unified_diff(CELL, diff).startswith("import pandas as pd\nimport numpy as np\n\ndf")
+
+    def test_insertion_at_top(self):
+        diff = "@@ -0,0 +1 @@\n+import numpy as np"
+        assert apply_unified_diff(CELL, diff) == "import numpy as np\n" + CELL
+
+    def test_mismatched_context_rejected(self):
+        diff = "@@ -4 +4 @@\n-print(df.columnz)\n+print(df.columns)"
+        with pytest.raises(PatchError):
+            apply_unified_diff(CELL, diff)
+
+    def test_malformed_diff_rejected(self):
+        with pytest.raises(PatchError):
+            apply_unified_diff(CELL, "print(df.columns)")
+
+
+class TestQuickExecutorCellPatch:
+    """Test quick fixes answered with a diff"""
+
+    async def run(self, replies):
+        executor = QuickExecutor()
+        executor.client = SimpleNamespace(messages=ReplyMessages(replies))
+        context = NotebookContext(
+            notebook_id="nb",
+            session_id="s",
+            variables={"load": "function"},
+            current_cell=3,
+            current_cell_source=CELL
+        )
+        messages = [
+            m async for m in executor.execute(
+                "AttributeError: colums", context, route=QueryRoute.QUICK_FIX
+            )
+        ]
+        return executor, messages
+
+    @pytest.mark.asyncio
+    async def test_diff_answer_returns_patched_cell(self):
+        before = get_cell_patch_stats()["applied"]
+        executor, messages = await self.run([
+            "```diff\n@@ -4 +4 @@\n-print(df.colums)\n+print(df.columns)\n```\n"
+            "Typo in `columns`.\nConfidence: high",
+        ])
+
+        prompt = executor.client.messages.calls[0]["messages"][-1]["content"]
+        assert CELL in prompt
+        assert "```diff" in prompt
+
+        code = [m for m in messages if m.type == MessageType.CODE]
+        assert [m.content for m in code] == [CELL.replace("colums", "columns")]
+        assert code[0].metadata["patched"] is True
+        assert code[0].metadata["cell"] == 3
+        assert get_cell_patch_stats()["applied"] == before + 1
+
+    @pytest.mark.asyncio
+    async def test_unappliable_diff_falls_back_to_full_cell(self):
+        fixed = CELL.replace("colums", "columns")
+        executor, messages = await self.run([
+            "```diff\n@@ -4 +4 @@\n-print(df.nope)\n+print(df.columns)\n```\nConfidence: high",
+            f"```python\n{fixed}\n```",
+        ])
+
+        assert len(executor.client.messages.calls) == 2
+        code = [m for m in messages if m.type == MessageType.CODE]
+        assert [m.content for m in code] == [fixed]
+        assert code[0].metadata["patched"] is False
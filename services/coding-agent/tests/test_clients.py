@@ -0,0 +1,100 @@
+"""
+Tests for the pooled client registry
+"""
+
+import httpx
+import pytest
+
+from core.clients import ClientRegistry
+from core.config import get_settings
+
+
+class FakeClient:
+    """Stands in for AsyncAnthropic; records whether it was closed"""
+
+    def __init__(self, api_key, http_client):
+        self.api_key = api_key
+        self.http_client = http_client
+        self.base_url = httpx.URL("https://api.example.test")
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(get_settings(), "client_pool_max_keys", 2)
+    monkeypatch.setattr(get_settings(), "client_pool_warm_connections", 3)
+    monkeypatch.setattr(
+        ClientRegistry, "_build", lambda self, key: FakeClient(key, self.http_client)
+    )
+    return ClientRegistry()
+
+
+class TestClientRegistry:
+    """Test the per-key LRU, the pinned default client and warming"""
+
+    def test_user_clients_are_reused_and_evicted_lru(self, registry):
+        first = registry.get("sk-user-1")
+        second = registry.get("sk-user-2")
+        assert registry.get("sk-user-1") is first
+
+        registry.get("sk-user-3")
+
+        assert list(registry.user_clients) == ["sk-user-1", "sk-user-3"]
+        assert registry.get("sk-user-2") is not second
+        stats = registry.get_stats()
+        assert stats["evictions"] == 2
+        assert stats["hits"] == 1
+        assert stats["misses"] == 4
+
+    def test_default_client_is_pinned(self, registry):
+        default = registry.get()
+
+        for i in range(5):
+            registry.get(f"sk-user-{i}")
+
+        assert registry.get() is default
+        assert registry.get(registry.default_api_key) is default
+        assert registry.default_api_key not in registry.user_clients
+        assert len(registry.user_clients) == 2
+
+    @pytest.mark.asyncio
+    async def test_evicted_clients_leave_the_shared_pool_open(self, registry):
+        evicted = registry.get("sk-user-1")
+        registry.get("sk-user-2")
+        registry.get("sk-user-3")
+
+        assert "sk-user-1" not in registry.user_clients
+        assert not evicted.closed
+        assert evicted.http_client is registry.http_client
+        assert not registry.http_client.is_closed
+
+        await registry.aclose()
+        assert registry.http_client.is_closed
+
+    @pytest.mark.asyncio
+    async def test_warm_opens_connections_to_the_api(self, registry):
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(404)
+
+        registry.http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        await registry.warm()
+
+        assert len(requests) == 3
+        assert all(r.method == "HEAD" for r in requests)
+        assert str(requests[0].url).startswith("https://api.example.test")
+
+    @pytest.mark.asyncio
+    async def test_warm_failures_are_not_raised(self, registry):
+        def handler(request):
+            raise httpx.ConnectError("unreachable", request=request)
+
+        registry.http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        await registry.warm()
@@ -0,0 +1,99 @@
+"""
+Tests for static checks and in-request repair of generated code
+"""
+
+import pytest
+from types import SimpleNamespace
+
+from agents import QuickExecutor
+from agents.code_check import check_code
+from schemas.internal import NotebookContext
+from schemas.responses import MessageType
+from tests.helpers import ReplyMessages
+
+
+class TestCheckCode:
+    """Test syntax and undefined-name checks"""
+
+    def test_clean_code_passes(self):
+        source = (
+            "import numpy as np\n"
+            "def scale(x, k=2):\n"
+            "    return [v * k for v in x]\n"
+            "total = sum(scale(df['a']))\n"
+            "await asyncio.sleep(0)"
+        )
+        assert check_code(source, {"df": "DataFrame", "asyncio": "module"}) == []
+
+    def test_syntax_error(self):
+        problems = check_code("df.groupby(", {"df": "DataFrame"})
+        assert len(problems) == 1
+        assert "SyntaxError" in problems[0]
+
+    def test_undefined_names(self):
+        problems = check_code("result = dff.merge(other)\nprint(result)", {"df": "DataFrame"})
+        assert problems == [
+            "NameError: name 'dff' is not defined",
+            "NameError: name 'other' is not defined",
+        ]
+
+    def test_star_import_disables_name_check(self):
+        assert check_code("from math import *\nprint(pi)", {}) == []
+
+
+class TestQuickExecutorRepair:
+    """Test holding back and repairing blocks that cannot run"""
+
+    async def run(self, replies, attempts=1):
+        executor = QuickExecutor()
+        executor.code_repair_attempts = attempts
+        executor.client = SimpleNamespace(messages=ReplyMessages(replies))
+        context = NotebookContext(notebook_id="nb", session_id="s", variables={"df": "DataFrame"})
+        messages = [m async for m in executor.execute("plot it", context)]
+        return executor, messages
+
+    @pytest.mark.asyncio
+    async def test_failing_block_is_repaired(self):
+        executor, messages = await self.run([
+            "```python\nprint(df.shape\n```\nShows the shape.",
+            "```python\nprint(df.shape)\n```",
+        ])
+
+        code = [m for m in messages if m.type == MessageType.CODE]
+        assert [m.content for m in code] == ["print(df.shape)"]
+        assert code[0].metadata["repaired"] is True
+        assert code[0].metadata["index"] == 0
+
+        repair_call = executor.client.messages.calls[1]
+        assert repair_call["messages"][-2]["role"] == "assistant"
+        assert "SyntaxError" in repair_call["messages"][-1]["content"]
+        assert messages[-1].type == MessageType.COMPLETE
+
+    @pytest.mark.asyncio
+    async def test_passing_blocks_skip_repair(self):
+        executor, messages = await self.run(["```python\nprint(df.shape)\n```"])
+
+        assert len(executor.client.messages.calls) == 1
+        code = [m for m in messages if m.type == MessageType.CODE]
+        assert code[0].metadata == {"language": "python", "index": 0, "complete": True}
+
+    @pytest.mark.asyncio
+    async def test_unrepaired_block_sent_with_problems(self):
+        executor, messages = await self.run([
+            "```python\nprint(df\n```",
+            "```python\nprint(df]\n```",
+        ])
+
+        code = [m for m in messages if m.type == MessageType.CODE]
+        assert [m.content for m in code] == ["print(df]"]
+        assert "SyntaxError" in code[0].metadata["problems"][0]
+
+    @pytest.mark.asyncio
+    async def test_undefined_names_are_only_warnings(self):
+        # `pd` may come from an earlier cell the client did not describe
+        executor, messages = await self.run(["```python\nprint(pd.DataFrame(df))\n```"])
+
+        assert len(executor.client.messages.calls) == 1
+        code = [m for m in messages if m.type == MessageType.CODE]
+        assert [m.content for m in code] == ["print(pd.DataFrame(df))"]
+        assert code[0].metadata["warnings"] == ["NameError: name 'pd' is not defined"]
@@ -0,0 +1,83 @@
+"""
+Tests for incremental code block extraction
+"""
+
+import pytest
+
+from agents.code_extractor import CodeExtractor, extract_code
+from schemas.responses import AgentMessage, MessageType
+
+
+def feed_all(chunks):
+    extractor = CodeExtractor()
+    blocks = []
+    for chunk in chunks:
+        blocks.extend(extractor.feed(chunk))
+    closed, unterminated = extractor.close()
+    return blocks + closed, unterminated
+
+
+class TestCodeExtractor:
+    """Test fence detection across chunk boundaries"""
+
+    def test_block_split_across_chunks(self):
+        text = "Try this:\n```python\nimport pandas as pd\ndf = pd.read_csv('a.csv')\n```\nDone."
+        chunks = [text[i:i + 3] for i in range(0, len(text), 3)]
+
+        blocks, unterminated = feed_all(chunks)
+
+        assert blocks == ["import pandas as pd\ndf = pd.read_csv('a.csv')"]
+        assert unterminated is None
+
+    def test_block_returned_when_closing_line_arrives(self):
+        extractor = CodeExtractor()
+        assert extractor.feed("```py\nx = 1\n``") == []
+        assert extractor.feed("`\nexplanation") == ["x = 1"]
+
+    def test_other_languages_skipped(self):
+        text = "```bash\npip install x\n```\n```\nprint(1)\n```\n"
+        blocks, _ = feed_all([text])
+        assert blocks == ["print(1)"]
+
+    def test_longer_fence_contains_shorter(self):
+        text = "````python\ns = '''\n```\n'''\n````\n"
+        blocks, _ = feed_all([text])
+        assert blocks == ["s = '''\n```\n'''"]
+
+    def test_closing_fence_without_newline(self):
+        blocks, unterminated = feed_all(["```python\nx = 1\n```"])
+        assert blocks == ["x = 1"]
+        assert unterminated is None
+
+    def test_unterminated_block(self):
+        blocks, unterminated = feed_all(["```python\nx = 1\ny ="])
+        assert blocks == []
+        assert unterminated == "x = 1\ny ="
+
+
+class TestExtractCode:
+    """Test CODE messages in a response stream"""
+
+    @pytest.mark.asyncio
+    async def test_code_follows_closing_delta(self):
+        chunks = ["```python\nx = 1\n", "```\nSets x.", "\n```python\ny ="]
+
+        async def stream():
+            for chunk in chunks:
+                yield AgentMessage(type=MessageType.TEXT_DELTA, content=chunk)
+            yield AgentMessage(type=MessageType.THINKING, content="".join(chunks))
+
+        messages = [m async for m in extract_code(stream())]
+
+        assert [m.type for m in messages] == [
+            MessageType.TEXT_DELTA,
+            MessageType.TEXT_DELTA,
+            MessageType.CODE,
+            MessageType.TEXT_DELTA,
+            MessageType.CODE,
+            MessageType.THINKING,
+        ]
+        assert messages[2].content == "x = 1"
+        assert messages[2].metadata == {"language": "python", "index": 0, "complete": True}
+        assert messages[4].content == "y ="
+        assert messages[4].metadata["complete"] is False
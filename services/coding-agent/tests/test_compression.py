@@ -0,0 +1,85 @@
+"""
+Tests for token-budgeted context compression
+"""
+
+from core.compression import compress_traceback, compress_variables
+from core.tokens import estimate_tokens
+from agents import format_context
+from schemas.internal import NotebookContext
+
+
+def make_traceback(frames, repeated=0):
+    lines = ["Traceback (most recent call last):"]
+    for i in range(frames):
+        lines.append(f'  File "/lib/pandas/core/module_{i}.py", line {i + 1}, in func_{i}')
+        lines.append(f"    result = call_{i}(frame)")
+    for _ in range(repeated):
+        lines.append('  File "/notebook/cell.py", line 3, in recurse')
+        lines.append("    return recurse(n - 1)")
+    lines.append("KeyError: 'revenue'")
+    return "\n".join(lines)
+
+
+class TestCompressTraceback:
+    """Test frame deduplication and head/tail trimming"""
+
+    def test_small_traceback_unchanged(self):
+        text = make_traceback(3)
+        assert compress_traceback(text, 500) == text
+
+    def test_repeated_frames_collapsed(self):
+        text = make_traceback(2, repeated=300)
+        compressed = compress_traceback(text, 200)
+
+        assert compressed.count("in recurse") == 1
+        assert "[Previous frame repeated 299 more times]" in compressed
+        assert compressed.endswith("KeyError: 'revenue'")
+
+    def test_keeps_head_and_tail_within_budget(self):
+        text = make_traceback(400)
+        compressed = compress_traceback(text, 300)
+
+        assert estimate_tokens(compressed) <= 300
+        assert compressed.startswith("Traceback (most recent call last):")
+        assert "module_0.py" in compressed
+        assert "module_399.py" in compressed
+        assert "frames omitted" in compressed
+        assert compressed.endswith("KeyError: 'revenue'")
+
+
+class TestCompressVariables:
+    """Test ranking and grouping of large namespaces"""
+
+    def test_small_namespace_listed_in_full(self):
+        lines = compress_variables({"df": "DataFrame", "n": "int"}, 100)
+        assert lines == ["- df: DataFrame", "- n: int"]
+
+    def test_large_namespace_grouped_and_ranked(self):
+        variables = {f"col_{i}": "Series" for i in range(2000)}
+        variables.update({f"tmp_{i}": "int" for i in range(500)})
+        variables["revenue_df"] = "DataFrame"
+
+        lines = compress_variables(variables, 200, query="plot revenue by month")
+
+        assert estimate_tokens("\n".join(lines)) <= 200
+        # Mentioned in the query, so listed first
+        assert lines[0] == "- revenue_df: DataFrame"
+        assert any("more int" in line for line in lines)
+
+
+class TestFormatContextBudget:
+    """Test the compressed context block"""
+
+    def test_budget_applies_to_error_and_variables(self):
+        context = NotebookContext(
+            notebook_id="nb",
+            session_id="s",
+            variables={f"col_{i}": "Series" for i in range(2000)},
+            last_error=make_traceback(400)
+        )
+        uncompressed = format_context(context)
+        compressed = format_context(context, query="fix it", token_budget=800)
+
+        assert estimate_tokens(uncompressed) > 10_000
+        assert estimate_tokens(compressed) < 900
+        assert "KeyError: 'revenue'" in compressed
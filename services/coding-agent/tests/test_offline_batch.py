@@ -0,0 +1,102 @@
+"""
+Tests for the offline batch job runner
+"""
+
+import json
+import pytest
+
+from core.offline_batch import OfflineBatchRunner, StubBatchProvider
+from agents import QuickExecutor
+from schemas.internal import NotebookContext
+
+
+def make_items(count):
+    return [
+        {
+            "query": f"question {i}",
+            "context": {"notebook_id": "nb", "session_id": f"s{i}"},
+        }
+        for i in range(count)
+    ]
+
+
+def make_runner(tmp_path, provider, chunk_size=10):
+    return OfflineBatchRunner(
+        provider,
+        QuickExecutor(),
+        output_dir=tmp_path,
+        poll_interval=0,
+        chunk_size=chunk_size
+    )
+
+
+class TestOfflineBatchRunner:
+    """Test submission, polling and result files with the stub provider"""
+
+    @pytest.mark.asyncio
+    async def test_run_writes_results_and_manifest(self, tmp_path):
+        provider = StubBatchProvider(polls_until_done=3, fail_ids=["item-1"])
+        runner = make_runner(tmp_path, provider, chunk_size=2)
+
+        summary = await runner.run(make_items(3))
+
+        manifest = json.loads(runner.manifest_path.read_text())
+        assert len(manifest["batch_ids"]) == 2
+        assert manifest["requests"] == 3
+
+        results = [json.loads(line) for line in runner.results_path.read_text().splitlines()]
+        by_id = {r["custom_id"]: r for r in results}
+        assert set(by_id) == {"item-0", "item-1", "item-2"}
+        assert by_id["item-1"]["status"] == "errored"
+        assert by_id["item-2"]["text"] == "[stub] User request: question 2"
+        assert summary["succeeded"] == 2
+        assert summary["errored"] == 1
+        assert summary["estimated_cost_usd"] > 0
+
+    def test_requests_use_the_interactive_prompt(self, tmp_path):
+        provider = StubBatchProvider()
+        runner = make_runner(tmp_path, provider)
+        executor = runner.executor
+
+        requests = runner.build_requests(make_items(1))
+        messages, _ = executor._prepare(
+            "question 0",
+            NotebookContext(notebook_id="nb", session_id="s0")
+        )
+
+        params = requests[0]["params"]
+        assert params["model"] == executor.model
+        assert params["messages"] == messages
+        assert params["system"][0]["text"] == executor.system_prompt
+
+    @pytest.mark.asyncio
+    async def test_resume_collects_from_manifest(self, tmp_path):
+        provider = StubBatchProvider()
+        runner = make_runner(tmp_path, provider)
+        await runner.submit(make_items(2))
+
+        # A fresh runner (e.g. after a restart) picks up the same batches
+        summary = await make_runner(tmp_path, provider).collect()
+
+        assert summary["succeeded"] == 2
+
+    @pytest.mark.asyncio
+    async def test_collecting_again_does_not_duplicate_results(self, tmp_path):
+        provider = StubBatchProvider()
+        runner = make_runner(tmp_path, provider)
+        await runner.run(make_items(2))
+
+        summary = await runner.collect()
+
+        lines = runner.results_path.read_text().splitlines()
+        assert len(lines) == 2
+        assert summary["already_collected"] == 2
+        assert "succeeded" not in summary
+
+    def test_duplicate_ids_rejected(self, tmp_path):
+        runner = make_runner(tmp_path, StubBatchProvider())
+        items = make_items(2)
+        items[0]["id"] = items[1]["id"] = "same"
+
+        with pytest.raises(ValueError):
+            runner.build_requests(items)
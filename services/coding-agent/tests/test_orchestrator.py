@@ -0,0 +1,293 @@
+"""
+Tests for the agent orchestrator
+"""
+
+import asyncio
+import pytest
+
+from core.orchestrator import AgentOrchestrator
+from core.scheduler import BACKGROUND, INTERACTIVE, STANDARD, Scheduler
+from schemas.internal import NotebookContext, QueryRoute
+from schemas.responses import AgentMessage, MessageType
+
+
+class FakeRouter:
+    """Router whose LLM classification is slow"""
+
+    def __init__(self, route, delay=0.05):
+        self.route = route
+        self.delay = delay
+
+    def classify_heuristic(self, query, context):
+        return QueryRoute.SIMPLE_CODE
+
+    async def classify(self, query, context):
+        await asyncio.sleep(self.delay)
+        return self.route
+
+
+class FakeExecutor:
+    """Executor that records when it started"""
+
+    def __init__(self):
+        self.started = []
+        self.routes = []
+
+    async def execute(self, query, context, **kwargs):
+        self.started.append(asyncio.get_running_loop().time())
+        self.routes.append(kwargs.get("route"))
+        yield AgentMessage(type=MessageType.THINKING, content=f"answer: {query}")
+        yield AgentMessage(type=MessageType.COMPLETE, content={"status": "success"})
+
+
+def make_orchestrator(route, speculative=True):
+    orchestrator = AgentOrchestrator()
+    orchestrator.router = FakeRouter(route)
+    orchestrator.quick_executor = FakeExecutor()
+    orchestrator.speculative = speculative
+    return orchestrator
+
+
+def make_context(session_id="spec-test"):
+    return NotebookContext(notebook_id="nb", session_id=session_id)
+
+
+class TestSpeculativeExecution:
+    """Test that the executor starts before classification finishes"""
+
+    @pytest.mark.asyncio
+    async def test_executor_starts_before_router_returns(self):
+        orchestrator = make_orchestrator(QueryRoute.SIMPLE_CODE)
+        loop = asyncio.get_running_loop()
+        begin = loop.time()
+
+        messages = [
+            m async for m in orchestrator.handle_query("plot x", make_context())
+        ]
+
+        started = orchestrator.quick_executor.started
+        assert len(started) == 1
+        assert started[0] - begin < orchestrator.router.delay
+        assert [m.type for m in messages] == [
+            MessageType.THINKING,
+            MessageType.COMPLETE,
+        ]
+
+    @pytest.mark.asyncio
+    async def test_non_speculative_waits_for_router(self):
+        orchestrator = make_orchestrator(QueryRoute.SIMPLE_CODE, speculative=False)
+        loop = asyncio.get_running_loop()
+        begin = loop.time()
+
+        messages = [
+            m async for m in orchestrator.handle_query("plot x", make_context())
+        ]
+
+        assert orchestrator.quick_executor.started[0] - begin >= orchestrator.router.delay
+        assert messages[0].content == "answer: plot x"
+
+    @pytest.mark.asyncio
+    async def test_mismatched_executor_is_restarted(self):
+        orchestrator = make_orchestrator(QueryRoute.EXPLAIN)
+        other = FakeExecutor()
+        orchestrator._executor_for = lambda route: (
+            other if route == QueryRoute.EXPLAIN else orchestrator.quick_executor
+        )
+
+        messages = [
+            m async for m in orchestrator.handle_query("what is x", make_context())
+        ]
+
+        assert len(other.started) == 1
+        assert messages[0].content == "answer: what is x"
+
+    @pytest.mark.asyncio
+    async def test_mismatched_route_is_restarted(self):
+        # Same executor, but the route changes its model, budget and mode
+        orchestrator = make_orchestrator(QueryRoute.QUICK_FIX)
+
+        messages = [
+            m async for m in orchestrator.handle_query("fix x", make_context())
+        ]
+
+        assert orchestrator.quick_executor.routes == [
+            QueryRoute.SIMPLE_CODE,
+            QueryRoute.QUICK_FIX,
+        ]
+        assert messages[0].content == "answer: fix x"
+
+
+class RecordingExecutor(FakeExecutor):
+    """Executor that records the history it was given"""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    async def execute(self, query, context, **kwargs):
+        self.calls.append(kwargs)
+        async for message in super().execute(query, context):
+            yield message
+
+
+class FakeSummarizer:
+    async def summarize(self, previous_summary, turns):
+        return f"{len(turns)} turns"
+
+
+class TestConversationHistory:
+    """Test history injection and background summarization"""
+
+    @pytest.mark.asyncio
+    async def test_history_is_budgeted_and_summarized(self):
+        orchestrator = make_orchestrator(QueryRoute.SIMPLE_CODE)
+        orchestrator.quick_executor = RecordingExecutor()
+        orchestrator.summarizer = FakeSummarizer()
+        orchestrator.history_token_budget = 40
+        context = make_context("history-test")
+
+        for query in ["first question", "second question", "third question"]:
+            async for _ in orchestrator.handle_query(query, context):
+                pass
+            await asyncio.gather(*orchestrator._background_tasks)
+
+        calls = orchestrator.quick_executor.calls
+        assert calls[0]["history"] == []
+        assert calls[1]["history"][0]["role"] == "user"
+        assert calls[1]["history"][0]["content"].endswith("User request: first question")
+
+        # By the third query the first exchange has been folded away
+        session = orchestrator.session_manager.sessions["history-test"]
+        assert session.summary
+        assert session.summarized_turns >= 2
+        assert all(
+            "first question" not in m["content"] for m in calls[2]["history"]
+        )
+
+    @pytest.mark.asyncio
+    async def test_summary_scheduled_once_before_it_starts(self):
+        orchestrator = make_orchestrator(QueryRoute.SIMPLE_CODE)
+        orchestrator.summarizer = FakeSummarizer()
+        session = await orchestrator.session_manager.get_or_create_session("once-test", "nb")
+
+        orchestrator._schedule_summary(session, 2)
+        orchestrator._schedule_summary(session, 2)
+
+        assert session.summarizing
+        assert len(orchestrator._background_tasks) == 1
+        await asyncio.gather(*orchestrator._background_tasks)
+        assert not session.summarizing
+
+
+class TestContextDiffing:
+    """Test that unchanged variables are not resent every turn"""
+
+    @pytest.mark.asyncio
+    async def test_only_changes_are_sent_after_snapshot(self):
+        orchestrator = make_orchestrator(QueryRoute.SIMPLE_CODE)
+        orchestrator.quick_executor = RecordingExecutor()
+        context = make_context("diff-test")
+        context.variables = {"df": "DataFrame", "x": "Series"}
+
+        async for _ in orchestrator.handle_query("plot x", context):
+            pass
+
+        context.variables = {"df": "DataFrame", "x": "ndarray", "y": "Series"}
+        async for _ in orchestrator.handle_query("plot y", context):
+            pass
+
+        context.full_context_refresh = True
+        async for _ in orchestrator.handle_query("plot both", context):
+            pass
+
+        first, second, third = [c["context_block"] for c in orchestrator.quick_executor.calls]
+        assert "- df: DataFrame" in first
+        assert "df" not in second
+        assert "+ y: Series" in second
+        assert "~ x: Series -> ndarray" in second
+        assert "- df: DataFrame" in third
+
+        # The snapshot the diff refers to is part of the history sent along
+        assert "- df: DataFrame" in orchestrator.quick_executor.calls[1]["history"][0]["content"]
+
+
+class SlowExecutor(FakeExecutor):
+    """Executor that takes a while between messages"""
+
+    async def execute(self, query, context, **kwargs):
+        self.started.append(asyncio.get_running_loop().time())
+        for i in range(3):
+            await asyncio.sleep(0.01)
+            yield AgentMessage(type=MessageType.TEXT_DELTA, content=str(i))
+        yield AgentMessage(type=MessageType.THINKING, content=f"answer: {query}")
+
+
+class TestRequestCoalescing:
+    """Test that identical concurrent requests share one execution"""
+
+    async def collect(self, orchestrator, query, context, limit=None):
+        messages = []
+        async for message in orchestrator.handle_query(query, context):
+            messages.append(message)
+            if limit and len(messages) == limit:
+                break
+        return messages
+
+    @pytest.mark.asyncio
+    async def test_concurrent_duplicates_share_execution(self):
+        orchestrator = make_orchestrator(QueryRoute.SIMPLE_CODE)
+        orchestrator.quick_executor = SlowExecutor()
+        context = make_context("coalesce-test")
+
+        first, second = await asyncio.gather(
+            self.collect(orchestrator, "plot x", context),
+            self.collect(orchestrator, "plot x", context),
+        )
+
+        assert len(orchestrator.quick_executor.started) == 1
+        assert [m.content for m in first] == ["0", "1", "2", "answer: plot x"]
+        assert [m.content for m in second] == [m.content for m in first]
+        session = await orchestrator.session_manager.get_session("coalesce-test")
+        assert session.total_turns == 2
+
+        # Finished executions are not reused
+        await self.collect(orchestrator, "plot x", context)
+        assert len(orchestrator.quick_executor.started) == 2
+
+    @pytest.mark.asyncio
+    async def test_execution_survives_one_subscriber_leaving(self):
+        orchestrator = make_orchestrator(QueryRoute.SIMPLE_CODE)
+        orchestrator.quick_executor = SlowExecutor()
+        context = make_context("coalesce-leave-test")
+
+        early, full = await asyncio.gather(
+            self.collect(orchestrator, "plot y", context, limit=1),
+            self.collect(orchestrator, "plot y", context),
+        )
+
+        assert len(early) == 1
+        assert full[-1].content == "answer: plot y"
+        assert len(orchestrator.quick_executor.started) == 1
+
+
+class TestOrchestratorShedding:
+    """Test that shed requests surface as retry-after errors"""
+
+    @pytest.mark.asyncio
+    async def test_shed_request_yields_error_and_skips_history(self):
+        orchestrator = make_orchestrator(QueryRoute.SIMPLE_CODE)
+        orchestrator.scheduler = Scheduler(
+            total_slots=1,
+            pools={INTERACTIVE: (1, 1.0), STANDARD: (1, 0.01), BACKGROUND: (1, 0.01)}
+        )
+        held = await orchestrator.scheduler.acquire(QueryRoute.QUICK_FIX)
+        orchestrator.router.classify_heuristic = lambda q, c: QueryRoute.STORYTELLING
+
+        messages = [
+            m async for m in orchestrator.handle_query("write a report", make_context("shed-test"))
+        ]
+        orchestrator.scheduler.release(held)
+
+        assert len(messages) == 1
+        assert messages[0].content["retry_after"] >= 1
+        assert await orchestrator.session_manager.get_session("shed-test") is None
@@ -0,0 +1,137 @@
+"""
+Tests for the client-side rate limiter
+"""
+
+from collections import OrderedDict
+import asyncio
+import pytest
+
+from core import rate_limit
+from core.config import get_settings
+from core.rate_limit import RateLimiter, RateLimitExceeded, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_limiter(**kwargs):
+    options = dict(
+        requests_per_minute=0,
+        tokens_per_minute=0,
+        max_concurrency=0,
+        max_wait=1.0,
+        max_queue=10,
+    )
+    options.update(kwargs)
+    return RateLimiter(**options)
+
+
+class TestTokenBucket:
+    """Test refill and debt"""
+
+    def test_wait_time_and_refill(self):
+        clock = FakeClock()
+        bucket = TokenBucket(60, clock)  # one per second
+
+        bucket.take(60)
+        assert bucket.wait_time(1) == pytest.approx(1.0)
+
+        clock.now = 5.0
+        assert bucket.wait_time(5) == 0.0
+
+    def test_settling_over_reservation_creates_debt(self):
+        clock = FakeClock()
+        bucket = TokenBucket(60, clock)
+
+        bucket.take(90)
+        assert bucket.wait_time(1) == pytest.approx(31.0)
+
+
+class TestRateLimiter:
+    """Test queueing, backpressure and stats"""
+
+    @pytest.mark.asyncio
+    async def test_requests_queue_instead_of_failing(self):
+        limiter = make_limiter(requests_per_minute=600, max_wait=5.0)  # 10 per second
+        limiter.requests.level = 1
+
+        loop = asyncio.get_running_loop()
+        begin = loop.time()
+        for _ in range(2):
+            limiter.release(await limiter.acquire())
+
+        assert loop.time() - begin >= 0.09
+        assert limiter.get_stats()["admitted"] == 2
+        assert limiter.get_stats()["rejected"] == 0
+
+    @pytest.mark.asyncio
+    async def test_rejects_when_wait_exceeds_bound(self):
+        limiter = make_limiter(tokens_per_minute=60, max_wait=1.0)
+        limiter.tokens.level = 0
+
+        with pytest.raises(RateLimitExceeded) as info:
+            await limiter.acquire(estimated_tokens=30)
+
+        assert info.value.retry_after > 1.0
+        assert limiter.get_stats()["rejected"] == 1
+
+    @pytest.mark.asyncio
+    async def test_concurrency_cap_and_queue_depth(self):
+        limiter = make_limiter(max_concurrency=1, max_wait=1.0)
+        first = await limiter.acquire()
+
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0.01)
+        assert limiter.get_stats()["queue_depth"] == 1
+        assert limiter.get_stats()["active"] == 1
+
+        limiter.release(first)
+        second = await waiter
+        limiter.release(second)
+
+        stats = limiter.get_stats()
+        assert stats["queue_depth"] == 0
+        assert stats["max_queue_depth"] == 1
+        assert stats["admitted"] == 2
+
+    @pytest.mark.asyncio
+    async def test_full_queue_rejects_immediately(self):
+        limiter = make_limiter(max_concurrency=1, max_queue=1)
+        held = await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0.01)
+
+        with pytest.raises(RateLimitExceeded):
+            await limiter.acquire()
+
+        limiter.release(held)
+        limiter.release(await waiter)
+
+
+class TestLimiterRegistry:
+    """Test that per-key limiters are bounded and keys are not kept"""
+
+    @pytest.mark.asyncio
+    async def test_idle_limiters_evicted_and_keys_hashed(self, monkeypatch):
+        monkeypatch.setattr(rate_limit, "_limiters", OrderedDict())
+        monkeypatch.setattr(rate_limit, "_limiter_evictions", 0)
+        monkeypatch.setattr(get_settings(), "client_pool_max_keys", 2)
+
+        busy = rate_limit.get_rate_limiter("sk-user-1", "m")
+        lease = await busy.acquire()
+        rate_limit.get_rate_limiter("sk-user-2", "m")
+        rate_limit.get_rate_limiter("sk-user-3", "m")
+
+        # The oldest limiter is in use, so the next idle one goes instead
+        assert rate_limit.get_rate_limiter("sk-user-1", "m") is busy
+        busy.release(lease)
+
+        stats = rate_limit.get_rate_limit_stats()
+        assert len(stats["limiters"]) == 2
+        assert stats["evictions"] == 1
+        assert not any("sk-user" in label for label in stats["limiters"])
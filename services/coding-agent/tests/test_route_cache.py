@@ -0,0 +1,59 @@
+"""
+Tests for the route classification cache
+"""
+
+from core.route_cache import RouteCache, normalize_query
+from schemas.internal import NotebookContext, QueryRoute
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_context(**kwargs):
+    return NotebookContext(notebook_id="nb", session_id="s", **kwargs)
+
+
+class TestRouteCache:
+    """Test cache keys, LRU eviction and TTL expiry"""
+
+    def test_normalized_queries_share_keys(self):
+        assert normalize_query("  Plot a  Histogram of X! ") == "plot a histogram of x"
+
+        context_a = make_context(variables={"df": "DataFrame", "x": "Series"})
+        context_b = make_context(variables={"data": "DataFrame", "y": "Series"})
+        context_c = make_context(variables={"df": "DataFrame"})
+
+        key_a = RouteCache.make_key("plot a histogram of x", context_a)
+        assert key_a == RouteCache.make_key("Plot a histogram of x?", context_b)
+        assert key_a != RouteCache.make_key("plot a histogram of x", context_c)
+
+    def test_lru_eviction(self):
+        cache = RouteCache(max_entries=2)
+        cache.put("a", QueryRoute.EXPLAIN)
+        cache.put("b", QueryRoute.SIMPLE_CODE)
+        assert cache.get("a") == QueryRoute.EXPLAIN
+        cache.put("c", QueryRoute.COMPLEX_EDA)
+
+        assert cache.get("b") is None
+        assert cache.get("a") == QueryRoute.EXPLAIN
+        assert cache.get_stats()["evictions"] == 1
+
+    def test_ttl_expiry(self):
+        clock = FakeClock()
+        cache = RouteCache(ttl_seconds=10, clock=clock)
+        cache.put("a", QueryRoute.EXPLAIN)
+
+        clock.now = 9.9
+        assert cache.get("a") == QueryRoute.EXPLAIN
+        clock.now = 10.0
+        assert cache.get("a") is None
+
+        stats = cache.get_stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["expirations"] == 1
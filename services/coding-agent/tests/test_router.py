@@ -95,3 +95,49 @@ class TestQueryRouter:
         for query in queries:
             route = router.classify_heuristic(query, context)
             assert route == QueryRoute.SIMPLE_CODE
+
+    def test_fast_path_confidence(self):
+        """Test confidence scores from the keyword tier"""
+        router = QueryRouter()
+        context = NotebookContext(notebook_id="test", session_id="test")
+        error_context = NotebookContext(
+            notebook_id="test",
+            session_id="test",
+            last_error="KeyError: 'age'"
+        )
+
+        assert router.classify_fast("fix it", error_context) == (QueryRoute.QUICK_FIX, 0.95)
+
+        route, confidence = router.classify_fast("plot a histogram of age", context)
+        assert route == QueryRoute.SIMPLE_CODE
+        assert confidence >= router.confidence_threshold
+
+        # Vague and ambiguous queries fall below the threshold
+        _, vague = router.classify_fast("do the thing", context)
+        _, ambiguous = router.classify_fast("what does this correlation test show", context)
+        assert vague < router.confidence_threshold
+        assert ambiguous < router.confidence_threshold
+
+    @pytest.mark.asyncio
+    async def test_classify_skips_llm_when_confident(self):
+        """Test that confident queries never reach the router model"""
+        router = QueryRouter()
+        calls = []
+
+        async def fake_llm(query, context, fallback, **kwargs):
+            calls.append(query)
+            return fallback
+
+        router._classify_llm = fake_llm
+        context = NotebookContext(
+            notebook_id="test",
+            session_id="test",
+            last_error="NameError: name 'df' is not defined"
+        )
+
+        assert await router.classify("fix this", context) == QueryRoute.QUICK_FIX
+        assert calls == []
+
+        context = NotebookContext(notebook_id="test", session_id="test")
+        await router.classify("do the thing", context)
+        assert calls == ["do the thing"]
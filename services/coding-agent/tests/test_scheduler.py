@@ -0,0 +1,78 @@
+"""
+Tests for priority scheduling and load shedding
+"""
+
+import asyncio
+import pytest
+
+from core.scheduler import (
+    BACKGROUND, INTERACTIVE, STANDARD, LoadShed, Scheduler
+)
+from schemas.internal import QueryRoute
+
+
+def make_scheduler(total_slots=1, background_slots=1, deadline=0.05):
+    return Scheduler(
+        total_slots=total_slots,
+        pools={
+            INTERACTIVE: (total_slots, 1.0),
+            STANDARD: (total_slots, deadline),
+            BACKGROUND: (background_slots, deadline),
+        }
+    )
+
+
+class TestScheduler:
+    """Test priority order, per-class pools and shedding"""
+
+    @pytest.mark.asyncio
+    async def test_interactive_jumps_the_queue(self):
+        scheduler = make_scheduler(total_slots=1, deadline=1.0)
+        held = await scheduler.acquire(QueryRoute.EXPLAIN)
+
+        order = []
+
+        async def run(route):
+            ticket = await scheduler.acquire(route)
+            order.append(route)
+            scheduler.release(ticket)
+
+        background = asyncio.create_task(run(QueryRoute.STORYTELLING))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(run(QueryRoute.QUICK_FIX))
+        await asyncio.sleep(0)
+
+        scheduler.release(held)
+        await asyncio.gather(background, interactive)
+
+        assert order == [QueryRoute.QUICK_FIX, QueryRoute.STORYTELLING]
+
+    @pytest.mark.asyncio
+    async def test_background_pool_cannot_take_every_slot(self):
+        scheduler = make_scheduler(total_slots=4, background_slots=1)
+        await scheduler.acquire(QueryRoute.COMPLEX_EDA)
+
+        # The background pool is full but interactive work still runs
+        ticket = await asyncio.wait_for(scheduler.acquire(QueryRoute.QUICK_FIX), 0.1)
+        assert ticket.pool.name == INTERACTIVE
+
+        with pytest.raises(LoadShed):
+            await scheduler.acquire(QueryRoute.STORYTELLING)
+
+    @pytest.mark.asyncio
+    async def test_shed_after_deadline_with_retry_after(self):
+        scheduler = make_scheduler(total_slots=1, deadline=0.05)
+        held = await scheduler.acquire(QueryRoute.QUICK_FIX)
+
+        with pytest.raises(LoadShed) as info:
+            await scheduler.acquire(QueryRoute.COMPLEX_EDA)
+
+        assert info.value.retry_after >= 1
+        stats = scheduler.get_stats()["classes"][BACKGROUND]
+        assert stats["shed"] == 1
+        assert stats["waiting"] == 0
+
+        # The shed waiter does not take the slot once it frees up
+        scheduler.release(held)
+        assert scheduler.get_stats()["active"] == 0
+
@@ -0,0 +1,119 @@
+"""
+Tests for session manager eviction and history
+"""
+
+from collections import deque
+
+import pytest
+
+from core.session_manager import SessionManager
+
+
+class TestSessionEviction:
+    """Test LRU eviction by session count and byte budget"""
+
+    @pytest.mark.asyncio
+    async def test_evicts_least_recently_used_at_cap(self):
+        manager = SessionManager(max_sessions=2)
+        await manager.get_or_create_session("a", "nb")
+        await manager.get_or_create_session("b", "nb")
+
+        # Touch "a" so "b" becomes least recently used
+        manager.add_user_message("a", "hello")
+        await manager.get_or_create_session("c", "nb")
+
+        assert list(manager.sessions) == ["a", "c"]
+        assert manager.get_stats()["evictions"]["max_sessions"] == 1
+
+    @pytest.mark.asyncio
+    async def test_active_sessions_are_still_bounded(self):
+        manager = SessionManager(max_sessions=3)
+        for i in range(10):
+            await manager.get_or_create_session(f"s{i}", "nb")
+            manager.add_user_message(f"s{i}", "active")
+
+        assert len(manager.sessions) == 3
+
+    @pytest.mark.asyncio
+    async def test_byte_budget(self):
+        manager = SessionManager(max_sessions=100, max_bytes=10_000)
+        await manager.get_or_create_session("a", "nb")
+        await manager.get_or_create_session("b", "nb")
+        manager.add_user_message("b", "x" * 9_000)
+
+        assert list(manager.sessions) == ["b"]
+        assert manager.total_bytes == manager.sessions["b"].size_bytes
+        assert manager.get_stats()["evictions"]["max_bytes"] == 1
+
+    @pytest.mark.asyncio
+    async def test_clear_session_releases_bytes(self):
+        manager = SessionManager()
+        await manager.get_or_create_session("a", "nb")
+        manager.add_user_message("a", "hello")
+        manager.clear_session("a")
+
+        assert manager.total_bytes == 0
+
+
+class TestHistoryWindow:
+    """Test token-budgeted history windows"""
+
+    async def make_session(self, turns):
+        manager = SessionManager()
+        session = await manager.get_or_create_session("s", "nb")
+        for i in range(turns):
+            manager.add_user_message("s", f"question {i} " + "q" * 30)
+            manager.add_assistant_message("s", f"answer {i} " + "a" * 30)
+        return manager, session
+
+    @pytest.mark.asyncio
+    async def test_window_fits_budget(self):
+        _, session = await self.make_session(10)
+
+        window = session.get_history_window(token_budget=50)
+
+        # Each turn is ~10 tokens, so about five turns fit
+        assert 0 < len(window.messages) <= 5
+        assert window.messages[0]["role"] == "user"
+        assert window.messages[-1]["content"].startswith("answer 9")
+        assert window.fold_upto == 20 - len(window.messages)
+
+    @pytest.mark.asyncio
+    async def test_summarized_turns_are_excluded(self):
+        manager, session = await self.make_session(10)
+
+        manager.apply_summary("s", "- loaded data.csv", upto=16)
+        window = session.get_history_window(token_budget=10_000)
+
+        assert window.summary == "- loaded data.csv"
+        assert len(window.messages) == 4
+        assert window.fold_upto == 16
+
+    @pytest.mark.asyncio
+    async def test_consecutive_user_turns_are_merged(self):
+        manager = SessionManager()
+        session = await manager.get_or_create_session("s", "nb")
+        manager.add_user_message("s", "first")
+        manager.add_user_message("s", "second")
+
+        window = session.get_history_window(token_budget=1_000)
+
+        assert window.messages == [{"role": "user", "content": "first\n\nsecond"}]
+
+    @pytest.mark.asyncio
+    async def test_positions_survive_bounded_history(self):
+        manager = SessionManager()
+        session = await manager.get_or_create_session("s", "nb")
+        session.conversation_history = deque(maxlen=4)
+        for i in range(5):
+            manager.add_user_message("s", f"q{i}")
+            manager.add_assistant_message("s", f"a{i}")
+
+        assert session.total_turns == 10
+        assert session.first_turn == 6
+        assert [t.content for t in session.turns_between(0, 8)] == ["q3", "a3"]
+
+        manager.apply_summary("s", "summary", upto=8)
+        window = session.get_history_window(token_budget=1_000)
+        assert [m["content"] for m in window.messages] == ["q4", "a4"]
+        assert window.fold_upto == 8
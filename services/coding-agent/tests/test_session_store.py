@@ -0,0 +1,81 @@
+"""
+Tests for the durable session store
+"""
+
+import sqlite3
+
+import pytest
+
+from core.session_manager import SessionManager
+from core.session_store import SQLiteSessionStore
+
+
+def make_manager(path, **kwargs):
+    return SessionManager(store=SQLiteSessionStore(str(path)), **kwargs)
+
+
+class TestSQLiteSessionStore:
+    """Test write-behind persistence and lazy loading"""
+
+    @pytest.mark.asyncio
+    async def test_sessions_survive_restart(self, tmp_path):
+        path = tmp_path / "sessions.db"
+        manager = make_manager(path)
+        await manager.get_or_create_session("s1", "nb1")
+        manager.add_user_message("s1", "load data.csv")
+        manager.add_assistant_message("s1", "df = pd.read_csv('data.csv')", {"route": "simple_code"})
+        manager.update_notebook_state("s1", {"df": "DataFrame"})
+        manager.apply_summary("s1", "- loaded data", upto=1)
+        manager.close()
+
+        restarted = make_manager(path)
+        assert restarted.sessions == {}
+
+        session = await restarted.get_or_create_session("s1", "ignored")
+        assert session.notebook_id == "nb1"
+        assert session.total_turns == 2
+        assert [t.role for t in session.conversation_history] == ["user", "assistant"]
+        assert session.conversation_history[1].metadata == {"route": "simple_code"}
+        assert session.notebook_variables == {"df": "DataFrame"}
+        assert session.summary == "- loaded data"
+        assert session.summarized_turns == 1
+        restarted.close()
+
+    @pytest.mark.asyncio
+    async def test_evicted_session_is_lazy_loaded(self, tmp_path):
+        manager = make_manager(tmp_path / "sessions.db", max_sessions=1)
+        await manager.get_or_create_session("a", "nb")
+        manager.add_user_message("a", "hello")
+        await manager.get_or_create_session("b", "nb")
+        assert "a" not in manager.sessions
+
+        # Reads wait only for writes still pending on this session
+        assert await manager.get_conversation_context("a") == [
+            {"role": "user", "content": "hello"}
+        ]
+        assert manager.get_stats()["loads"] == 1
+        manager.close()
+
+    @pytest.mark.asyncio
+    async def test_clear_session_deletes_from_store(self, tmp_path):
+        manager = make_manager(tmp_path / "sessions.db")
+        await manager.get_or_create_session("a", "nb")
+        manager.add_user_message("a", "hello")
+        manager.clear_session("a")
+
+        assert not await manager.has_session("a")
+        manager.close()
+
+    @pytest.mark.asyncio
+    async def test_stored_turns_are_bounded(self, tmp_path):
+        path = tmp_path / "sessions.db"
+        manager = SessionManager(store=SQLiteSessionStore(str(path), max_turns=3))
+        await manager.get_or_create_session("a", "nb")
+        for i in range(5):
+            manager.add_user_message("a", f"q{i}")
+        manager.close()
+
+        conn = sqlite3.connect(path)
+        rows = conn.execute("SELECT content FROM turns ORDER BY position").fetchall()
+        conn.close()
+        assert [content for content, in rows] == ["q2", "q3", "q4"]
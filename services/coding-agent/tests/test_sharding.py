@@ -0,0 +1,135 @@
+"""
+Tests for consistent-hash session sharding
+"""
+
+from collections import Counter
+
+import httpx
+import pytest
+from fastapi import Request
+
+from core.sharding import CLUSTER_SECRET_HEADER, HashRing, ShardRouter
+
+WORKERS = [f"http://127.0.0.1:{8000 + i}" for i in range(4)]
+SESSIONS = [f"session_{i}" for i in range(2000)]
+
+
+class TestHashRing:
+    """Test key placement and movement"""
+
+    def test_keys_spread_across_nodes(self):
+        ring = HashRing(WORKERS)
+        counts = Counter(ring.node_for(s) for s in SESSIONS)
+
+        assert set(counts) == set(WORKERS)
+        assert min(counts.values()) > len(SESSIONS) / len(WORKERS) * 0.6
+
+    def test_adding_a_node_moves_few_keys(self):
+        ring = HashRing(WORKERS)
+        before = {s: ring.node_for(s) for s in SESSIONS}
+        ring.set_nodes(WORKERS + ["http://127.0.0.1:8004"])
+        moved = [s for s in SESSIONS if ring.node_for(s) != before[s]]
+
+        # Ideal is 1/5 of keys, all moving to the new node
+        assert len(moved) < len(SESSIONS) * 0.3
+        assert {ring.node_for(s) for s in moved} == {"http://127.0.0.1:8004"}
+
+
+class TestShardRouter:
+    """Test ownership checks and rebalancing"""
+
+    def test_single_worker_owns_everything(self):
+        router = ShardRouter(self_url=WORKERS[0], worker_urls=WORKERS[:1])
+        assert not router.enabled
+        assert all(router.is_local(s) for s in SESSIONS[:50])
+
+    def test_rebalance_reports_moved_sessions(self):
+        router = ShardRouter(self_url=WORKERS[0], worker_urls=WORKERS[:2])
+        local = [s for s in SESSIONS if router.is_local(s)]
+
+        moved = router.rebalance(WORKERS, local)
+
+        assert moved
+        assert all(not router.is_local(s) for s in moved)
+        assert all(router.is_local(s) for s in set(local) - set(moved))
+        assert router.websocket_url(moved[0], "/api/agent/stream").startswith("ws://127.0.0.1:")
+
+    def test_secret_required_for_trust(self):
+        open_router = ShardRouter(self_url=WORKERS[0], worker_urls=WORKERS)
+        assert not open_router.is_trusted({CLUSTER_SECRET_HEADER: ""})
+
+        router = ShardRouter(self_url=WORKERS[0], worker_urls=WORKERS, secret="s3cret")
+        assert router.is_trusted({CLUSTER_SECRET_HEADER: "s3cret"})
+        assert not router.is_trusted({CLUSTER_SECRET_HEADER: "guess"})
+        assert not router.is_trusted({})
+
+    def test_worker_hosts_allowlisted(self):
+        router = ShardRouter(
+            self_url=WORKERS[0],
+            worker_urls=WORKERS,
+            allowed_hosts=["10.0.0.7"]
+        )
+        router.check_workers(["http://127.0.0.1:9000", "https://10.0.0.7:8000"])
+        for url in ["http://attacker.example:8000", "file:///etc/passwd"]:
+            with pytest.raises(ValueError):
+                router.check_workers([url])
+
+
+def make_request(request: httpx.Request) -> Request:
+    scope = {
+        "type": "http",
+        "method": request.method,
+        "path": request.url.path,
+        "query_string": request.url.query,
+        "headers": [(k.encode(), v.encode()) for k, v in request.headers.items()],
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": request.content, "more_body": False}
+
+    return Request(scope, receive)
+
+
+class TestForwardingLoops:
+    """Test that workers with different rings do not forward forever"""
+
+    def mismatched_session(self, first, second):
+        # A session each worker thinks the other one owns
+        return next(
+            s for s in SESSIONS
+            if not first.is_local(s) and first.owner(s) == second.self_url
+            and second.owner(s) == first.self_url
+        )
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("secret", ["", "s3cret"])
+    async def test_mismatched_rings_stop_forwarding(self, secret):
+        first = ShardRouter(self_url=WORKERS[0], worker_urls=WORKERS[:2], secret=secret)
+        # The second worker has already moved on to a different worker set
+        second = ShardRouter(
+            self_url=WORKERS[1], worker_urls=[WORKERS[0], WORKERS[2]], secret=secret
+        )
+        routers = {r.self_url: r for r in (first, second)}
+        hops = []
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            router = routers[f"http://{request.url.host}:{request.url.port}"]
+            hops.append(router.self_url)
+            assert len(hops) < 5, "forwarding loop"
+            response = await router.route(make_request(request), session_id)
+            if response is None:
+                return httpx.Response(200, text=router.self_url)
+            return httpx.Response(response.status_code, content=response.body)
+
+        for router in routers.values():
+            router._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        session_id = self.mismatched_session(first, second)
+
+        response = await first._client.post(f"{WORKERS[0]}/api/agent/quick")
+
+        assert response.status_code == 200
+        if secret:
+            assert hops == [WORKERS[0], WORKERS[1]]
+        else:
+            assert hops == [WORKERS[0], WORKERS[1], WORKERS[0]]
+            assert first.loops == 1
@@ -0,0 +1,42 @@
+"""
+Tests for the streaming WebSocket endpoint
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from schemas.responses import AgentMessage, MessageType
+
+
+class EchoOrchestrator:
+    async def handle_query(self, query, context, require_high_quality=False):
+        yield AgentMessage(type=MessageType.THINKING, content=f"answer {query}")
+
+
+def send_query(monkeypatch, **fields):
+    monkeypatch.setattr(main, "get_orchestrator", lambda api_key=None: EchoOrchestrator())
+    with TestClient(main.app).websocket_connect("/api/agent/stream") as ws:
+        ws.send_json({
+            "type": "query",
+            "query": "q",
+            "context": {"notebook_id": "nb", "session_id": "ws"},
+            **fields,
+        })
+        return ws.receive_json()
+
+
+class TestStreamValidation:
+    """Test that WebSocket queries are validated like HTTP requests"""
+
+    @pytest.mark.parametrize("timeout", ["soon", -1, 0])
+    def test_invalid_timeout_rejected(self, monkeypatch, timeout):
+        message = send_query(monkeypatch, timeout_seconds=timeout)
+
+        assert message["type"] == "error"
+        assert "timeout_seconds" in message["content"]["error"]
+
+    def test_valid_timeout_accepted(self, monkeypatch):
+        message = send_query(monkeypatch, timeout_seconds=5)
+
+        assert message == {"type": "thinking", "content": "answer q", "metadata": {}}